@@ -1,12 +1,12 @@
 from datetime import timedelta
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
-from app.crud.user import create_user, authenticate_user, get_user_by_email
+from app.crud.user import create_user_async, authenticate_user_async, get_user_by_email_async, get_token_version_async
 from app.schemas.user import UserCreate, User, Token
-from app.core.security import create_access_token
+from app.core.security import create_access_token, build_user_claims
 from app.core.config import settings
 from app.api.deps import get_current_active_user
-from app.core.supabase import get_supabase
+from app.core.supabase import get_async_supabase
 from pydantic import BaseModel
 import logging
 
@@ -16,17 +16,22 @@ logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+async def user_claims(user) -> dict:
+    """Claims del token; en modo stateless incluyen la versión de token guardada del usuario"""
+    token_version = await get_token_version_async(str(user.id)) if settings.stateless_auth else None
+    return build_user_claims(user, token_version)
+
 class ResendConfirmationRequest(BaseModel):
     email: str
 
 @router.post("/register", response_model=Token)
-def register(user: UserCreate):
+async def register(user: UserCreate):
     """Registra un nuevo usuario"""
     try:
         logger.info(f"Intentando registrar usuario: {user.email}")
         
         # Verificar si el usuario ya existe
-        db_user = get_user_by_email(email=user.email)
+        db_user = await get_user_by_email_async(email=user.email)
         if db_user:
             logger.warning(f"Usuario ya existe: {user.email}")
             raise HTTPException(
@@ -36,7 +41,7 @@ def register(user: UserCreate):
         
         # Crear el usuario
         logger.info(f"Creando usuario en Supabase: {user.email}")
-        db_user = create_user(user=user)
+        db_user = await create_user_async(user=user)
         
         if not db_user:
             logger.error(f"Error al crear usuario: {user.email}")
@@ -50,7 +55,7 @@ def register(user: UserCreate):
         # Crear token de acceso
         access_token_expires = timedelta(minutes=settings.access_token_expire_minutes)
         access_token = create_access_token(
-            data={"sub": db_user.email}, expires_delta=access_token_expires
+            data=await user_claims(db_user), expires_delta=access_token_expires
         )
         
         return {
@@ -70,11 +75,11 @@ def register(user: UserCreate):
         )
 
 @router.post("/login", response_model=Token)
-def login(form_data: OAuth2PasswordRequestForm = Depends()):
+async def login(form_data: OAuth2PasswordRequestForm = Depends()):
     """Inicia sesión de un usuario"""
     try:
         # Autenticar usuario
-        user = authenticate_user(form_data.username, form_data.password)
+        user = await authenticate_user_async(form_data.username, form_data.password)
         if not user:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
@@ -85,7 +90,7 @@ def login(form_data: OAuth2PasswordRequestForm = Depends()):
         # Crear token de acceso
         access_token_expires = timedelta(minutes=settings.access_token_expire_minutes)
         access_token = create_access_token(
-            data={"sub": user.email}, expires_delta=access_token_expires
+            data=await user_claims(user), expires_delta=access_token_expires
         )
         
         return {
@@ -103,13 +108,13 @@ def login(form_data: OAuth2PasswordRequestForm = Depends()):
         )
 
 @router.post("/resend-confirmation")
-def resend_confirmation(request: ResendConfirmationRequest):
+async def resend_confirmation(request: ResendConfirmationRequest):
     """Reenvía el email de confirmación"""
     try:
-        supabase = get_supabase()
+        supabase = get_async_supabase()
         
         # Verificar si el usuario existe
-        db_user = get_user_by_email(email=request.email)
+        db_user = await get_user_by_email_async(email=request.email)
         if not db_user:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -117,7 +122,7 @@ def resend_confirmation(request: ResendConfirmationRequest):
             )
         
         # Reenviar email de confirmación usando el método correcto
-        response = supabase.auth.resend({"type": "signup", "email": request.email})
+        response = await supabase.auth.resend({"type": "signup", "email": request.email})
         
         logger.info(f"Email de confirmación reenviado a: {request.email}")
         
@@ -136,6 +141,6 @@ def resend_confirmation(request: ResendConfirmationRequest):
         )
 
 @router.get("/me", response_model=User)
-def read_users_me(current_user: User = Depends(get_current_active_user)):
+async def read_users_me(current_user: User = Depends(get_current_active_user)):
     """Obtiene información del usuario actual"""
     return current_user 
\ No newline at end of file
@@ -1,21 +1,76 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+import asyncio
+import logging
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
 from app.api.deps import get_current_active_user
 from app.schemas.user import User
-from app.core.supabase import get_supabase
-from typing import Any, List
-from app.schemas.subject import Subject, SubjectCreate, SubjectUpdate
+from app.core.config import settings
+from app.core.supabase import get_async_supabase
+from app.core.http_cache import etag_matches, not_modified, check_not_modified, set_cache_headers, table_versions
+from app.core.responses import fast_json
+from app.services.dashboard_cache import get_cached_summary, store_summary, serialize_summary
+from app.services.reference_data import reference_data
+from app.services.catalog import catalog
+from app.services.curriculum import curriculum
+from app.services.achievements import compile_criteria
+from app.services.user_stats import user_stats
+from typing import Any, List, Optional, Tuple
+from app.schemas.subject import Subject, SubjectCreate, SubjectNode, SubjectUpdate
 from app.schemas.topic import Topic, TopicCreate, TopicUpdate
 from app.schemas.achievement import Achievement, AchievementCreate, AchievementUpdate
 from uuid import UUID
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter()
 
+# El resumen es privado y debe revalidarse siempre (barato gracias al ETag)
+SUMMARY_CACHE_CONTROL = "private, no-cache"
+
+async def _fetch_partial(name: str, query: Any, timeout: float) -> Tuple[bool, Optional[Any]]:
+    """Ejecuta una sub-consulta del dashboard con timeout; devuelve (ok, respuesta)"""
+    try:
+        return True, await asyncio.wait_for(query.execute(), timeout=timeout)
+    except asyncio.TimeoutError:
+        logger.warning(f"Timeout en la consulta '{name}' del dashboard")
+    except Exception as e:
+        logger.error(f"Error en la consulta '{name}' del dashboard: {e}")
+    return False, None
+
+def _subject_name(subject_id: str) -> str:
+    subject = reference_data.get('subjects', subject_id) if reference_data.loaded else None
+    return (subject or {}).get('name') or subject_id
+
 @router.get("/summary")
-def get_dashboard_summary(current_user: User = Depends(get_current_active_user)) -> Any:
+async def get_dashboard_summary(request: Request, current_user: User = Depends(get_current_active_user)) -> Any:
     """
     Devuelve un resumen personalizado para el dashboard del usuario autenticado (alumno o profesor).
+    El resumen se cachea por usuario y se expone con ETag para poder revalidarlo con If-None-Match.
     """
-    supabase = get_supabase()
+    user_id = str(current_user.id)
+    cached = get_cached_summary(user_id)
+    if cached is None:
+        summary = await build_dashboard_summary(current_user)
+        # Los resúmenes parciales no se cachean
+        if summary["incomplete"]:
+            cached = serialize_summary(summary)
+        else:
+            cached = store_summary(user_id, summary)
+
+    if etag_matches(request.headers.get("if-none-match"), cached.etag):
+        return not_modified(cached.etag, SUMMARY_CACHE_CONTROL)
+    return Response(
+        content=cached.body,
+        media_type="application/json",
+        headers={"ETag": cached.etag, "Cache-Control": SUMMARY_CACHE_CONTROL},
+    )
+
+async def build_dashboard_summary(current_user: User) -> dict:
+    """
+    Construye el resumen del dashboard consultando Supabase.
+    Las consultas se lanzan en paralelo; si alguna falla o supera el timeout se devuelve
+    un resumen parcial y la sección aparece en `incomplete`.
+    """
+    supabase = get_async_supabase()
     user_id = str(current_user.id)
     role = current_user.role
     summary = {
@@ -29,17 +84,38 @@ def get_dashboard_summary(current_user: User = Depends(get_current_active_user))
         "achievements": [],
         "recent_activity": [],
         "stats": {},
+        "incomplete": [],
+    }
+
+    queries = {
+        # Logros recientes
+        "achievements": supabase.table('user_achievements').select('*,achievement_id(*,name,description,icon)').eq('user_id', user_id).order('unlocked_at', desc=True).limit(5),
+        # Actividad reciente (últimos ejercicios respondidos)
+        "recent_activity": supabase.table('user_progress').select('*,exercise_id(title,subject_id)').eq('user_id', user_id).order('completed_at', desc=True).limit(5),
     }
+    # Si es profesor, ejercicios creados
+    if role == 'teacher':
+        queries["created_exercises"] = supabase.table('exercises').select('id').eq('created_by', user_id)
 
-    # Progreso general y por materia
-    stats_resp = supabase.table('user_stats').select('*').eq('user_id', user_id).maybe_single().execute()
-    if stats_resp and stats_resp.data:
-        summary["stats"] = stats_resp.data
+    timeout = settings.dashboard_query_timeout_seconds
+    # Progreso general y por materia: agregados en memoria (una lectura de user_stats por usuario)
+    stats_result, *results = await asyncio.gather(
+        asyncio.wait_for(user_stats.get(user_id), timeout=timeout),
+        *(_fetch_partial(name, query, timeout) for name, query in queries.items()),
+        return_exceptions=True,
+    )
+    responses = {name: resp for name, (_, resp) in zip(queries, results)}
+    summary["incomplete"] = [name for name, (ok, _) in zip(queries, results) if not ok]
+
+    stats = None
+    if isinstance(stats_result, Exception):
+        logger.error(f"Error obteniendo las estadísticas del dashboard: {stats_result!r}")
+        summary["incomplete"].insert(0, "stats")
     else:
-        summary["stats"] = {}
+        stats = stats_result
+        summary["stats"] = stats.summary()
 
-    # Logros recientes
-    achievements_resp = supabase.table('user_achievements').select('*,achievement_id(*,name,description,icon)').eq('user_id', user_id).order('unlocked_at', desc=True).limit(5).execute()
+    achievements_resp = responses["achievements"]
     if achievements_resp and achievements_resp.data:
         summary["achievements"] = [
             {
@@ -51,8 +127,7 @@ def get_dashboard_summary(current_user: User = Depends(get_current_active_user))
             for a in achievements_resp.data
         ]
 
-    # Actividad reciente (últimos ejercicios respondidos)
-    activity_resp = supabase.table('user_progress').select('*,exercise_id(title,subject_id)').eq('user_id', user_id).order('completed_at', desc=True).limit(5).execute()
+    activity_resp = responses["recent_activity"]
     if activity_resp and activity_resp.data:
         summary["recent_activity"] = [
             {
@@ -66,131 +141,203 @@ def get_dashboard_summary(current_user: User = Depends(get_current_active_user))
             for a in activity_resp.data
         ]
 
-    # Progreso general (puedes calcularlo aquí o en el frontend)
-    if summary["stats"]:
-        total = summary["stats"].get("total_exercises", 0)
-        completed = summary["stats"].get("completed_exercises", 0)
+    # Progreso general y por materia: ejercicios resueltos sobre las respuestas enviadas
+    if stats is not None and stats.totals.attempts:
         summary["progress"] = {
-            "general": int((completed / total) * 100) if total else 0,
+            "general": stats.totals.accuracy,
             "by_subject": {
-                # Aquí podrías agregar lógica para progreso por materia
+                _subject_name(subject_id): counters.accuracy for subject_id, counters in stats.by_subject.items()
             }
         }
 
-    # Si es profesor, puedes agregar más datos (ejercicios creados, estudiantes activos, etc.)
     if role == 'teacher':
-        # Ejercicios creados
-        created_resp = supabase.table('exercises').select('id').eq('created_by', user_id).execute()
+        created_resp = responses["created_exercises"]
         summary["created_exercises"] = len(created_resp.data) if created_resp and created_resp.data else 0
         # Estudiantes activos (ejemplo: usuarios con progreso en ejercicios creados por este profesor)
         # ... lógica adicional ...
 
     return summary 
 
+async def reference_rows(table: str) -> List[dict]:
+    """Filas de una tabla de referencia desde la foto en memoria (o la BD si aún no se ha cargado)"""
+    if reference_data.loaded:
+        return list(reference_data.list(table))
+    supabase = get_async_supabase()
+    resp = await supabase.table(table).select('*').execute()
+    return resp.data or []
+
+async def reference_row(table: str, item_id: UUID) -> Optional[dict]:
+    """Fila por id desde la foto en memoria; si no está se consulta la BD"""
+    if reference_data.loaded:
+        row = reference_data.get(table, item_id)
+        if row is not None:
+            return row
+    supabase = get_async_supabase()
+    resp = await supabase.table(table).select('*').eq('id', str(item_id)).maybe_single().execute()
+    return resp.data if resp else None
+
+# CURRICULUM
+@router.get('/curriculum', response_model=List[SubjectNode])
+async def get_curriculum(request: Request, response: Response) -> Any:
+    """
+    Árbol completo materia → tema con el número de ejercicios de cada nodo
+    desglosado por dificultad y tipo. Sustituye las llamadas separadas a
+    materias, temas y ejercicios.
+    """
+    if not (catalog.loaded and reference_data.loaded):
+        raise HTTPException(status_code=503, detail='El catálogo aún se está cargando')
+    etag, cached = check_not_modified(
+        request, 'exercises', table_versions.get('subjects'), table_versions.get('topics')
+    )
+    if cached:
+        return cached
+    result = fast_json(curriculum.get())
+    set_cache_headers(result if isinstance(result, Response) else response, etag)
+    return result
+
 # SUBJECT ENDPOINTS
 @router.get('/subjects', response_model=List[Subject])
-def get_subjects() -> Any:
-    supabase = get_supabase()
-    resp = supabase.table('subjects').select('*').execute()
-    return resp.data or []
+async def get_subjects(request: Request, response: Response) -> Any:
+    etag, cached = check_not_modified(request, 'subjects')
+    if cached:
+        return cached
+    result = fast_json(await reference_rows('subjects'))
+    set_cache_headers(result if isinstance(result, Response) else response, etag)
+    return result
 
 @router.get('/subjects/{subject_id}', response_model=Subject)
-def get_subject(subject_id: UUID) -> Any:
-    supabase = get_supabase()
-    resp = supabase.table('subjects').select('*').eq('id', str(subject_id)).maybe_single().execute()
-    if not resp.data:
+async def get_subject(subject_id: UUID) -> Any:
+    row = await reference_row('subjects', subject_id)
+    if not row:
         raise HTTPException(status_code=404, detail='Subject not found')
-    return resp.data
+    return row
 
 @router.post('/subjects', response_model=Subject, status_code=status.HTTP_201_CREATED)
-def create_subject(subject: SubjectCreate) -> Any:
-    supabase = get_supabase()
-    resp = supabase.table('subjects').insert(subject.dict()).single().execute()
+async def create_subject(subject: SubjectCreate) -> Any:
+    supabase = get_async_supabase()
+    resp = await supabase.table('subjects').insert(subject.dict()).single().execute()
+    table_versions.bump('subjects')
+    await reference_data.reload('subjects')
     return resp.data
 
 @router.put('/subjects/{subject_id}', response_model=Subject)
-def update_subject(subject_id: UUID, subject: SubjectUpdate) -> Any:
-    supabase = get_supabase()
-    resp = supabase.table('subjects').update(subject.dict(exclude_unset=True)).eq('id', str(subject_id)).single().execute()
+async def update_subject(subject_id: UUID, subject: SubjectUpdate) -> Any:
+    supabase = get_async_supabase()
+    resp = await supabase.table('subjects').update(subject.dict(exclude_unset=True)).eq('id', str(subject_id)).single().execute()
+    table_versions.bump('subjects')
+    await reference_data.reload('subjects')
     if not resp.data:
         raise HTTPException(status_code=404, detail='Subject not found')
     return resp.data
 
 @router.delete('/subjects/{subject_id}', status_code=status.HTTP_204_NO_CONTENT)
-def delete_subject(subject_id: UUID) -> None:
-    supabase = get_supabase()
-    resp = supabase.table('subjects').delete().eq('id', str(subject_id)).execute()
+async def delete_subject(subject_id: UUID) -> None:
+    supabase = get_async_supabase()
+    resp = await supabase.table('subjects').delete().eq('id', str(subject_id)).execute()
+    table_versions.bump('subjects')
+    await reference_data.reload('subjects')
     if resp.status_code == 404:
         raise HTTPException(status_code=404, detail='Subject not found')
 
 # TOPIC ENDPOINTS
 @router.get('/topics', response_model=List[Topic])
-def get_topics() -> Any:
-    supabase = get_supabase()
-    resp = supabase.table('topics').select('*').execute()
-    return resp.data or []
+async def get_topics(request: Request, response: Response, subject_id: Optional[UUID] = None) -> Any:
+    etag, cached = check_not_modified(request, 'topics')
+    if cached:
+        return cached
+    if subject_id and reference_data.loaded:
+        rows = list(reference_data.topics_for_subject(subject_id))
+    else:
+        rows = await reference_rows('topics')
+        if subject_id:
+            rows = [row for row in rows if str(row.get('subject_id')) == str(subject_id)]
+    result = fast_json(rows)
+    set_cache_headers(result if isinstance(result, Response) else response, etag)
+    return result
 
 @router.get('/topics/{topic_id}', response_model=Topic)
-def get_topic(topic_id: UUID) -> Any:
-    supabase = get_supabase()
-    resp = supabase.table('topics').select('*').eq('id', str(topic_id)).maybe_single().execute()
-    if not resp.data:
+async def get_topic(topic_id: UUID) -> Any:
+    row = await reference_row('topics', topic_id)
+    if not row:
         raise HTTPException(status_code=404, detail='Topic not found')
-    return resp.data
+    return row
 
 @router.post('/topics', response_model=Topic, status_code=status.HTTP_201_CREATED)
-def create_topic(topic: TopicCreate) -> Any:
-    supabase = get_supabase()
-    resp = supabase.table('topics').insert(topic.dict()).single().execute()
+async def create_topic(topic: TopicCreate) -> Any:
+    supabase = get_async_supabase()
+    resp = await supabase.table('topics').insert(topic.dict()).single().execute()
+    table_versions.bump('topics')
+    await reference_data.reload('topics')
     return resp.data
 
 @router.put('/topics/{topic_id}', response_model=Topic)
-def update_topic(topic_id: UUID, topic: TopicUpdate) -> Any:
-    supabase = get_supabase()
-    resp = supabase.table('topics').update(topic.dict(exclude_unset=True)).eq('id', str(topic_id)).single().execute()
+async def update_topic(topic_id: UUID, topic: TopicUpdate) -> Any:
+    supabase = get_async_supabase()
+    resp = await supabase.table('topics').update(topic.dict(exclude_unset=True)).eq('id', str(topic_id)).single().execute()
+    table_versions.bump('topics')
+    await reference_data.reload('topics')
     if not resp.data:
         raise HTTPException(status_code=404, detail='Topic not found')
     return resp.data
 
 @router.delete('/topics/{topic_id}', status_code=status.HTTP_204_NO_CONTENT)
-def delete_topic(topic_id: UUID) -> None:
-    supabase = get_supabase()
-    resp = supabase.table('topics').delete().eq('id', str(topic_id)).execute()
+async def delete_topic(topic_id: UUID) -> None:
+    supabase = get_async_supabase()
+    resp = await supabase.table('topics').delete().eq('id', str(topic_id)).execute()
+    table_versions.bump('topics')
+    await reference_data.reload('topics')
     if resp.status_code == 404:
         raise HTTPException(status_code=404, detail='Topic not found')
 
 # ACHIEVEMENT ENDPOINTS
+def validate_criteria(criteria: Any) -> None:
+    """Rechaza criterios que el motor de logros no sabría evaluar"""
+    try:
+        compile_criteria(criteria)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Criterio no válido: {e}")
+
 @router.get('/achievements', response_model=List[Achievement])
-def get_achievements() -> Any:
-    supabase = get_supabase()
-    resp = supabase.table('achievements').select('*').execute()
-    return resp.data or []
+async def get_achievements(request: Request, response: Response) -> Any:
+    etag, cached = check_not_modified(request, 'achievements')
+    if cached:
+        return cached
+    result = fast_json(await reference_rows('achievements'))
+    set_cache_headers(result if isinstance(result, Response) else response, etag)
+    return result
 
 @router.get('/achievements/{achievement_id}', response_model=Achievement)
-def get_achievement(achievement_id: UUID) -> Any:
-    supabase = get_supabase()
-    resp = supabase.table('achievements').select('*').eq('id', str(achievement_id)).maybe_single().execute()
-    if not resp.data:
+async def get_achievement(achievement_id: UUID) -> Any:
+    row = await reference_row('achievements', achievement_id)
+    if not row:
         raise HTTPException(status_code=404, detail='Achievement not found')
-    return resp.data
+    return row
 
 @router.post('/achievements', response_model=Achievement, status_code=status.HTTP_201_CREATED)
-def create_achievement(achievement: AchievementCreate) -> Any:
-    supabase = get_supabase()
-    resp = supabase.table('achievements').insert(achievement.dict()).single().execute()
+async def create_achievement(achievement: AchievementCreate) -> Any:
+    validate_criteria(achievement.criteria)
+    supabase = get_async_supabase()
+    resp = await supabase.table('achievements').insert(achievement.dict()).single().execute()
+    table_versions.bump('achievements')
+    await reference_data.reload('achievements')
     return resp.data
 
 @router.put('/achievements/{achievement_id}', response_model=Achievement)
-def update_achievement(achievement_id: UUID, achievement: AchievementUpdate) -> Any:
-    supabase = get_supabase()
-    resp = supabase.table('achievements').update(achievement.dict(exclude_unset=True)).eq('id', str(achievement_id)).single().execute()
+async def update_achievement(achievement_id: UUID, achievement: AchievementUpdate) -> Any:
+    validate_criteria(achievement.criteria)
+    supabase = get_async_supabase()
+    resp = await supabase.table('achievements').update(achievement.dict(exclude_unset=True)).eq('id', str(achievement_id)).single().execute()
+    table_versions.bump('achievements')
+    await reference_data.reload('achievements')
     if not resp.data:
         raise HTTPException(status_code=404, detail='Achievement not found')
     return resp.data
 
 @router.delete('/achievements/{achievement_id}', status_code=status.HTTP_204_NO_CONTENT)
-def delete_achievement(achievement_id: UUID) -> None:
-    supabase = get_supabase()
-    resp = supabase.table('achievements').delete().eq('id', str(achievement_id)).execute()
+async def delete_achievement(achievement_id: UUID) -> None:
+    supabase = get_async_supabase()
+    resp = await supabase.table('achievements').delete().eq('id', str(achievement_id)).execute()
+    table_versions.bump('achievements')
+    await reference_data.reload('achievements')
     if resp.status_code == 404:
         raise HTTPException(status_code=404, detail='Achievement not found') 
\ No newline at end of file
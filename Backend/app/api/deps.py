@@ -1,37 +1,70 @@
+from typing import Optional
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from app.crud.user import get_user_by_email
-from app.core.security import verify_token
-from app.schemas.user import TokenData
+from app.crud.user import get_cached_user_by_email_async, get_token_version_async
+from app.core.config import settings
+from app.core.security import verify_token, TOKEN_CLAIMS_VERSION
+from app.schemas.user import TokenData, User
 
 security = HTTPBearer()
 
-def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+async def user_from_claims(payload: dict) -> Optional[User]:
+    """
+    Construye el usuario directamente desde los claims del token (modo stateless).
+    Devuelve None si el token no trae claims válidos o están desactualizados respecto
+    a la versión guardada en `users.token_version`.
+    """
+    if payload.get("cv") != TOKEN_CLAIMS_VERSION:
+        return None
+    user_id = payload.get("uid")
+    if not user_id:
+        return None
+    version = await get_token_version_async(user_id)
+    if version is None or payload.get("uv") != version:
+        return None
+    try:
+        return User(
+            id=user_id,
+            email=payload.get("sub"),
+            name=payload.get("name"),
+            role=payload.get("role"),
+            avatar_url=payload.get("avatar_url"),
+        )
+    except Exception:
+        return None
+
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
     """Obtiene el usuario actual basado en el token JWT"""
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="No se pudieron validar las credenciales",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    
+
     token = credentials.credentials
     payload = verify_token(token)
     if payload is None:
         raise credentials_exception
-    
+
     email: str = payload.get("sub")
     if email is None:
         raise credentials_exception
-    
+
+    # En modo stateless se evita la consulta a la BD si los claims siguen vigentes
+    if settings.stateless_auth:
+        user = await user_from_claims(payload)
+        if user is not None:
+            return user
+
     token_data = TokenData(email=email)
-    user = get_user_by_email(email=token_data.email)
+    user = await get_cached_user_by_email_async(email=token_data.email)
     if user is None:
         raise credentials_exception
-    
+
     return user
 
-def get_current_active_user(current_user = Depends(get_current_user)):
+async def get_current_active_user(current_user = Depends(get_current_user)):
     """Obtiene el usuario actual activo"""
     # En Supabase, los usuarios están activos por defecto
     # Puedes agregar lógica adicional aquí si necesitas verificar estado
-    return current_user 
\ No newline at end of file
+    return current_user
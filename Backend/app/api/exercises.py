@@ -1,66 +1,250 @@
-from fastapi import APIRouter, HTTPException, Depends, status, Body
-from typing import List, Optional, Union
+from fastapi import APIRouter, HTTPException, Depends, status, Body, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from typing import List, Literal, Optional, Union
 from uuid import UUID
-from app.schemas.exercise import Exercise, ExerciseCreate, ExerciseUpdate
+from app.schemas.exercise import (
+    Exercise, ExerciseCreate, ExerciseUpdate, ExerciseImportReport, ExerciseSummary,
+    ExerciseSearchHit, ExerciseDifficulty, PracticeSession, PracticeSessionCreate
+)
 from app.crud.exercise import (
-    create_exercise, get_exercises, get_exercise_by_id, update_exercise, delete_exercise
+    create_exercise_async, get_exercises_async, get_exercises_page_async, get_exercise_rows_async,
+    get_exercise_by_id_async, update_exercise_async, delete_exercise_async,
+    iter_exercise_rows_async, TABLE_NAME
 )
 from app.api.deps import get_current_active_user
 from app.schemas.user import User
+from app.services.catalog import catalog
+from app.services.search import search_index
+from app.services.dedup import duplicate_index
+from app.services import sessions
+from app.services.progress_sets import progress_sets
+from app.services.adaptive import sample_adaptive
+from app.services.review import review_scheduler
+from app.services.export import ndjson_chunks, csv_chunks, gzip_chunks
+from app.services.importer import iter_import_records, import_exercises
+from app.core.config import settings
+from app.core.pagination import Page
+from app.core.http_cache import check_not_modified, set_cache_headers
+from app.core.responses import FastJSONResponse
 import random
 
 router = APIRouter()
 
 @router.post("/", response_model=Exercise, status_code=status.HTTP_201_CREATED)
-def create_new_exercise(
+async def create_new_exercise(
     exercise: ExerciseCreate,
+    response: Response,
     current_user: User = Depends(get_current_active_user)
 ):
-    created = create_exercise(exercise, created_by=current_user.id)
+    """
+    Crea un ejercicio. Si se parece mucho a otros del catálogo (mismo enunciado y
+    opciones con cambios menores), sus ids se devuelven en X-Duplicate-Candidates.
+    """
+    created = await create_exercise_async(exercise, created_by=current_user.id)
     if not created:
         raise HTTPException(status_code=400, detail="No se pudo crear el ejercicio")
+    duplicates = duplicate_index.find_duplicates(created.id, created.content, created.options)
+    if duplicates:
+        response.headers["X-Duplicate-Candidates"] = ",".join(match.exercise_id for match in duplicates)
     return created
 
+@router.post("/import", response_model=ExerciseImportReport)
+async def import_exercises_endpoint(
+    request: Request,
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    Importa ejercicios en bloque desde un array JSON o NDJSON (application/x-ndjson, en streaming).
+    Devuelve un informe por fila con el estado de cada ejercicio.
+    """
+    try:
+        return await import_exercises(iter_import_records(request), created_by=current_user.id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def parse_fields(fields: str) -> List[str]:
+    """Convierte el parámetro `fields` en la lista de columnas a seleccionar"""
+    if fields == 'summary':
+        return list(ExerciseSummary.__fields__)
+    columns = [f.strip() for f in fields.split(',') if f.strip()]
+    unknown = [c for c in columns if c not in Exercise.__fields__]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Campos no válidos: {', '.join(unknown)}")
+    return ['id'] + [c for c in columns if c != 'id']
+
+def set_page_headers(response: Response, page: Page) -> None:
+    if page.next_cursor:
+        response.headers["X-Next-Cursor"] = page.next_cursor
+    if page.total is not None:
+        response.headers["X-Total-Count"] = str(page.total)
+
 @router.get("/", response_model=List[Exercise])
-def list_exercises(skip: int = 0, limit: int = 100):
-    return get_exercises(skip=skip, limit=limit)
+async def list_exercises(
+    request: Request,
+    response: Response,
+    skip: int = 0,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    include_total: bool = False,
+    fields: Optional[str] = None,
+):
+    """
+    Lista ejercicios ordenados por (created_at, id).
+    Con `cursor` (vacío para la primera página) se usa paginación por cursor y se ignora `skip`;
+    el token de la siguiente página va en la cabecera X-Next-Cursor y, si se pide
+    `include_total`, el total estimado en X-Total-Count.
+    Con `fields=summary` se devuelve la proyección ExerciseSummary, y con `fields=a,b,c`
+    solo esas columnas (más `id`); la proyección se hace en la propia consulta a Supabase.
+    Con FAST_JSON_RESPONSES las filas se serializan directamente sin construir modelos.
+    La respuesta lleva un ETag derivado de la versión de la tabla: con If-None-Match
+    se responde 304 sin consultar la BD. Las listas vacías no llevan ETag, porque el
+    CRUD también devuelve una lista vacía cuando falla la consulta.
+    """
+    etag, cached = check_not_modified(request, TABLE_NAME)
+    if cached:
+        return cached
+
+    # Proyecciones y modo rápido: filas crudas de la BD serializadas sin construir modelos.
+    # Sin `fields` se piden las columnas del modelo Exercise: nunca se envía la fila entera
+    if fields or settings.fast_json_responses:
+        columns = parse_fields(fields) if fields else list(Exercise.__fields__)
+        try:
+            page = await get_exercise_rows_async(
+                cursor=cursor, skip=skip, limit=limit, columns=columns, include_total=include_total
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        items = [ExerciseSummary(**row) for row in page.items] if fields == 'summary' else page.items
+        result = FastJSONResponse(items)
+        set_page_headers(result, page)
+        if items:
+            set_cache_headers(result, etag)
+        return result
+
+    if cursor is None:
+        exercises = await get_exercises_async(skip=skip, limit=limit)
+    else:
+        try:
+            page = await get_exercises_page_async(cursor=cursor, limit=limit, include_total=include_total)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        set_page_headers(response, page)
+        exercises = page.items
+    if exercises:
+        set_cache_headers(response, etag)
+    return exercises
+
+@router.get("/export")
+async def export_exercises(
+    format: Literal['ndjson', 'csv'] = 'ndjson',
+    gzip: bool = False,
+    subject_id: Optional[UUID] = None,
+    topic_id: Optional[UUID] = None,
+    difficulty: Optional[Literal['easy', 'medium', 'hard']] = None,
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    Exporta el catálogo de ejercicios en streaming (NDJSON o CSV, opcionalmente gzip).
+    Las páginas se leen con cursor en el servidor, así que la memoria usada es constante.
+    """
+    pages = iter_exercise_rows_async(
+        page_size=settings.export_page_size,
+        subject_id=subject_id,
+        topic_id=topic_id,
+        difficulty=difficulty,
+    )
+    if format == 'csv':
+        chunks, media_type = csv_chunks(pages), "text/csv"
+    else:
+        chunks, media_type = ndjson_chunks(pages), "application/x-ndjson"
+    filename = f"exercises.{format}"
+    if gzip:
+        chunks, media_type, filename = gzip_chunks(chunks), "application/gzip", filename + ".gz"
+    return StreamingResponse(
+        chunks,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+@router.get("/search", response_model=List[ExerciseSearchHit])
+async def search_exercises(
+    request: Request,
+    response: Response,
+    q: str = Query(..., min_length=1, max_length=200),
+    subject_id: Optional[UUID] = None,
+    topic_id: Optional[UUID] = None,
+    difficulty: Optional[ExerciseDifficulty] = None,
+    limit: int = Query(20, ge=1, le=100),
+):
+    """
+    Búsqueda de texto completo sobre título, descripción y enunciado, ordenada por BM25.
+    No distingue tildes ni mayúsculas, ignora palabras vacías y agrupa plurales y género;
+    un término terminado en '*' se busca por prefijo (p. ej. `ecuac*`).
+    Se resuelve en memoria, sin consultar la BD.
+    """
+    if not search_index.loaded:
+        raise HTTPException(status_code=503, detail="El índice de búsqueda aún se está cargando")
+    etag, cached = check_not_modified(request, TABLE_NAME)
+    if cached:
+        return cached
+    hits = search_index.search(q, subject_id=subject_id, topic_id=topic_id, difficulty=difficulty, limit=limit)
+    results = []
+    for hit in hits:
+        exercise = catalog.get(hit.exercise_id)
+        if exercise is not None:
+            results.append(ExerciseSearchHit(
+                **exercise.dict(include=set(ExerciseSummary.__fields__)),
+                score=round(hit.score, 4),
+            ))
+    set_cache_headers(response, etag)
+    return results
 
 @router.get("/{exercise_id}", response_model=Exercise)
-def get_exercise(exercise_id: UUID):
-    exercise = get_exercise_by_id(exercise_id)
+async def get_exercise(exercise_id: UUID, request: Request, response: Response):
+    etag, cached = check_not_modified(request, TABLE_NAME)
+    if cached:
+        return cached
+    exercise = await get_exercise_by_id_async(exercise_id)
     if not exercise:
         raise HTTPException(status_code=404, detail="Ejercicio no encontrado")
+    set_cache_headers(response, etag)
     return exercise
 
 @router.put("/{exercise_id}", response_model=Exercise)
-def update_exercise_endpoint(
+async def update_exercise_endpoint(
     exercise_id: UUID,
     exercise_update: ExerciseUpdate,
     current_user: User = Depends(get_current_active_user)
 ):
-    updated = update_exercise(exercise_id, exercise_update)
+    updated = await update_exercise_async(exercise_id, exercise_update)
     if not updated:
         raise HTTPException(status_code=404, detail="No se pudo actualizar el ejercicio")
     return updated
 
 @router.delete("/{exercise_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_exercise_endpoint(
+async def delete_exercise_endpoint(
     exercise_id: UUID,
     current_user: User = Depends(get_current_active_user)
 ):
-    deleted = delete_exercise(exercise_id)
+    deleted = await delete_exercise_async(exercise_id)
     if not deleted:
         raise HTTPException(status_code=404, detail="No se pudo eliminar el ejercicio")
     return None
 
 @router.post("/next", response_model=Exercise)
-def get_next_exercise(
+async def get_next_exercise(
     subject_id: Union[str, UUID, None] = Body(None),
     difficulty: str = Body('medium'),
+    mode: Literal['practice', 'review'] = Body('practice'),
     current_user: User = Depends(get_current_active_user)
 ):
     """
-    Devuelve un ejercicio personalizado para el alumno (stub inicial, sin IA real).
+    Devuelve un ejercicio personalizado para el alumno.
+    Con `difficulty='adaptive'` se elige el ejercicio cuya probabilidad de acierto estimada
+    (según la habilidad del alumno y la dificultad aprendida de cada ejercicio) está más
+    cerca de ADAPTIVE_TARGET_SUCCESS; con una dificultad concreta se sortea al azar.
+    Con `mode='review'` se devuelve el ejercicio de repaso más atrasado del alumno (SM-2)
+    de la materia pedida; si no tiene ninguno pendiente se sigue como en modo práctica.
     """
     # Normaliza subject_id: si es string vacío o no es UUID válido, lo trata como None
     if isinstance(subject_id, str):
@@ -69,13 +253,80 @@ def get_next_exercise(
         except Exception:
             subject_id = None
     # Aquí se podría integrar IA. Por ahora, selecciona un ejercicio aleatorio del subject y dificultad.
-    ejercicios = get_exercises(subject_id=subject_id)
+    # Con el catálogo en memoria cargado el muestreo no consulta la BD
+    if catalog.loaded and mode == 'review':
+        def accept(exercise_id: str) -> bool:
+            exercise = catalog.get(exercise_id)
+            return exercise is not None and (subject_id is None or exercise.subject_id == subject_id)
+        due = await review_scheduler.next_due(current_user.id, accept=accept)
+        if due is not None:
+            sessions.mark_served(current_user.id, [due])
+            return catalog.get(due)
+
+    if catalog.loaded:
+        # Evita lo ya resuelto y lo último servido al alumno mientras queden alternativas
+        progress = await progress_sets.get(current_user.id)
+        if difficulty == 'adaptive':
+            picked = sample_adaptive(current_user.id, 1, progress=progress, subject_id=subject_id)
+        else:
+            picked = sessions.sample_fresh(
+                current_user.id, 1, completed=progress.completed if progress else None,
+                subject_id=subject_id, difficulty=difficulty or None,
+            )
+        if not picked:
+            raise HTTPException(status_code=404, detail="No hay ejercicios disponibles para los criterios dados")
+        sessions.mark_served(current_user.id, [str(picked[0].id)])
+        return picked[0]
+
+    ejercicios = await get_exercises_async(subject_id=subject_id)
     
     # Filtrar adicionalmente por dificultad si se especifica
-    if difficulty:
+    if difficulty and difficulty != 'adaptive':
         ejercicios = [e for e in ejercicios if e.difficulty == difficulty]
 
     if not ejercicios:
         raise HTTPException(status_code=404, detail="No hay ejercicios disponibles para los criterios dados")
     
-    return random.choice(ejercicios) 
\ No newline at end of file
+    return random.choice(ejercicios)
+
+@router.post("/session", response_model=PracticeSession, status_code=status.HTTP_201_CREATED)
+async def start_practice_session(
+    params: PracticeSessionCreate,
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    Sortea de una vez una sesión de práctica de `size` ejercicios distintos, evitando los
+    ya resueltos y los servidos recientemente al alumno, y sin incluir nunca los de `exclude`.
+    Devuelve los primeros `batch_size` (todos por defecto); el resto se piden con
+    GET /exercises/session/{session_id}, que solo avanza un cursor en memoria.
+    """
+    if not catalog.loaded:
+        raise HTTPException(status_code=503, detail="El catálogo aún se está cargando")
+    progress = await progress_sets.get(current_user.id)
+    session = sessions.start_session(
+        current_user.id,
+        params.size,
+        exclude=params.exclude,
+        completed=progress.completed if progress else None,
+        subject_id=params.subject_id,
+        topic_id=params.topic_id,
+        difficulty=params.difficulty,
+    )
+    if not session.exercise_ids:
+        raise HTTPException(status_code=404, detail="No hay ejercicios disponibles para los criterios dados")
+    batch_size = params.size if params.batch_size is None else params.batch_size
+    exercises = sessions.pull(session, batch_size)
+    return PracticeSession(session_id=session.session_id, exercises=exercises, remaining=session.remaining)
+
+@router.get("/session/{session_id}", response_model=PracticeSession)
+async def pull_practice_session(
+    session_id: str,
+    count: int = Query(1, ge=1, le=100),
+    current_user: User = Depends(get_current_active_user)
+):
+    """Devuelve los siguientes `count` ejercicios de una sesión de práctica"""
+    session = sessions.get_session(session_id, current_user.id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Sesión de práctica no encontrada o caducada")
+    exercises = sessions.pull(session, count)
+    return PracticeSession(session_id=session.session_id, exercises=exercises, remaining=session.remaining)
@@ -0,0 +1,192 @@
+import asyncio
+import inspect
+import json
+import logging
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from uuid import UUID, uuid4
+from fastapi import APIRouter, Depends, HTTPException, Query
+from app.api.deps import get_current_active_user
+from app.core.config import settings
+from app.core.tasks import KeyedLock
+from app.crud.exercise import get_exercise_by_id_async
+from app.crud.progress import get_progress_async
+from app.schemas.exercise import Exercise
+from app.schemas.progress import AnswerBatchSubmit, AnswerSubmit, GradeResult, ProgressEntry
+from app.schemas.user import User
+from app.services.achievements import achievement_engine
+from app.services.adaptive import adaptive_engine, ensure_ability
+from app.services.catalog import catalog
+from app.services.dashboard_cache import invalidate_summary
+from app.services.grading import Grade, grade
+from app.services.progress_sets import progress_sets
+from app.services.review import review_scheduler
+from app.services.user_stats import user_stats
+from app.services.write_behind import BacklogFull, progress_writer
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+# Los envíos de un mismo usuario se registran de uno en uno: si no, dos envíos
+# simultáneos verían el mismo historial y contarían dos veces el primer acierto
+submission_locks = KeyedLock()
+
+async def resolve_exercises(exercise_ids: List[UUID]) -> Dict[str, Exercise]:
+    """Ejercicios por id desde el catálogo en memoria; los que falten se piden a la BD en paralelo"""
+    found = {}
+    missing = []
+    for exercise_id in dict.fromkeys(str(exercise_id) for exercise_id in exercise_ids):
+        exercise = catalog.get(exercise_id)
+        if exercise is not None:
+            found[exercise_id] = exercise
+        else:
+            missing.append(exercise_id)
+    if missing:
+        fetched = await asyncio.gather(*(get_exercise_by_id_async(UUID(exercise_id)) for exercise_id in missing))
+        for exercise_id, exercise in zip(missing, fetched):
+            if exercise is not None:
+                found[exercise_id] = exercise
+    unknown = [str(exercise_id) for exercise_id in exercise_ids if str(exercise_id) not in found]
+    if unknown:
+        raise HTTPException(status_code=404, detail=f"Ejercicios no encontrados: {', '.join(unknown)}")
+    return found
+
+def _answer_text(answer: Any) -> Optional[str]:
+    if answer is None or isinstance(answer, str):
+        return answer
+    return json.dumps(answer, ensure_ascii=False)
+
+async def _run_hook(name: str, hook: Callable[[], Any]) -> Any:
+    """
+    Ejecuta un efecto secundario de una respuesta ya aceptada. Los errores se registran
+    sin propagarse: la respuesta está guardada y el alumno debe recibir su corrección
+    (si no, reintentaría y la respuesta se registraría dos veces).
+    """
+    try:
+        result = hook()
+        if inspect.isawaitable(result):
+            result = await result
+        return result
+    except Exception as e:
+        logger.error(f"Error actualizando {name} tras una respuesta: {e}")
+        return None
+
+def _already_solved(progress, exercise_id) -> bool:
+    if progress is None:
+        return False
+    ordinal = catalog.ordinal(exercise_id, create=False)
+    return ordinal is not None and ordinal in progress.completed
+
+async def submit_answers(user: User, submissions: List[AnswerSubmit]) -> List[GradeResult]:
+    """
+    Corrige las respuestas, las deja en el buffer de escritura diferida de `user_progress`
+    (la inserción en la BD se hace por lotes en segundo plano) y actualiza los índices en
+    memoria del alumno (resueltos, habilidad, repasos, estadísticas y logros).
+    """
+    exercises = await resolve_exercises([submission.exercise_id for submission in submissions])
+    user_id = str(user.id)
+    now = datetime.now(timezone.utc)
+    completed_at = now.isoformat()
+    graded: List[Tuple[AnswerSubmit, Exercise, Grade, int]] = []
+    rows = []
+    results = []
+    for submission in submissions:
+        exercise = exercises[str(submission.exercise_id)]
+        result = grade(exercise, submission.answer)
+        score = round((exercise.points or 0) * result.credit)
+        graded.append((submission, exercise, result, score))
+        rows.append({
+            'id': str(uuid4()),
+            'user_id': user_id,
+            'exercise_id': str(exercise.id),
+            'answer': _answer_text(submission.answer),
+            'is_correct': result.correct,
+            'score': score,
+            'time_spent': submission.time_spent,
+            'completed_at': completed_at,
+        })
+        results.append(GradeResult(
+            exercise_id=exercise.id,
+            is_correct=result.correct,
+            credit=result.credit,
+            score=score,
+            correct_answer=exercise.correct_answer,
+            explanation=exercise.explanation,
+        ))
+
+    async with submission_locks.hold(user_id):
+        await _record_answers(user_id, graded, rows, now)
+    return results
+
+async def _record_answers(user_id: str, graded: List[Tuple[AnswerSubmit, Exercise, Grade, int]],
+                          rows: List[dict], now: datetime) -> None:
+    """Guarda las respuestas corregidas y actualiza los índices en memoria del alumno"""
+    # Historial previo a estas respuestas: habilidad estimada y ejercicios ya resueltos
+    await _run_hook("habilidad", lambda: ensure_ability(user_id))
+    progress = await _run_hook("ejercicios resueltos", lambda: progress_sets.get(user_id))
+    solved = set()
+    try:
+        await progress_writer.append_many(rows)
+    except BacklogFull:
+        raise HTTPException(
+            status_code=503,
+            detail="Hay demasiadas respuestas pendientes de guardar; inténtalo de nuevo en unos segundos",
+            headers={"Retry-After": str(max(1, round(settings.progress_flush_interval_seconds * 4)))},
+        )
+
+    for submission, exercise, result, score in graded:
+        # Puntos y resueltos solo cuentan la primera vez que se acierta el ejercicio
+        first_solve = result.correct and exercise.id not in solved and not _already_solved(progress, exercise.id)
+        if result.correct:
+            solved.add(exercise.id)
+        await _run_hook("ejercicios resueltos", lambda: progress_sets.record(user_id, exercise.id, result.correct))
+        await _run_hook("habilidad", lambda: adaptive_engine.record_answer(user_id, exercise.id, result.correct))
+        await _run_hook("repasos", lambda: review_scheduler.record(user_id, exercise.id, result.correct, result.credit))
+        update = await _run_hook("estadísticas", lambda: user_stats.record(
+            user_id, exercise.subject_id, result.correct, score, submission.time_spent, now, first_solve
+        ))
+        if update is not None:
+            await _run_hook("logros", lambda: achievement_engine.on_answer(user_id, update, exercise.subject_id))
+    invalidate_summary(user_id)
+
+@router.post("/submit", response_model=GradeResult)
+async def submit_answer(
+    submission: AnswerSubmit,
+    current_user: User = Depends(get_current_active_user)
+):
+    """Corrige y registra la respuesta del alumno a un ejercicio"""
+    results = await submit_answers(current_user, [submission])
+    return results[0]
+
+@router.post("/submit/batch", response_model=List[GradeResult])
+async def submit_answer_batch(
+    batch: AnswerBatchSubmit,
+    current_user: User = Depends(get_current_active_user)
+):
+    """Corrige y registra varias respuestas a la vez (p. ej. al entregar un examen)"""
+    if not batch.answers:
+        raise HTTPException(status_code=400, detail="No se ha enviado ninguna respuesta")
+    if len(batch.answers) > settings.progress_batch_max_size:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Como máximo {settings.progress_batch_max_size} respuestas por envío",
+        )
+    return await submit_answers(current_user, batch.answers)
+
+@router.get("/", response_model=List[ProgressEntry])
+async def list_progress(
+    skip: int = 0,
+    limit: int = Query(50, ge=1, le=500),
+    exercise_id: Optional[UUID] = None,
+    current_user: User = Depends(get_current_active_user)
+):
+    """Historial de respuestas del usuario, de la más reciente a la más antigua"""
+    # Lo que aún está en el buffer de escritura es lo más reciente: va delante en la primera página
+    pending = [] if skip else [
+        ProgressEntry(**row) for row in reversed(progress_writer.pending_for(current_user.id))
+        if exercise_id is None or row['exercise_id'] == str(exercise_id)
+    ][:limit]
+    stored = await get_progress_async(current_user.id, skip=skip, limit=limit, exercise_id=exercise_id)
+    seen = {entry.id for entry in pending}
+    return (pending + [entry for entry in stored if entry.id not in seen])[:limit]
@@ -0,0 +1,75 @@
+import json
+import logging
+import os
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Iterable, List, NamedTuple, Tuple
+from postgrest.exceptions import APIError
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Clases SQLSTATE que dependen de los datos de la fila (tipos, restricciones, claves
+# foráneas...): reintentar no las arregla. Cualquier otro error (red, BD caída, tabla
+# inexistente, permisos) depende del estado del servidor y se reintenta más tarde.
+ROW_ERROR_CLASSES = ('22', '23')
+
+def is_row_error(error: Exception) -> bool:
+    code = error.code if isinstance(error, APIError) else None
+    return isinstance(code, str) and len(code) == 5 and code[:2] in ROW_ERROR_CLASSES
+
+def describe_error(error: Exception) -> str:
+    if isinstance(error, APIError):
+        return f"{error.code}: {error.message}"
+    return str(error) or type(error).__name__
+
+class BatchOutcome(NamedTuple):
+    written: List[Any]
+    # Elementos rechazados por sus datos, con el error (van al fichero de descartes)
+    rejected: List[Tuple[Any, str]]
+    # Elementos sin escribir por un error transitorio: se reintentan en otra pasada
+    remaining: List[Any]
+
+async def write_batches(items: Iterable[Any], write: Callable[[List[Any]], Awaitable[Any]],
+                        batch_size: int, name: str) -> BatchOutcome:
+    """
+    Escribe `items` en lotes con `write(lote)`. Si un lote falla por los datos de alguna
+    fila se divide en mitades hasta aislar las filas culpables, que se devuelven como
+    rechazadas sin frenar al resto. Ante un error transitorio se para y lo no escrito
+    queda en `remaining`. Los elementos se procesan en orden, así que escritos más
+    rechazados forman siempre un prefijo de `items`.
+    """
+    items = list(items)
+    written: List[Any] = []
+    rejected: List[Tuple[Any, str]] = []
+
+    async def attempt(lo: int, hi: int) -> bool:
+        chunk = items[lo:hi]
+        try:
+            await write(chunk)
+        except Exception as e:
+            if not is_row_error(e):
+                logger.error(f"Error guardando {name}: {describe_error(e)}")
+                return False
+            if hi - lo == 1:
+                rejected.append((chunk[0], describe_error(e)))
+                return True
+            mid = (lo + hi) // 2
+            return await attempt(lo, mid) and await attempt(mid, hi)
+        written.extend(chunk)
+        return True
+
+    for start in range(0, len(items), batch_size):
+        if not await attempt(start, min(start + batch_size, len(items))):
+            break
+    return BatchOutcome(written, rejected, items[len(written) + len(rejected):])
+
+def dead_letter(table: str, rejected: List[Tuple[dict, str]]) -> None:
+    """Guarda en `DEAD_LETTER_DIR/<tabla>.ndjson` las filas que la BD rechaza, para revisarlas a mano"""
+    if not rejected:
+        return
+    os.makedirs(settings.dead_letter_dir, exist_ok=True)
+    at = datetime.now(timezone.utc).isoformat()
+    with open(os.path.join(settings.dead_letter_dir, f"{table}.ndjson"), 'a', encoding='utf-8') as log:
+        for row, error in rejected:
+            log.write(json.dumps({'at': at, 'error': error, 'row': row}, separators=(',', ':'), default=str) + '\n')
+    logger.warning(f"{len(rejected)} filas de {table} rechazadas por la BD; guardadas en {settings.dead_letter_dir}")
@@ -0,0 +1,176 @@
+import operator
+from array import array
+from bisect import bisect_left
+from typing import Dict, Iterable, Iterator, Union
+
+# Un contenedor por cada bloque de 2^16 enteros (clave = 16 bits altos)
+CONTAINER_BITS = 16
+CONTAINER_SIZE = 1 << CONTAINER_BITS
+LOW_MASK = CONTAINER_SIZE - 1
+# Por encima de este número de elementos un array ocupa más que un mapa de bits de 8 KB
+ARRAY_MAX_SIZE = 4096
+
+class _ArrayContainer:
+    """Valores bajos (16 bits) ordenados en un array compacto: 2 bytes por elemento"""
+
+    __slots__ = ("values",)
+
+    def __init__(self, values: Iterable[int] = ()):
+        self.values = array("H", sorted(set(values)))
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def __contains__(self, low: int) -> bool:
+        i = bisect_left(self.values, low)
+        return i < len(self.values) and self.values[i] == low
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.values)
+
+    def add(self, low: int) -> bool:
+        i = bisect_left(self.values, low)
+        if i < len(self.values) and self.values[i] == low:
+            return False
+        self.values.insert(i, low)
+        return True
+
+    def discard(self, low: int) -> bool:
+        i = bisect_left(self.values, low)
+        if i < len(self.values) and self.values[i] == low:
+            del self.values[i]
+            return True
+        return False
+
+class _BitmapContainer:
+    """Mapa de bits fijo de 2^16 bits (8 KB) para bloques densos"""
+
+    __slots__ = ("bits", "cardinality")
+
+    def __init__(self, values: Iterable[int] = ()):
+        self.bits = bytearray(CONTAINER_SIZE // 8)
+        self.cardinality = 0
+        for low in values:
+            self.add(low)
+
+    def __len__(self) -> int:
+        return self.cardinality
+
+    def __contains__(self, low: int) -> bool:
+        return bool(self.bits[low >> 3] & (1 << (low & 7)))
+
+    def __iter__(self) -> Iterator[int]:
+        for index, byte in enumerate(self.bits):
+            while byte:
+                lowest = byte & -byte
+                yield (index << 3) | (lowest.bit_length() - 1)
+                byte ^= lowest
+
+    def add(self, low: int) -> bool:
+        mask = 1 << (low & 7)
+        if self.bits[low >> 3] & mask:
+            return False
+        self.bits[low >> 3] |= mask
+        self.cardinality += 1
+        return True
+
+    def discard(self, low: int) -> bool:
+        mask = 1 << (low & 7)
+        if not self.bits[low >> 3] & mask:
+            return False
+        self.bits[low >> 3] &= ~mask
+        self.cardinality -= 1
+        return True
+
+_Container = Union[_ArrayContainer, _BitmapContainer]
+
+def _container(values: Iterable[int]) -> _Container:
+    values = list(values)
+    return _ArrayContainer(values) if len(values) <= ARRAY_MAX_SIZE else _BitmapContainer(values)
+
+class Bitmap:
+    """
+    Conjunto comprimido de enteros no negativos al estilo roaring: los valores se
+    reparten en bloques de 2^16 y cada bloque usa un array ordenado mientras es
+    disperso (2 bytes por valor) y pasa a un mapa de bits de 8 KB cuando es denso.
+    """
+
+    __slots__ = ("_containers",)
+
+    def __init__(self, values: Iterable[int] = ()):
+        self._containers: Dict[int, _Container] = {}
+        grouped: Dict[int, list] = {}
+        for value in values:
+            grouped.setdefault(value >> CONTAINER_BITS, []).append(value & LOW_MASK)
+        for high, lows in grouped.items():
+            self._containers[high] = _container(lows)
+
+    def __len__(self) -> int:
+        return sum(len(container) for container in self._containers.values())
+
+    def __bool__(self) -> bool:
+        return bool(self._containers)
+
+    def __contains__(self, value) -> bool:
+        try:
+            value = operator.index(value)
+        except TypeError:
+            return False
+        if value < 0:
+            return False
+        container = self._containers.get(value >> CONTAINER_BITS)
+        return container is not None and (value & LOW_MASK) in container
+
+    def __iter__(self) -> Iterator[int]:
+        for high in sorted(self._containers):
+            base = high << CONTAINER_BITS
+            for low in self._containers[high]:
+                yield base | low
+
+    def __repr__(self) -> str:
+        return f"Bitmap(size={len(self)}, containers={len(self._containers)})"
+
+    def add(self, value: int) -> None:
+        high, low = value >> CONTAINER_BITS, value & LOW_MASK
+        container = self._containers.get(high)
+        if container is None:
+            self._containers[high] = _ArrayContainer((low,))
+        elif container.add(low) and isinstance(container, _ArrayContainer) and len(container) > ARRAY_MAX_SIZE:
+            self._containers[high] = _BitmapContainer(container)
+
+    def discard(self, value: int) -> None:
+        high, low = value >> CONTAINER_BITS, value & LOW_MASK
+        container = self._containers.get(high)
+        if container is None or not container.discard(low):
+            return
+        if not container:
+            del self._containers[high]
+        elif isinstance(container, _BitmapContainer) and len(container) <= ARRAY_MAX_SIZE // 2:
+            # Histéresis: se vuelve a array solo cuando queda claramente disperso
+            self._containers[high] = _ArrayContainer(container)
+
+    def _combine(self, other: "Bitmap", keep) -> "Bitmap":
+        result = Bitmap()
+        for high in set(self._containers) | set(other._containers):
+            mine = self._containers.get(high, ())
+            theirs = other._containers.get(high, ())
+            lows = keep(set(mine), set(theirs))
+            if lows:
+                result._containers[high] = _container(lows)
+        return result
+
+    def __or__(self, other: "Bitmap") -> "Bitmap":
+        return self._combine(other, set.union)
+
+    def __and__(self, other: "Bitmap") -> "Bitmap":
+        return self._combine(other, set.intersection)
+
+    def __sub__(self, other: "Bitmap") -> "Bitmap":
+        return self._combine(other, set.difference)
+
+    def memory_usage(self) -> int:
+        """Bytes aproximados que ocupan los contenedores"""
+        return sum(
+            len(c.bits) if isinstance(c, _BitmapContainer) else c.values.itemsize * len(c.values)
+            for c in self._containers.values()
+        )
@@ -14,10 +14,90 @@ class Settings:
     supabase_key: str = os.getenv("SUPABASE_KEY", "")
     supabase_service_key: str = os.getenv("SUPABASE_SERVICE_KEY", "")
     
+    # Pool de conexiones HTTP del cliente asíncrono de Supabase
+    supabase_http2: bool = os.getenv("SUPABASE_HTTP2", "false").lower() in ("1", "true", "yes")
+    supabase_max_connections: int = int(os.getenv("SUPABASE_MAX_CONNECTIONS", "100"))
+    supabase_max_keepalive_connections: int = int(os.getenv("SUPABASE_MAX_KEEPALIVE_CONNECTIONS", "20"))
+    supabase_keepalive_expiry: float = float(os.getenv("SUPABASE_KEEPALIVE_EXPIRY", "30"))
+    supabase_timeout_seconds: float = float(os.getenv("SUPABASE_TIMEOUT_SECONDS", "10"))
+    
     # JWT
     secret_key: str = os.getenv("SECRET_KEY", "your_secret_key_here_make_it_long_and_random")
     algorithm: str = "HS256"
     access_token_expire_minutes: int = 30
+    # Modo "stateless": el token incluye id, nombre y rol y no se consulta la BD por petición
+    stateless_auth: bool = os.getenv("STATELESS_AUTH", "false").lower() in ("1", "true", "yes")
+    
+    # Caché de tokens ya verificados
+    token_cache_max_size: int = int(os.getenv("TOKEN_CACHE_MAX_SIZE", "4096"))
+    
+    # Caché de usuarios autenticados
+    user_cache_ttl_seconds: int = int(os.getenv("USER_CACHE_TTL_SECONDS", "60"))
+    user_cache_max_size: int = int(os.getenv("USER_CACHE_MAX_SIZE", "1024"))
+    
+    # Catálogo de ejercicios en memoria
+    catalog_page_size: int = int(os.getenv("CATALOG_PAGE_SIZE", "1000"))
+    catalog_refresh_interval_seconds: int = int(os.getenv("CATALOG_REFRESH_INTERVAL_SECONDS", "30"))
+    
+    # Datos de referencia (materias, temas, logros) en memoria
+    reference_data_refresh_interval_seconds: int = int(os.getenv("REFERENCE_DATA_REFRESH_INTERVAL_SECONDS", "300"))
+    
+    # Tamaño de página al exportar ejercicios en streaming
+    export_page_size: int = int(os.getenv("EXPORT_PAGE_SIZE", "500"))
+    # Filas por inserción en la importación en bloque
+    import_chunk_size: int = int(os.getenv("IMPORT_CHUNK_SIZE", "200"))
+    # Similitud (Jaccard estimada por MinHash) a partir de la cual dos ejercicios se marcan como duplicados
+    duplicate_similarity_threshold: float = float(os.getenv("DUPLICATE_SIMILARITY_THRESHOLD", "0.8"))
+    
+    # Respuestas JSON rápidas: sin doble validación Pydantic en los listados
+    fast_json_responses: bool = os.getenv("FAST_JSON_RESPONSES", "false").lower() in ("1", "true", "yes")
+    # Tiempo máximo durante el que un ETag de catálogo sigue siendo válido (respuestas 304)
+    etag_max_age_seconds: int = int(os.getenv("ETAG_MAX_AGE_SECONDS", "300"))
+    
+    # Dashboard
+    dashboard_query_timeout_seconds: float = float(os.getenv("DASHBOARD_QUERY_TIMEOUT_SECONDS", "2"))
+    dashboard_cache_ttl_seconds: int = int(os.getenv("DASHBOARD_CACHE_TTL_SECONDS", "300"))
+    dashboard_cache_max_size: int = int(os.getenv("DASHBOARD_CACHE_MAX_SIZE", "2048"))
+    
+    # Sesiones de práctica (lotes de ejercicios con cursor en el servidor)
+    practice_session_ttl_seconds: int = int(os.getenv("PRACTICE_SESSION_TTL_SECONDS", "3600"))
+    practice_session_max_size: int = int(os.getenv("PRACTICE_SESSION_MAX_SIZE", "10000"))
+    # Ejercicios servidos recientemente a cada usuario que no se vuelven a ofrecer
+    recent_exercises_window: int = int(os.getenv("RECENT_EXERCISES_WINDOW", "50"))
+    # Ejercicios intentados/resueltos por usuario (bitmaps en memoria cargados bajo demanda)
+    progress_sets_max_users: int = int(os.getenv("PROGRESS_SETS_MAX_USERS", "50000"))
+    progress_sets_ttl_seconds: int = int(os.getenv("PROGRESS_SETS_TTL_SECONDS", "3600"))
+    # Probabilidad de acierto buscada al elegir ejercicios en modo adaptativo
+    adaptive_target_success: float = float(os.getenv("ADAPTIVE_TARGET_SUCCESS", "0.7"))
+    # Repaso espaciado: escritura por lotes y descarte de colas de usuarios inactivos
+    review_flush_interval_seconds: float = float(os.getenv("REVIEW_FLUSH_INTERVAL_SECONDS", "10"))
+    review_flush_batch_size: int = int(os.getenv("REVIEW_FLUSH_BATCH_SIZE", "500"))
+    review_idle_seconds: int = int(os.getenv("REVIEW_IDLE_SECONDS", "1800"))
+    # Correctores compilados por ejercicio
+    grading_cache_max_size: int = int(os.getenv("GRADING_CACHE_MAX_SIZE", "20000"))
+    grading_cache_ttl_seconds: int = int(os.getenv("GRADING_CACHE_TTL_SECONDS", "3600"))
+    # Máximo de respuestas por envío en lote
+    progress_batch_max_size: int = int(os.getenv("PROGRESS_BATCH_MAX_SIZE", "100"))
+    # Filas que la BD rechaza por sus datos al escribir por lotes (una por línea, por tabla)
+    dead_letter_dir: str = os.getenv("DEAD_LETTER_DIR", "data/dead_letter")
+    # Escritura diferida de respuestas: log local, volcado por lotes y contrapresión
+    progress_log_path: str = os.getenv("PROGRESS_LOG_PATH", "data/progress.log")
+    progress_log_fsync: str = os.getenv("PROGRESS_LOG_FSYNC", "interval")
+    progress_log_fsync_interval_seconds: float = float(os.getenv("PROGRESS_LOG_FSYNC_INTERVAL_SECONDS", "1"))
+    progress_log_max_bytes: int = int(os.getenv("PROGRESS_LOG_MAX_BYTES", str(64 * 1024 * 1024)))
+    progress_flush_interval_seconds: float = float(os.getenv("PROGRESS_FLUSH_INTERVAL_SECONDS", "0.5"))
+    progress_flush_batch_size: int = int(os.getenv("PROGRESS_FLUSH_BATCH_SIZE", "500"))
+    progress_backlog_max: int = int(os.getenv("PROGRESS_BACKLOG_MAX", "20000"))
+    progress_backpressure_timeout_seconds: float = float(os.getenv("PROGRESS_BACKPRESSURE_TIMEOUT_SECONDS", "2"))
+    # Agregados por usuario (tabla user_stats): guardado periódico por lotes y descarte de usuarios inactivos
+    user_stats_flush_interval_seconds: float = float(os.getenv("USER_STATS_FLUSH_INTERVAL_SECONDS", "15"))
+    user_stats_flush_batch_size: int = int(os.getenv("USER_STATS_FLUSH_BATCH_SIZE", "500"))
+    user_stats_idle_seconds: int = int(os.getenv("USER_STATS_IDLE_SECONDS", "1800"))
+    # Logros: obtenidos por usuario en memoria y escritura por lotes de los desbloqueos
+    achievements_cache_max_users: int = int(os.getenv("ACHIEVEMENTS_CACHE_MAX_USERS", "50000"))
+    achievements_cache_ttl_seconds: int = int(os.getenv("ACHIEVEMENTS_CACHE_TTL_SECONDS", "3600"))
+    achievements_flush_interval_seconds: float = float(os.getenv("ACHIEVEMENTS_FLUSH_INTERVAL_SECONDS", "5"))
+    achievements_flush_batch_size: int = int(os.getenv("ACHIEVEMENTS_FLUSH_BATCH_SIZE", "500"))
     
     # CORS
     backend_cors_origins: List[str] = [
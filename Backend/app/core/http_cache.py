@@ -0,0 +1,73 @@
+import hashlib
+import secrets
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+from fastapi import Request, Response
+from app.core.config import settings
+
+# Datos de catálogo y referencia: cacheables, pero siempre revalidados con el ETag
+CATALOG_CACHE_CONTROL = "public, no-cache"
+
+def compute_etag(content: bytes) -> str:
+    """Calcula un ETag fuerte a partir del contenido de la respuesta"""
+    return '"' + hashlib.blake2b(content, digest_size=16).hexdigest() + '"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Comprueba si la cabecera If-None-Match incluye el ETag dado"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = [c.strip() for c in if_none_match.split(",")]
+    return any(c[2:] == etag if c.startswith("W/") else c == etag for c in candidates)
+
+def not_modified(etag: str, cache_control: str) -> Response:
+    """Respuesta 304 sin cuerpo"""
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": cache_control})
+
+class TableVersions:
+    """
+    Contadores de versión por tabla. Cada escritura incrementa la versión de su tabla y
+    el ETag de las respuestas que dependen de ella se deriva de esa versión, de modo
+    que la revalidación (If-None-Match) no necesita consultar la BD.
+    El identificador de época distingue procesos: los contadores son locales a cada uno,
+    así que un proceso no ve las escrituras de otro. Por eso el ETag incluye además la
+    ventana de tiempo actual (ETAG_MAX_AGE_SECONDS) y caduca aunque no haya cambios
+    locales: un cliente recibe como mucho durante esa ventana un 304 de datos obsoletos.
+    """
+
+    def __init__(self):
+        self._versions: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.epoch = secrets.token_hex(4)
+
+    def bump(self, table: str) -> None:
+        with self._lock:
+            self._versions[table] = self._versions.get(table, 0) + 1
+
+    def get(self, table: str) -> int:
+        return self._versions.get(table, 0)
+
+    def etag(self, table: str, *parts: Any) -> str:
+        """ETag fuerte para una respuesta que depende de `table` y de los parámetros dados"""
+        window = int(time.time() // max(settings.etag_max_age_seconds, 1))
+        key = "|".join([self.epoch, str(window), table, str(self.get(table))] + [str(p) for p in parts])
+        return compute_etag(key.encode())
+
+table_versions = TableVersions()
+
+def check_not_modified(request: Request, table: str, *parts: Any) -> Tuple[str, Optional[Response]]:
+    """
+    Calcula el ETag de la respuesta y, si el cliente ya la tiene, devuelve además
+    la respuesta 304 para que la ruta no llegue a consultar la BD.
+    """
+    etag = table_versions.etag(table, request.url.path, request.url.query, *parts)
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return etag, not_modified(etag, CATALOG_CACHE_CONTROL)
+    return etag, None
+
+def set_cache_headers(response: Response, etag: str) -> None:
+    """Añade el ETag a una respuesta; llamar solo con datos leídos correctamente"""
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = CATALOG_CACHE_CONTROL
@@ -0,0 +1,50 @@
+import base64
+import json
+from datetime import datetime
+from typing import Any, List, NamedTuple, Optional, Tuple
+from uuid import UUID
+
+# Columnas que definen el orden estable de la paginación por cursor
+KEYSET_COLUMNS = ("created_at", "id")
+
+class Page(NamedTuple):
+    items: List[Any]
+    next_cursor: Optional[str] = None
+    total: Optional[int] = None
+
+def encode_cursor(created_at: Any, row_id: Any) -> str:
+    """Genera un token opaco de continuación a partir de la última fila de la página"""
+    raw = json.dumps([str(created_at), str(row_id)], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    """
+    Decodifica un token de continuación; lanza ValueError si no es válido. El token lo
+    envía el cliente y sus valores acaban en un filtro de PostgREST, así que solo se
+    aceptan una fecha ISO y un UUID, devueltos en forma canónica.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.fromisoformat(created_at).isoformat(), str(UUID(row_id))
+    except Exception:
+        raise ValueError("Cursor de paginación inválido")
+
+def apply_keyset(query: Any, cursor: Optional[str]) -> Any:
+    """
+    Aplica el filtro y el orden (created_at, id) de la paginación por cursor.
+    Un cursor vacío o None empieza desde el principio.
+    """
+    if cursor:
+        created_at, row_id = decode_cursor(cursor)
+        query = query.or_(
+            f'created_at.gt."{created_at}",and(created_at.eq."{created_at}",id.gt."{row_id}")'
+        )
+    return query.order("created_at").order("id")
+
+def next_cursor(rows: list, limit: int) -> Optional[str]:
+    """Cursor de la siguiente página, o None si esta es la última"""
+    if len(rows) <= limit:
+        return None
+    last = rows[limit - 1]
+    return encode_cursor(last.get("created_at"), last.get("id"))
@@ -0,0 +1,50 @@
+import json
+from datetime import date, datetime
+from enum import Enum
+from typing import Any
+from uuid import UUID
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+from app.core.config import settings
+
+try:
+    import orjson
+except ImportError:  # orjson es opcional; sin él se usa json de la librería estándar
+    orjson = None
+
+def _default(obj: Any) -> Any:
+    if isinstance(obj, BaseModel):
+        # model_dump en Pydantic v2 (evita el aviso de deprecación de .dict()), dict en v1
+        return obj.model_dump(mode="json") if hasattr(obj, "model_dump") else obj.dict()
+    if isinstance(obj, UUID):
+        return str(obj)
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if isinstance(obj, Enum):
+        return obj.value
+    raise TypeError(f"Tipo no serializable: {type(obj).__name__}")
+
+def dumps(content: Any) -> bytes:
+    """Serializa directamente a bytes JSON (orjson si está disponible)"""
+    if orjson is not None:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, default=_default, ensure_ascii=False, separators=(",", ":")).encode()
+
+class FastJSONResponse(JSONResponse):
+    """
+    Respuesta JSON que serializa el contenido tal cual, sin pasar por
+    jsonable_encoder ni volver a validar contra el response_model.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+def fast_json(content: Any) -> Any:
+    """
+    Devuelve una FastJSONResponse si el modo rápido está activado; si no, el contenido
+    tal cual para que FastAPI lo valide contra el response_model de la ruta.
+    Usar solo con datos ya validados por la capa CRUD o filas de confianza de la BD.
+    """
+    if settings.fast_json_responses:
+        return FastJSONResponse(content)
+    return content
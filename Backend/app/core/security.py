@@ -1,11 +1,48 @@
+import hashlib
+import time
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Any, Dict, Optional
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from app.core.config import settings
+from app.core.cache import TTLCache
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+# Versión del formato de claims de usuario embebidos en el token
+TOKEN_CLAIMS_VERSION = 1
+
+class UserVersionTable:
+    """
+    Caché de la versión de token de cada usuario. La versión vigente se guarda en
+    `users.token_version`, así que sobrevive a los reinicios y es la misma en todos los
+    procesos; aquí se guarda USER_CACHE_TTL_SECONDS para no leerla en cada petición.
+    Un token cuyo claim `uv` no coincide se considera desactualizado.
+    """
+
+    def __init__(self):
+        self._cache = TTLCache(maxsize=settings.user_cache_max_size, ttl=settings.user_cache_ttl_seconds)
+
+    def cached(self, user_id: str) -> Optional[int]:
+        return self._cache.get(str(user_id))
+
+    def set(self, user_id: str, version: int) -> None:
+        self._cache.set(str(user_id), version)
+
+    def invalidate(self, user_id: str) -> None:
+        self._cache.invalidate(str(user_id))
+
+    @staticmethod
+    def next_version() -> int:
+        """Versión para un cambio del usuario: milisegundos actuales, sin leer la anterior"""
+        return int(time.time() * 1000)
+
+user_versions = UserVersionTable()
+
+# Caché de payloads ya verificados, indexada por el digest del token.
+# Cada entrada expira exactamente cuando expira el token.
+token_cache = TTLCache(maxsize=settings.token_cache_max_size, ttl=0)
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verifica si la contraseña coincide con el hash"""
     return pwd_context.verify(plain_password, hashed_password)
@@ -26,10 +63,35 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     encoded_jwt = jwt.encode(to_encode, settings.secret_key, algorithm=settings.algorithm)
     return encoded_jwt
 
+def build_user_claims(user: Any, token_version: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Construye los claims del token para un usuario. Los claims del modo stateless solo
+    se añaden si se conoce su versión de token (`users.token_version`).
+    """
+    claims = {"sub": user.email}
+    if settings.stateless_auth and token_version is not None:
+        user_id = str(user.id)
+        claims.update({
+            "cv": TOKEN_CLAIMS_VERSION,
+            "uid": user_id,
+            "uv": token_version,
+            "name": user.name,
+            "role": getattr(user.role, "value", user.role),
+            "avatar_url": getattr(user, "avatar_url", None),
+        })
+    return claims
+
 def verify_token(token: str) -> Optional[dict]:
     """Verifica y decodifica un token JWT"""
+    digest = hashlib.sha256(token.encode()).digest()
+    payload = token_cache.get(digest)
+    if payload is not None:
+        return dict(payload)
     try:
         payload = jwt.decode(token, settings.secret_key, algorithms=[settings.algorithm])
-        return payload
     except JWTError:
-        return None 
\ No newline at end of file
+        return None
+    exp = payload.get("exp")
+    if isinstance(exp, (int, float)):
+        token_cache.set(digest, payload, ttl=exp - time.time())
+    return dict(payload) 
\ No newline at end of file
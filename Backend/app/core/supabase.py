@@ -1,16 +1,91 @@
-from supabase import create_client, Client
+from typing import List, Optional
+import logging
+import httpx
+from supabase import create_client, Client, acreate_client, AsyncClient, AsyncClientOptions
 from app.core.config import settings
 
+logger = logging.getLogger(__name__)
+
 # Cliente de Supabase para operaciones del servidor
 supabase: Client = create_client(settings.supabase_url, settings.supabase_service_key)
 
 # Cliente de Supabase para operaciones del cliente (con anon key)
 supabase_client: Client = create_client(settings.supabase_url, settings.supabase_key)
 
+# Clientes asíncronos: se crean una sola vez al arrancar la aplicación
+async_supabase: Optional[AsyncClient] = None
+async_supabase_client: Optional[AsyncClient] = None
+_http_clients: List[httpx.AsyncClient] = []
+
 def get_supabase() -> Client:
     """Retorna el cliente de Supabase para operaciones del servidor"""
     return supabase
 
 def get_supabase_client() -> Client:
     """Retorna el cliente de Supabase para operaciones del cliente"""
-    return supabase_client 
\ No newline at end of file
+    return supabase_client
+
+def _create_http_client() -> httpx.AsyncClient:
+    """Crea un cliente HTTP con keep-alive y límites explícitos de conexiones"""
+    http2 = settings.supabase_http2
+    if http2:
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            logger.warning("SUPABASE_HTTP2 activado pero el paquete 'h2' no está instalado; se usa HTTP/1.1")
+            http2 = False
+    client = httpx.AsyncClient(
+        http2=http2,
+        timeout=httpx.Timeout(settings.supabase_timeout_seconds),
+        limits=httpx.Limits(
+            max_connections=settings.supabase_max_connections,
+            max_keepalive_connections=settings.supabase_max_keepalive_connections,
+            keepalive_expiry=settings.supabase_keepalive_expiry,
+        ),
+    )
+    _http_clients.append(client)
+    return client
+
+async def init_async_supabase() -> None:
+    """Inicializa los clientes asíncronos de Supabase (se llama al arrancar la app)"""
+    global async_supabase, async_supabase_client
+    if async_supabase is not None:
+        return
+    async_supabase = await acreate_client(
+        settings.supabase_url,
+        settings.supabase_service_key,
+        options=AsyncClientOptions(
+            auto_refresh_token=False,
+            persist_session=False,
+            httpx_client=_create_http_client(),
+        ),
+    )
+    async_supabase_client = await acreate_client(
+        settings.supabase_url,
+        settings.supabase_key,
+        options=AsyncClientOptions(
+            auto_refresh_token=False,
+            persist_session=False,
+            httpx_client=_create_http_client(),
+        ),
+    )
+
+async def close_async_supabase() -> None:
+    """Cierra las conexiones HTTP de los clientes asíncronos"""
+    global async_supabase, async_supabase_client
+    while _http_clients:
+        await _http_clients.pop().aclose()
+    async_supabase = None
+    async_supabase_client = None
+
+def get_async_supabase() -> AsyncClient:
+    """Retorna el cliente asíncrono de Supabase para operaciones del servidor"""
+    if async_supabase is None:
+        raise RuntimeError("El cliente asíncrono de Supabase no está inicializado")
+    return async_supabase
+
+def get_async_supabase_client() -> AsyncClient:
+    """Retorna el cliente asíncrono de Supabase para operaciones del cliente"""
+    if async_supabase_client is None:
+        raise RuntimeError("El cliente asíncrono de Supabase no está inicializado")
+    return async_supabase_client
@@ -0,0 +1,68 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Awaitable, Callable, Dict, Hashable, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+class SingleFlight:
+    """
+    Agrupa las cargas concurrentes de una misma clave en una sola tarea: quien llega
+    mientras hay una carga en curso espera su resultado en lugar de lanzar otra.
+    La tarea va protegida con `shield`, así que cancelar a un llamante no la cancela
+    para los demás.
+    """
+
+    def __init__(self):
+        self._tasks: Dict[Hashable, "asyncio.Future"] = {}
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._tasks
+
+    async def run(self, key: Hashable, load: Callable[[], Awaitable[T]]) -> T:
+        task = self._tasks.get(key)
+        if task is None:
+            task = self._tasks[key] = asyncio.ensure_future(load())
+            task.add_done_callback(lambda done: self._tasks.pop(key, None) if self._tasks.get(key) is done else None)
+        return await asyncio.shield(task)
+
+class KeyedLock:
+    """Un `asyncio.Lock` por clave, creado al pedirlo y descartado cuando nadie lo usa"""
+
+    def __init__(self):
+        self._locks: Dict[Hashable, asyncio.Lock] = {}
+        self._holders: Dict[Hashable, int] = {}
+
+    @asynccontextmanager
+    async def hold(self, key: Hashable) -> AsyncIterator[None]:
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = self._locks[key] = asyncio.Lock()
+        self._holders[key] = self._holders.get(key, 0) + 1
+        try:
+            async with lock:
+                yield
+        finally:
+            self._holders[key] -= 1
+            if not self._holders[key]:
+                del self._holders[key], self._locks[key]
+
+async def run_periodically(name: str, interval: Callable[[], float], step: Callable[[], Awaitable],
+                           on_stop: Optional[Callable[[], Awaitable]] = None) -> None:
+    """
+    Bucle de una tarea en segundo plano: ejecuta `step` cada `interval()` segundos y, al
+    cancelarse (parada de la aplicación), una última vez `on_stop` antes de terminar.
+    Los errores de una pasada se registran sin detener el bucle.
+    """
+    while True:
+        try:
+            await asyncio.sleep(interval())
+            await step()
+        except asyncio.CancelledError:
+            if on_stop is not None:
+                await on_stop()
+            raise
+        except Exception as e:
+            logger.error(f"Error en la tarea de {name}: {e}")
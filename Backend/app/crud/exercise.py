@@ -1,7 +1,14 @@
-from typing import List, Optional
+import asyncio
+from datetime import datetime
+from typing import AsyncIterator, List, Optional, Sequence
 from uuid import UUID
+from fastapi.encoders import jsonable_encoder
 from app.schemas.exercise import ExerciseCreate, ExerciseUpdate, Exercise
-from app.core.supabase import get_supabase
+from app.core.supabase import get_supabase, get_async_supabase
+from app.core.http_cache import table_versions
+from app.core.pagination import KEYSET_COLUMNS, Page, apply_keyset, next_cursor
+from app.services.dashboard_cache import invalidate_summary
+from app.services.catalog import catalog
 import logging
 
 logger = logging.getLogger(__name__)
@@ -15,8 +22,12 @@ def create_exercise(exercise: ExerciseCreate, created_by: UUID) -> Optional[Exer
         data = exercise.dict()
         data['created_by'] = str(created_by)
         response = supabase.table(TABLE_NAME).insert(data).execute()
+        invalidate_summary(created_by)
         if response.data:
-            return Exercise(**response.data[0])
+            created = to_exercise(response.data[0])
+            catalog.upsert(created)
+            table_versions.bump(TABLE_NAME)
+            return created
         return None
     except Exception as e:
         logger.error(f"Error creando ejercicio: {e}")
@@ -28,6 +39,10 @@ def parse_options(options):
         return {chr(97 + i): v for i, v in enumerate(options)}
     return options
 
+def to_exercise(item: dict) -> Exercise:
+    """Construye un Exercise a partir de una fila, normalizando las opciones"""
+    return Exercise(**{**item, 'options': parse_options(item.get('options'))})
+
 # Listar ejercicios
 def get_exercises(skip: int = 0, limit: int = 100, subject_id: Optional[UUID] = None) -> List[Exercise]:
     try:
@@ -37,9 +52,9 @@ def get_exercises(skip: int = 0, limit: int = 100, subject_id: Optional[UUID] =
         if subject_id:
             query = query.eq('subject_id', str(subject_id))
 
-        response = query.range(skip, skip + limit - 1).execute()
+        response = query.order('created_at').order('id').range(skip, skip + limit - 1).execute()
         
-        return [Exercise(**{**item, 'options': parse_options(item.get('options'))}) for item in response.data]
+        return [to_exercise(item) for item in response.data]
     except Exception as e:
         logger.error(f"Error listando ejercicios: {e}")
         return []
@@ -50,7 +65,7 @@ def get_exercise_by_id(exercise_id: UUID) -> Optional[Exercise]:
         supabase = get_supabase()
         response = supabase.table(TABLE_NAME).select('*').eq('id', str(exercise_id)).single().execute()
         if response.data:
-            return Exercise(**{**response.data, 'options': parse_options(response.data.get('options'))})
+            return to_exercise(response.data)
         return None
     except Exception as e:
         logger.error(f"Error obteniendo ejercicio por ID: {e}")
@@ -63,7 +78,10 @@ def update_exercise(exercise_id: UUID, exercise_update: ExerciseUpdate) -> Optio
         update_data = exercise_update.dict(exclude_unset=True)
         response = supabase.table(TABLE_NAME).update(update_data).eq('id', str(exercise_id)).execute()
         if response.data:
-            return Exercise(**response.data[0])
+            updated = to_exercise(response.data[0])
+            catalog.upsert(updated)
+            table_versions.bump(TABLE_NAME)
+            return updated
         return None
     except Exception as e:
         logger.error(f"Error actualizando ejercicio: {e}")
@@ -73,8 +91,206 @@ def update_exercise(exercise_id: UUID, exercise_update: ExerciseUpdate) -> Optio
 def delete_exercise(exercise_id: UUID) -> bool:
     try:
         supabase = get_supabase()
-        supabase.table(TABLE_NAME).delete().eq('id', str(exercise_id)).execute()
+        response = supabase.table(TABLE_NAME).delete().eq('id', str(exercise_id)).execute()
+        for item in response.data or []:
+            invalidate_summary(item.get('created_by'))
+        catalog.remove(exercise_id)
+        table_versions.bump(TABLE_NAME)
+        return True
+    except Exception as e:
+        logger.error(f"Error eliminando ejercicio: {e}")
+        return False
+
+# --- Versiones asíncronas (las funciones síncronas se mantienen por compatibilidad) ---
+
+async def create_exercise_async(exercise: ExerciseCreate, created_by: UUID) -> Optional[Exercise]:
+    try:
+        supabase = get_async_supabase()
+        data = exercise.dict()
+        data['created_by'] = str(created_by)
+        response = await supabase.table(TABLE_NAME).insert(data).execute()
+        invalidate_summary(created_by)
+        if response.data:
+            created = to_exercise(response.data[0])
+            catalog.upsert(created)
+            table_versions.bump(TABLE_NAME)
+            return created
+        return None
+    except Exception as e:
+        logger.error(f"Error creando ejercicio: {e}")
+        return None
+
+async def insert_exercises_async(exercises: List[ExerciseCreate], created_by: UUID) -> List[Exercise]:
+    """
+    Inserta varios ejercicios en una sola petición y los devuelve en el mismo orden.
+    Lanza la excepción de la BD si falla el lote (para poder aislar las filas culpables).
+    """
+    if not exercises:
+        return []
+    supabase = get_async_supabase()
+    data = [{**jsonable_encoder(exercise), 'created_by': str(created_by)} for exercise in exercises]
+    response = await supabase.table(TABLE_NAME).insert(data).execute()
+    invalidate_summary(created_by)
+    created = [to_exercise(item) for item in response.data or []]
+    for exercise in created:
+        catalog.upsert(exercise)
+    table_versions.bump(TABLE_NAME)
+    return created
+
+async def create_exercises_bulk_async(exercises: List[ExerciseCreate], created_by: UUID) -> Optional[List[Exercise]]:
+    """Inserta varios ejercicios en una sola petición; devuelve None si falla el lote"""
+    try:
+        return await insert_exercises_async(exercises, created_by)
+    except Exception as e:
+        logger.error(f"Error creando lote de ejercicios: {e}")
+        return None
+
+async def get_exercises_async(skip: int = 0, limit: int = 100, subject_id: Optional[UUID] = None) -> List[Exercise]:
+    try:
+        supabase = get_async_supabase()
+        query = supabase.table(TABLE_NAME).select('*')
+
+        if subject_id:
+            query = query.eq('subject_id', str(subject_id))
+
+        response = await query.order('created_at').order('id').range(skip, skip + limit - 1).execute()
+
+        return [to_exercise(item) for item in response.data]
+    except Exception as e:
+        logger.error(f"Error listando ejercicios: {e}")
+        return []
+
+async def get_exercise_rows_async(
+    cursor: Optional[str] = None,
+    skip: int = 0,
+    limit: int = 100,
+    subject_id: Optional[UUID] = None,
+    columns: Sequence[str] = ('*',),
+    include_total: bool = False,
+) -> Page:
+    """
+    Lista filas crudas de ejercicios pidiendo a Supabase solo las columnas indicadas.
+    Con `cursor` (vacío para la primera página) pagina por (created_at, id); si es None usa skip/limit.
+    Con `include_total` se añade el total estimado del listado completo.
+    Lanza ValueError si el cursor no es válido.
+    """
+    supabase = get_async_supabase()
+    columns = list(columns)
+    # La paginación por cursor necesita las columnas de orden aunque no se hayan pedido
+    extra = [] if '*' in columns or cursor is None else [c for c in KEYSET_COLUMNS if c not in columns]
+    query = supabase.table(TABLE_NAME).select(','.join(columns + extra))
+    count_query = supabase.table(TABLE_NAME).select('id', count='estimated', head=True)
+    if subject_id:
+        query = query.eq('subject_id', str(subject_id))
+        count_query = count_query.eq('subject_id', str(subject_id))
+    if cursor is None:
+        query = query.order('created_at').order('id').range(skip, skip + limit - 1)
+    else:
+        # Se pide una fila extra para saber si hay página siguiente
+        query = apply_keyset(query, cursor).limit(limit + 1)
+    try:
+        if include_total:
+            response, count_response = await asyncio.gather(query.execute(), count_query.execute())
+        else:
+            response, count_response = await query.execute(), None
+    except Exception as e:
+        logger.error(f"Error listando ejercicios: {e}")
+        return Page(items=[])
+    rows = response.data or []
+    cursor_token = next_cursor(rows, limit) if cursor is not None else None
+    items = []
+    for item in rows[:limit]:
+        if 'options' in item:
+            item['options'] = parse_options(item['options'])
+        for column in extra:
+            item.pop(column, None)
+        items.append(item)
+    return Page(items=items, next_cursor=cursor_token, total=count_response.count if count_response else None)
+
+async def get_exercises_page_async(
+    cursor: Optional[str] = None,
+    limit: int = 100,
+    subject_id: Optional[UUID] = None,
+    include_total: bool = False,
+) -> Page:
+    """
+    Lista ejercicios con paginación por cursor sobre (created_at, id).
+    Lanza ValueError si el cursor no es válido.
+    """
+    page = await get_exercise_rows_async(cursor=cursor or '', limit=limit, subject_id=subject_id, include_total=include_total)
+    return page._replace(items=[Exercise(**item) for item in page.items])
+
+async def get_exercise_by_id_async(exercise_id: UUID) -> Optional[Exercise]:
+    try:
+        supabase = get_async_supabase()
+        response = await supabase.table(TABLE_NAME).select('*').eq('id', str(exercise_id)).single().execute()
+        if response.data:
+            return to_exercise(response.data)
+        return None
+    except Exception as e:
+        logger.error(f"Error obteniendo ejercicio por ID: {e}")
+        return None
+
+async def update_exercise_async(exercise_id: UUID, exercise_update: ExerciseUpdate) -> Optional[Exercise]:
+    try:
+        supabase = get_async_supabase()
+        update_data = exercise_update.dict(exclude_unset=True)
+        response = await supabase.table(TABLE_NAME).update(update_data).eq('id', str(exercise_id)).execute()
+        if response.data:
+            updated = to_exercise(response.data[0])
+            catalog.upsert(updated)
+            table_versions.bump(TABLE_NAME)
+            return updated
+        return None
+    except Exception as e:
+        logger.error(f"Error actualizando ejercicio: {e}")
+        return None
+
+async def delete_exercise_async(exercise_id: UUID) -> bool:
+    try:
+        supabase = get_async_supabase()
+        response = await supabase.table(TABLE_NAME).delete().eq('id', str(exercise_id)).execute()
+        for item in response.data or []:
+            invalidate_summary(item.get('created_by'))
+        catalog.remove(exercise_id)
+        table_versions.bump(TABLE_NAME)
         return True
     except Exception as e:
         logger.error(f"Error eliminando ejercicio: {e}")
-        return False 
\ No newline at end of file
+        return False
+
+async def iter_exercise_rows_async(
+    page_size: int = 1000,
+    subject_id: Optional[UUID] = None,
+    topic_id: Optional[UUID] = None,
+    difficulty: Optional[str] = None,
+    updated_since: Optional[datetime] = None,
+) -> AsyncIterator[List[dict]]:
+    """
+    Recorre la tabla de ejercicios por páginas de filas crudas usando paginación por cursor,
+    de modo que solo hay una página en memoria a la vez.
+    """
+    supabase = get_async_supabase()
+    cursor = None
+    while True:
+        query = supabase.table(TABLE_NAME).select('*')
+        if subject_id:
+            query = query.eq('subject_id', str(subject_id))
+        if topic_id:
+            query = query.eq('topic_id', str(topic_id))
+        if difficulty:
+            query = query.eq('difficulty', difficulty)
+        if updated_since is not None:
+            query = query.gte('updated_at', updated_since.isoformat())
+        response = await apply_keyset(query, cursor).limit(page_size + 1).execute()
+        rows = response.data or []
+        if rows:
+            yield rows[:page_size]
+        cursor = next_cursor(rows, page_size)
+        if cursor is None:
+            break
+
+async def iter_exercise_pages_async(page_size: int = 1000, updated_since: Optional[datetime] = None) -> AsyncIterator[List[Exercise]]:
+    """Recorre la tabla completa de ejercicios por páginas (opcionalmente solo los modificados)"""
+    async for rows in iter_exercise_rows_async(page_size=page_size, updated_since=updated_since):
+        yield [to_exercise(item) for item in rows]
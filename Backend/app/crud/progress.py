@@ -0,0 +1,34 @@
+from typing import List, Optional
+from uuid import UUID
+from app.core.supabase import get_async_supabase
+from app.schemas.progress import ProgressEntry
+import logging
+
+logger = logging.getLogger(__name__)
+
+TABLE_NAME = 'user_progress'
+
+async def insert_progress_rows_async(rows: List[dict]) -> None:
+    """
+    Inserta varias respuestas en una sola petición. Las filas traen su `id`, así que
+    repetir un lote ya escrito (p. ej. al reproducir el log) no crea duplicados.
+    Los errores se propagan: el buffer de escritura decide si reintentar o descartar.
+    """
+    if not rows:
+        return
+    supabase = get_async_supabase()
+    await supabase.table(TABLE_NAME).upsert(rows, on_conflict='id', ignore_duplicates=True, returning='minimal').execute()
+
+async def get_progress_async(user_id: UUID, skip: int = 0, limit: int = 50,
+                             exercise_id: Optional[UUID] = None) -> List[ProgressEntry]:
+    """Respuestas del usuario, de la más reciente a la más antigua"""
+    try:
+        supabase = get_async_supabase()
+        query = supabase.table(TABLE_NAME).select('*').eq('user_id', str(user_id))
+        if exercise_id:
+            query = query.eq('exercise_id', str(exercise_id))
+        response = await query.order('completed_at', desc=True).range(skip, skip + limit - 1).execute()
+        return [ProgressEntry(**item) for item in response.data or []]
+    except Exception as e:
+        logger.error(f"Error obteniendo progreso: {e}")
+        return []
@@ -1,11 +1,31 @@
+import asyncio
 from typing import Optional, List
 from app.models.user import User, UserCreate, UserUpdate, UserRole
-from app.core.supabase import get_supabase, get_supabase_client
-from app.core.security import get_password_hash, verify_password
+from app.core.supabase import get_supabase, get_supabase_client, get_async_supabase, get_async_supabase_client
+from app.core.security import get_password_hash, verify_password, user_versions
+from app.core.cache import TTLCache
+from app.core.pagination import Page, apply_keyset, next_cursor
+from app.core.config import settings
+from app.services.dashboard_cache import invalidate_summary
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Caché de usuarios autenticados, indexada por email (el `sub` del JWT)
+user_cache = TTLCache(maxsize=settings.user_cache_max_size, ttl=settings.user_cache_ttl_seconds)
+
+def invalidate_cached_user(user_id: str) -> None:
+    """Elimina de la caché cualquier entrada del usuario indicado, incluida su versión de token"""
+    user_cache.invalidate_where(lambda _, user: str(user.id) == str(user_id))
+    user_versions.invalidate(user_id)
+    invalidate_summary(user_id)
+
+def with_token_version(update_data: dict) -> dict:
+    """En modo stateless, un cambio del usuario cambia también su versión de token (invalida los emitidos)"""
+    if settings.stateless_auth:
+        return {**update_data, 'token_version': user_versions.next_version()}
+    return update_data
+
 def get_user(user_id: str) -> Optional[User]:
     """Obtiene un usuario por ID"""
     try:
@@ -32,11 +52,21 @@ def get_user_by_email(email: str) -> Optional[User]:
         logger.error(f"Error getting user by email: {e}")
         return None
 
+def get_cached_user_by_email(email: str) -> Optional[User]:
+    """Obtiene un usuario por email consultando primero la caché en memoria"""
+    user = user_cache.get(email)
+    if user is not None:
+        return user
+    user = get_user_by_email(email)
+    if user is not None:
+        user_cache.set(email, user)
+    return user
+
 def get_users(skip: int = 0, limit: int = 100) -> List[User]:
     """Obtiene una lista de usuarios"""
     try:
         supabase = get_supabase()
-        response = supabase.table('users').select('*').range(skip, skip + limit - 1).execute()
+        response = supabase.table('users').select('*').order('created_at').order('id').range(skip, skip + limit - 1).execute()
         
         return [User(**user_data) for user_data in response.data]
     except Exception as e:
@@ -104,7 +134,8 @@ def update_user(user_id: str, user_update: UserUpdate) -> Optional[User]:
         if not update_data:
             return get_user(user_id)
         
-        response = supabase.table('users').update(update_data).eq('id', user_id).execute()
+        response = supabase.table('users').update(with_token_version(update_data)).eq('id', user_id).execute()
+        invalidate_cached_user(user_id)
         
         if response.data:
             return User(**response.data[0])
@@ -120,6 +151,7 @@ def delete_user(user_id: str) -> bool:
         
         # Eliminar de la tabla users
         response = supabase.table('users').delete().eq('id', user_id).execute()
+        invalidate_cached_user(user_id)
         
         # Eliminar de auth.users
         supabase.auth.admin.delete_user(user_id)
@@ -194,4 +226,211 @@ def create_test_user(email: str, name: str, role: str, password: str = "password
         return None
     except Exception as e:
         logger.error(f"Error creating test user {email}: {e}")
-        return None 
\ No newline at end of file
+        return None
+
+# --- Versiones asíncronas (las funciones síncronas se mantienen por compatibilidad) ---
+
+async def get_user_async(user_id: str) -> Optional[User]:
+    """Obtiene un usuario por ID"""
+    try:
+        supabase = get_async_supabase()
+        response = await supabase.table('users').select('*').eq('id', user_id).execute()
+
+        if response.data:
+            return User(**response.data[0])
+        return None
+    except Exception as e:
+        logger.error(f"Error getting user: {e}")
+        return None
+
+async def get_user_by_email_async(email: str) -> Optional[User]:
+    """Obtiene un usuario por email"""
+    try:
+        supabase = get_async_supabase()
+        response = await supabase.table('users').select('*').eq('email', email).execute()
+
+        if response.data:
+            return User(**response.data[0])
+        return None
+    except Exception as e:
+        logger.error(f"Error getting user by email: {e}")
+        return None
+
+async def get_token_version_async(user_id: str) -> Optional[int]:
+    """Versión de token vigente del usuario (`users.token_version`); None si no existe o no se puede leer"""
+    version = user_versions.cached(user_id)
+    if version is not None:
+        return version
+    try:
+        supabase = get_async_supabase()
+        response = await supabase.table('users').select('token_version').eq('id', str(user_id)).execute()
+    except Exception as e:
+        logger.error(f"Error getting token version: {e}")
+        return None
+    if not response.data:
+        return None
+    version = response.data[0].get('token_version') or 0
+    user_versions.set(user_id, version)
+    return version
+
+async def get_cached_user_by_email_async(email: str) -> Optional[User]:
+    """Obtiene un usuario por email consultando primero la caché en memoria"""
+    user = user_cache.get(email)
+    if user is not None:
+        return user
+    user = await get_user_by_email_async(email)
+    if user is not None:
+        user_cache.set(email, user)
+    return user
+
+async def get_users_async(skip: int = 0, limit: int = 100) -> List[User]:
+    """Obtiene una lista de usuarios"""
+    try:
+        supabase = get_async_supabase()
+        response = await supabase.table('users').select('*').order('created_at').order('id').range(skip, skip + limit - 1).execute()
+
+        return [User(**user_data) for user_data in response.data]
+    except Exception as e:
+        logger.error(f"Error getting users: {e}")
+        return []
+
+async def get_users_page_async(cursor: Optional[str] = None, limit: int = 100, include_total: bool = False) -> Page:
+    """
+    Obtiene usuarios con paginación por cursor sobre (created_at, id).
+    Lanza ValueError si el cursor no es válido.
+    """
+    supabase = get_async_supabase()
+    query = apply_keyset(supabase.table('users').select('*'), cursor)
+    try:
+        if include_total:
+            count_query = supabase.table('users').select('id', count='estimated', head=True)
+            response, count_response = await asyncio.gather(query.limit(limit + 1).execute(), count_query.execute())
+        else:
+            response, count_response = await query.limit(limit + 1).execute(), None
+    except Exception as e:
+        logger.error(f"Error getting users page: {e}")
+        return Page(items=[])
+    rows = response.data or []
+    return Page(
+        items=[User(**user_data) for user_data in rows[:limit]],
+        next_cursor=next_cursor(rows, limit),
+        total=count_response.count if count_response else None,
+    )
+
+async def create_user_async(user: UserCreate) -> Optional[User]:
+    """Crea un nuevo usuario"""
+    try:
+        logger.info(f"Iniciando creación de usuario: {user.email}")
+        supabase = get_async_supabase()
+
+        # Crear usuario en auth.users primero
+        auth_response = await supabase.auth.admin.create_user({
+            "email": user.email,
+            "password": user.password,
+            "email_confirm": False  # No confirmar automáticamente el email
+        })
+
+        if not auth_response.user:
+            logger.error("Failed to create auth user - auth_response.user is None")
+            return None
+
+        user_id = auth_response.user.id
+        logger.info(f"Usuario creado en auth.users con ID: {user_id}")
+
+        # Crear usuario en la tabla users con el ID correcto
+        user_data = {
+            "id": user_id,
+            "email": user.email,
+            "name": user.name,
+            "role": user.role.value,
+            "avatar_url": None
+        }
+
+        response = await supabase.table('users').insert(user_data).execute()
+
+        if response.data:
+            logger.info(f"Usuario creado exitosamente en tabla users")
+            return User(**response.data[0])
+        else:
+            logger.error(f"No se pudo insertar en tabla users: {response}")
+            # Si falla la inserción en users, eliminar el usuario de auth.users
+            try:
+                await supabase.auth.admin.delete_user(user_id)
+                logger.info(f"Usuario eliminado de auth.users después de fallo en users")
+            except Exception as cleanup_error:
+                logger.error(f"Error al limpiar usuario de auth.users: {cleanup_error}")
+            return None
+
+    except Exception as e:
+        logger.error(f"Error creating user {user.email}: {str(e)}")
+        import traceback
+        logger.error(f"Traceback: {traceback.format_exc()}")
+        return None
+
+async def update_user_async(user_id: str, user_update: UserUpdate) -> Optional[User]:
+    """Actualiza un usuario"""
+    try:
+        supabase = get_async_supabase()
+
+        update_data = user_update.dict(exclude_unset=True)
+        if not update_data:
+            return await get_user_async(user_id)
+
+        response = await supabase.table('users').update(with_token_version(update_data)).eq('id', user_id).execute()
+        invalidate_cached_user(user_id)
+
+        if response.data:
+            return User(**response.data[0])
+        return None
+    except Exception as e:
+        logger.error(f"Error updating user: {e}")
+        return None
+
+async def delete_user_async(user_id: str) -> bool:
+    """Elimina un usuario"""
+    try:
+        supabase = get_async_supabase()
+
+        # Eliminar de la tabla users
+        await supabase.table('users').delete().eq('id', user_id).execute()
+        invalidate_cached_user(user_id)
+
+        # Eliminar de auth.users
+        await supabase.auth.admin.delete_user(user_id)
+
+        return True
+    except Exception as e:
+        logger.error(f"Error deleting user: {e}")
+        return False
+
+async def authenticate_user_async(email: str, password: str) -> Optional[User]:
+    """Autentica un usuario con email y contraseña usando Supabase Auth"""
+    try:
+        # Usar el cliente de Supabase (no el admin)
+        supabase = get_async_supabase_client()
+
+        auth_response = await supabase.auth.sign_in_with_password({
+            "email": email,
+            "password": password
+        })
+
+        if auth_response.user:
+            # Verificar que el email esté confirmado
+            if not auth_response.user.email_confirmed_at:
+                logger.warning(f"Usuario no ha confirmado su email: {email}")
+                return None
+
+            # Obtener datos adicionales del usuario desde la tabla users
+            user = await get_user_by_email_async(email)
+            if user:
+                return user
+            else:
+                logger.warning(f"Usuario autenticado pero no encontrado en tabla users: {email}")
+                return None
+        else:
+            logger.warning(f"Autenticación fallida para: {email}")
+            return None
+
+    except Exception as e:
+        logger.error(f"Error authenticating user {email}: {e}")
+        return None
@@ -1,9 +1,18 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.core.config import settings
+import asyncio
+from app.core.supabase import init_async_supabase, close_async_supabase
+from app.services.catalog import run_catalog_refresher
+from app.services.reference_data import run_reference_data_refresher
+from app.services.achievements import run_achievement_flusher
+from app.services.review import run_review_flusher
+from app.services.user_stats import run_user_stats_checkpointer
+from app.services.write_behind import progress_writer
 from app.api.auth import router as auth_router
 from app.api.exercises import router as exercises_router
 from app.api.dashboard import router as dashboard_router
+from app.api.progress import router as progress_router
 
 app = FastAPI(
     title=settings.project_name,
@@ -17,12 +26,46 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Next-Cursor", "X-Total-Count", "X-Duplicate-Candidates"],
 )
 
 # Incluir routers
 app.include_router(auth_router, prefix=f"{settings.api_v1_str}/auth", tags=["auth"])
 app.include_router(exercises_router, prefix=f"{settings.api_v1_str}/exercises", tags=["exercises"])
 app.include_router(dashboard_router, prefix=f"{settings.api_v1_str}/dashboard", tags=["dashboard"])
+app.include_router(progress_router, prefix=f"{settings.api_v1_str}/progress", tags=["progress"])
+
+# Tareas en segundo plano que viven mientras la aplicación está arrancada
+background_tasks = []
+
+@app.on_event("startup")
+async def startup():
+    # Lo primero: el log de progreso solo admite un proceso y su bloqueo hace fallar el
+    # arranque de un segundo worker. Estadísticas, repasos y logros también viven en
+    # memoria y se guardan como filas completas, así que dependen de esa garantía
+    progress_writer.replay()
+    # Cliente asíncrono de Supabase compartido por toda la aplicación
+    await init_async_supabase()
+    # Catálogo de ejercicios en memoria (carga inicial y sondeo de cambios)
+    background_tasks.append(asyncio.create_task(run_catalog_refresher()))
+    # Materias, temas y logros en memoria (recarga periódica)
+    background_tasks.append(asyncio.create_task(run_reference_data_refresher()))
+    # Estados de repaso espaciado (escritura por lotes)
+    background_tasks.append(asyncio.create_task(run_review_flusher()))
+    # Respuestas de los alumnos: lo recuperado del log se vuelca por lotes
+    background_tasks.append(asyncio.create_task(progress_writer.run()))
+    # Agregados por usuario (guardado periódico en user_stats)
+    background_tasks.append(asyncio.create_task(run_user_stats_checkpointer()))
+    # Logros desbloqueados (escritura por lotes)
+    background_tasks.append(asyncio.create_task(run_achievement_flusher()))
+
+@app.on_event("shutdown")
+async def shutdown():
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    background_tasks.clear()
+    await close_async_supabase()
 
 @app.get("/")
 def read_root():
@@ -1,14 +1,17 @@
 from pydantic import BaseModel, Field
-from typing import Optional, List, Literal
+from typing import Dict, Optional, List, Literal
 from uuid import UUID
 from datetime import datetime
 
+ExerciseType = Literal['multiple_choice', 'open_ended', 'true_false', 'matching']
+ExerciseDifficulty = Literal['easy', 'medium', 'hard']
+
 class ExerciseBase(BaseModel):
     title: str
     description: Optional[str] = None
     content: str
-    type: Literal['multiple_choice', 'open_ended', 'true_false', 'matching']
-    difficulty: Literal['easy', 'medium', 'hard'] = 'medium'
+    type: ExerciseType
+    difficulty: ExerciseDifficulty = 'medium'
     subject_id: Optional[UUID] = None
     topic_id: Optional[UUID] = None
     options: Optional[dict] = None  # Para preguntas de opción múltiple, etc.
@@ -24,8 +27,8 @@ class ExerciseUpdate(BaseModel):
     title: Optional[str] = None
     description: Optional[str] = None
     content: Optional[str] = None
-    type: Optional[Literal['multiple_choice', 'open_ended', 'true_false', 'matching']] = None
-    difficulty: Optional[Literal['easy', 'medium', 'hard']] = None
+    type: Optional[ExerciseType] = None
+    difficulty: Optional[ExerciseDifficulty] = None
     subject_id: Optional[UUID] = None
     topic_id: Optional[UUID] = None
     options: Optional[dict] = None
@@ -41,4 +44,57 @@ class Exercise(ExerciseBase):
     updated_at: Optional[datetime] = None
 
     class Config:
-        orm_mode = True 
\ No newline at end of file
+        orm_mode = True
+
+class ExerciseSummary(BaseModel):
+    """Proyección ligera de un ejercicio para listados"""
+    id: UUID
+    title: str
+    type: ExerciseType
+    difficulty: ExerciseDifficulty = 'medium'
+    subject_id: Optional[UUID] = None
+    topic_id: Optional[UUID] = None
+    points: Optional[int] = 10
+    created_at: Optional[datetime] = None
+
+    class Config:
+        orm_mode = True
+
+class ExerciseSearchHit(ExerciseSummary):
+    """Resultado de búsqueda: proyección del ejercicio más su puntuación BM25"""
+    score: float
+
+class ExerciseCounts(BaseModel):
+    """Número de ejercicios de un nodo del temario, desglosado por dificultad y tipo"""
+    total: int = 0
+    by_difficulty: Dict[str, int] = {}
+    by_type: Dict[str, int] = {}
+
+class PracticeSessionCreate(BaseModel):
+    subject_id: Optional[UUID] = None
+    topic_id: Optional[UUID] = None
+    difficulty: Optional[ExerciseDifficulty] = None
+    size: int = Field(10, ge=1, le=100)
+    # Cuántos ejercicios devolver ya en la respuesta (por defecto, todos)
+    batch_size: Optional[int] = Field(None, ge=0, le=100)
+    exclude: List[UUID] = []
+
+class PracticeSession(BaseModel):
+    session_id: str
+    exercises: List[Exercise]
+    remaining: int
+
+class ExerciseImportResult(BaseModel):
+    index: int
+    status: Literal['created', 'invalid', 'failed']
+    id: Optional[UUID] = None
+    errors: Optional[List[str]] = None
+    duplicates: Optional[List[UUID]] = None
+
+class ExerciseImportReport(BaseModel):
+    total: int = 0
+    created: int = 0
+    invalid: int = 0
+    failed: int = 0
+    duplicates: int = 0
+    results: List[ExerciseImportResult] = []
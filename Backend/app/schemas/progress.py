@@ -0,0 +1,36 @@
+from pydantic import BaseModel
+from typing import Any, List, Optional
+from uuid import UUID
+from datetime import datetime
+
+class AnswerSubmit(BaseModel):
+    exercise_id: UUID
+    # Texto en la mayoría de tipos; objeto o lista de pares en los de relacionar
+    answer: Any = None
+    time_spent: Optional[int] = None  # Segundos
+
+class AnswerBatchSubmit(BaseModel):
+    answers: List[AnswerSubmit]
+
+class GradeResult(BaseModel):
+    exercise_id: UUID
+    is_correct: bool
+    # Fracción de acierto (crédito parcial en los ejercicios de relacionar)
+    credit: float
+    # Puntos obtenidos
+    score: int
+    correct_answer: Optional[str] = None
+    explanation: Optional[str] = None
+
+class ProgressEntry(BaseModel):
+    id: Optional[UUID] = None
+    user_id: UUID
+    exercise_id: UUID
+    answer: Optional[str] = None
+    is_correct: bool
+    score: Optional[int] = None
+    time_spent: Optional[int] = None
+    completed_at: Optional[datetime] = None
+
+    class Config:
+        orm_mode = True
@@ -1,7 +1,9 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
 from uuid import UUID
 from datetime import datetime
+from app.schemas.exercise import ExerciseCounts
+from app.schemas.topic import TopicNode
 
 class SubjectBase(BaseModel):
     name: str
@@ -24,4 +26,9 @@ class Subject(SubjectBase):
     updated_at: Optional[datetime] = None
 
     class Config:
-        orm_mode = True 
\ No newline at end of file
+        orm_mode = True
+
+class SubjectNode(Subject):
+    """Materia con sus temas y el recuento de ejercicios de cada nodo"""
+    exercises: ExerciseCounts = ExerciseCounts()
+    topics: List[TopicNode] = []
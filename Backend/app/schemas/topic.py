@@ -2,6 +2,7 @@ from pydantic import BaseModel
 from typing import Optional
 from uuid import UUID
 from datetime import datetime
+from app.schemas.exercise import ExerciseCounts
 
 class TopicBase(BaseModel):
     name: str
@@ -24,4 +25,7 @@ class Topic(TopicBase):
     updated_at: Optional[datetime] = None
 
     class Config:
-        orm_mode = True 
\ No newline at end of file
+        orm_mode = True
+
+class TopicNode(Topic):
+    exercises: ExerciseCounts = ExerciseCounts()
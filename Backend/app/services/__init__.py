@@ -0,0 +1 @@
+# In-memory services built on top of the CRUD layer
\ No newline at end of file
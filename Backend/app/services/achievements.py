@@ -0,0 +1,267 @@
+import asyncio
+import logging
+from bisect import bisect_right
+from datetime import datetime, timezone
+from typing import Any, Dict, List, NamedTuple, Optional, Set, Tuple
+from app.core.batching import dead_letter, write_batches
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.core.supabase import get_async_supabase
+from app.core.tasks import SingleFlight, run_periodically
+from app.services.dashboard_cache import invalidate_summary
+from app.services.reference_data import ReferenceSnapshot, reference_data
+from app.services.user_stats import Counters, StatsUpdate, UserStats
+
+logger = logging.getLogger(__name__)
+
+TABLE_NAME = 'user_achievements'
+PAGE_SIZE = 1000
+
+# Métricas que puede usar un criterio y nombres alternativos aceptados en `criteria`
+METRICS = ('attempts', 'correct', 'points', 'time_spent', 'correct_streak', 'daily_streak')
+METRIC_ALIASES = {
+    'exercises': 'attempts',
+    'answers': 'attempts',
+    'correct_answers': 'correct',
+    'completed': 'correct',
+    'score': 'points',
+    'streak': 'daily_streak',
+    'days': 'daily_streak',
+}
+THRESHOLD_KEYS = ('count', 'min', 'value', 'threshold')
+# Solo hay totales de la racha de días; el resto también existe por materia
+SUBJECT_METRICS = frozenset(METRICS) - {'daily_streak'}
+
+class Criterion(NamedTuple):
+    """Condición «métrica >= umbral», global o limitada a una materia"""
+    metric: str
+    threshold: int
+    subject_id: Optional[str] = None
+
+    @property
+    def key(self) -> Tuple[str, Optional[str]]:
+        return self.metric, self.subject_id
+
+class AchievementRule(NamedTuple):
+    achievement_id: str
+    criteria: Tuple[Criterion, ...]
+
+    def satisfied(self, stats: UserStats) -> bool:
+        return all(metric_value(stats, criterion.metric, criterion.subject_id) >= criterion.threshold
+                   for criterion in self.criteria)
+
+def metric_value(stats: UserStats, metric: str, subject_id: Optional[str] = None) -> int:
+    if metric == 'daily_streak':
+        return stats.current_streak
+    counters: Optional[Counters] = stats.by_subject.get(subject_id) if subject_id else stats.totals
+    return getattr(counters, metric) if counters is not None else 0
+
+def _criterion(data: Any) -> Criterion:
+    if not isinstance(data, dict):
+        raise ValueError("cada condición debe ser un objeto")
+    metric = data.get('metric') or data.get('type')
+    metric = METRIC_ALIASES.get(metric, metric)
+    if metric not in METRICS:
+        raise ValueError(f"métrica desconocida: {metric!r} (válidas: {', '.join(METRICS)})")
+    threshold = next((data[key] for key in THRESHOLD_KEYS if key in data), None)
+    if isinstance(threshold, bool) or not isinstance(threshold, (int, float)) or threshold < 1:
+        raise ValueError(f"la condición '{metric}' necesita un umbral positivo en 'count'")
+    subject_id = data.get('subject_id')
+    if subject_id and metric not in SUBJECT_METRICS:
+        raise ValueError(f"la métrica '{metric}' no admite 'subject_id'")
+    return Criterion(metric, int(threshold), str(subject_id) if subject_id else None)
+
+def compile_criteria(criteria: Any) -> Optional[Tuple[Criterion, ...]]:
+    """
+    Traduce el campo `criteria` de un logro a condiciones tipadas; None si no tiene
+    (logro que se concede a mano). Formatos aceptados:
+    {"metric": "correct", "count": 10, "subject_id": "..."} o {"all": [condición, ...]}.
+    Lanza ValueError si el criterio no es válido.
+    """
+    if criteria in (None, {}, []):
+        return None
+    if isinstance(criteria, dict) and 'all' in criteria:
+        items = criteria['all']
+        if not isinstance(items, list) or not items:
+            raise ValueError("'all' debe ser una lista de condiciones no vacía")
+        return tuple(_criterion(item) for item in items)
+    return (_criterion(criteria),)
+
+class RuleIndex:
+    """
+    Reglas indexadas por (métrica, materia) y ordenadas por umbral: ante una respuesta
+    solo se evalúan las reglas con algún umbral que la respuesta acaba de cruzar. Una
+    regla con varias condiciones se cumple justo cuando cruza la última, así que basta
+    con eso para no perder ninguna.
+    """
+
+    def __init__(self, rules: List[AchievementRule]):
+        self.rules = rules
+        entries: Dict[Tuple[str, Optional[str]], List[Tuple[int, int]]] = {}
+        for position, rule in enumerate(rules):
+            for criterion in rule.criteria:
+                entries.setdefault(criterion.key, []).append((criterion.threshold, position))
+        self._thresholds: Dict[Tuple[str, Optional[str]], List[int]] = {}
+        self._positions: Dict[Tuple[str, Optional[str]], List[int]] = {}
+        for key, items in entries.items():
+            items.sort()
+            self._thresholds[key] = [threshold for threshold, _ in items]
+            self._positions[key] = [position for _, position in items]
+
+    def candidates(self, before: UserStats, after: UserStats, subject_id: Optional[str]) -> Set[int]:
+        """Posiciones de las reglas con algún umbral en (antes, después] para la materia de la respuesta"""
+        found: Set[int] = set()
+        for metric in METRICS:
+            scopes = (None, subject_id) if subject_id and metric in SUBJECT_METRICS else (None,)
+            for scope in scopes:
+                thresholds = self._thresholds.get((metric, scope))
+                if thresholds:
+                    start = bisect_right(thresholds, metric_value(before, metric, scope))
+                    end = bisect_right(thresholds, metric_value(after, metric, scope))
+                    found.update(self._positions[(metric, scope)][start:end])
+        return found
+
+def build_rules(snapshot: Optional[ReferenceSnapshot]) -> RuleIndex:
+    rules = []
+    for row in snapshot.rows['achievements'] if snapshot is not None else ():
+        try:
+            criteria = compile_criteria(row.get('criteria'))
+        except ValueError as e:
+            logger.warning(f"Criterio no válido en el logro {row.get('id')}: {e}")
+            continue
+        if criteria:
+            rules.append(AchievementRule(str(row['id']), criteria))
+    return RuleIndex(rules)
+
+class AchievementEngine:
+    """
+    Evalúa los logros de forma incremental con cada respuesta. Los logros ya obtenidos
+    por cada usuario se cargan bajo demanda desde `user_achievements` y los nuevos se
+    escriben por lotes desde una tarea en segundo plano.
+    La primera respuesta de un usuario con cada versión de las reglas las evalúa todas,
+    de modo que los logros creados o cambiados también se conceden por el progreso previo.
+    """
+
+    def __init__(self):
+        self._snapshot: Optional[ReferenceSnapshot] = None
+        self._index = RuleIndex([])
+        self._generation = 0
+        # Versión de las reglas con la que se evaluaron todas para cada usuario
+        self._evaluated = TTLCache(maxsize=settings.achievements_cache_max_users, ttl=settings.achievements_cache_ttl_seconds)
+        self._unlocked = TTLCache(maxsize=settings.achievements_cache_max_users, ttl=settings.achievements_cache_ttl_seconds)
+        self._loading = SingleFlight()
+        self._pending: List[dict] = []
+        # Desbloqueos que se están escribiendo en la pasada de `flush` en curso
+        self._flushing: List[dict] = []
+        self._flush_lock = asyncio.Lock()
+
+    @property
+    def index(self) -> RuleIndex:
+        snapshot = reference_data.snapshot
+        # La foto es inmutable: se recompila solo cuando se publica otra
+        if snapshot is not self._snapshot:
+            self._index, self._snapshot = build_rules(snapshot), snapshot
+            self._generation += 1
+        return self._index
+
+    def _unsaved(self, user_id: str) -> Set[str]:
+        """Desbloqueos del usuario aún no confirmados en la BD, en escritura o pendientes"""
+        return {row['achievement_id'] for row in self._flushing + self._pending if row['user_id'] == user_id}
+
+    async def _load(self, user_id: str) -> Set[str]:
+        supabase = get_async_supabase()
+        # Se toman antes de leer: un flush que termine durante la lectura los saca de
+        # la cola, pero la página leída puede ser anterior a su escritura
+        unlocked = self._unsaved(user_id)
+        start = 0
+        while True:
+            resp = await (
+                supabase.table(TABLE_NAME).select('achievement_id')
+                .eq('user_id', user_id).order('achievement_id').range(start, start + PAGE_SIZE - 1).execute()
+            )
+            rows = resp.data or []
+            unlocked.update(str(row['achievement_id']) for row in rows)
+            if len(rows) < PAGE_SIZE:
+                break
+            start += PAGE_SIZE
+        # Y los que se hayan añadido o empezado a escribir mientras tanto
+        unlocked.update(self._unsaved(user_id))
+        self._unlocked.set(user_id, unlocked)
+        return unlocked
+
+    async def unlocked(self, user_id) -> Set[str]:
+        key = str(user_id)
+        unlocked = self._unlocked.get(key)
+        if unlocked is not None:
+            return unlocked
+        return await self._loading.run(key, lambda: self._load(key))
+
+    async def on_answer(self, user_id, update: StatsUpdate, subject_id) -> List[str]:
+        """
+        Comprueba las reglas que puede haber activado una respuesta (la diferencia entre
+        los agregados antes y después de sumarla) y devuelve los logros desbloqueados.
+        """
+        index = self.index
+        key = str(user_id)
+        generation = self._generation
+        full = self._evaluated.get(key) != generation
+        if full:
+            candidates = set(range(len(index.rules)))
+        else:
+            candidates = index.candidates(update.before, update.after, str(subject_id) if subject_id else None)
+        if not candidates:
+            return []
+        try:
+            unlocked = await self.unlocked(key)
+        except Exception as e:
+            logger.error(f"Error cargando los logros del usuario {key}: {e}")
+            return []
+        if full:
+            self._evaluated.set(key, generation)
+        stats = update.after
+        unlocked_at = datetime.now(timezone.utc).isoformat()
+        new = []
+        for position in sorted(candidates):
+            rule = index.rules[position]
+            if rule.achievement_id not in unlocked and rule.satisfied(stats):
+                unlocked.add(rule.achievement_id)
+                new.append(rule.achievement_id)
+                self._pending.append({'user_id': key, 'achievement_id': rule.achievement_id, 'unlocked_at': unlocked_at})
+        return new
+
+    async def flush(self) -> int:
+        """Escribe los desbloqueos pendientes en lotes e invalida el dashboard de esos usuarios"""
+        async with self._flush_lock:
+            if not self._pending:
+                return 0
+            rows, self._pending = self._pending, []
+            self._flushing = rows
+            supabase = get_async_supabase()
+
+            async def upsert(chunk: List[dict]) -> None:
+                await supabase.table(TABLE_NAME).upsert(
+                    chunk, on_conflict='user_id,achievement_id', ignore_duplicates=True
+                ).execute()
+                # El resumen lee los logros de la BD: se invalida cuando ya están escritos
+                for user_id in {row['user_id'] for row in chunk}:
+                    invalidate_summary(user_id)
+
+            try:
+                outcome = await write_batches(rows, upsert, settings.achievements_flush_batch_size, "logros desbloqueados")
+            finally:
+                self._flushing = []
+            dead_letter(TABLE_NAME, outcome.rejected)
+            self._pending[:0] = outcome.remaining
+            return len(outcome.written)
+
+    def stats(self) -> dict:
+        return {"rules": len(self.index.rules), "pending": len(self._pending), **self._unlocked.stats()}
+
+achievement_engine = AchievementEngine()
+
+async def run_achievement_flusher() -> None:
+    """Tarea en segundo plano: escribe por lotes los logros desbloqueados"""
+    await run_periodically(
+        "logros", lambda: settings.achievements_flush_interval_seconds,
+        achievement_engine.flush, on_stop=achievement_engine.flush,
+    )
@@ -0,0 +1,218 @@
+import math
+import threading
+from typing import Dict, Iterable, List, Optional
+import numpy as np
+from app.core.bitmap import Bitmap
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.schemas.exercise import Exercise
+from app.services.catalog import catalog
+from app.services.progress_sets import progress_sets
+from app.services.sessions import recently_served
+
+# Dificultad inicial (escala logit) según la etiqueta del ejercicio
+DIFFICULTY_PRIORS = {'easy': -1.0, 'medium': 0.0, 'hard': 1.0}
+
+# Paso de actualización de Elo: grande mientras hay pocas respuestas y decreciente después
+K_INITIAL = 0.4
+K_MIN = 0.05
+K_DECAY = 0.05
+
+# Entre los ejercicios más cercanos a la dificultad objetivo se elige uno al azar
+SELECTION_POOL = 5
+
+def _k(answers: float) -> float:
+    return max(K_MIN, K_INITIAL / (1 + K_DECAY * answers))
+
+def _logit(p: float) -> float:
+    return math.log(p / (1 - p))
+
+class AdaptiveEngine:
+    """
+    Modelo de Rasch (IRT 1PL) ajustado en línea con actualizaciones tipo Elo.
+    La dificultad de cada ejercicio vive en arrays de NumPy indexados por su ordinal
+    en el catálogo, junto con los códigos de materia/tema, de modo que elegir el
+    ejercicio más próximo a la probabilidad de acierto objetivo es una sola
+    operación vectorizada sobre todo el catálogo.
+    Las dificultades aprendidas no se guardan: tras reiniciar se parte otra vez de la
+    etiqueta de cada ejercicio. La habilidad de los alumnos sí se recupera, porque se
+    estima desde su historial la primera vez que se necesita.
+    """
+
+    def __init__(self, capacity: int = 1024):
+        self._lock = threading.RLock()
+        self.difficulty = np.zeros(capacity, dtype=np.float64)
+        self.item_answers = np.zeros(capacity, dtype=np.float64)
+        self.present = np.zeros(capacity, dtype=bool)
+        self.subject_code = np.zeros(capacity, dtype=np.int32)
+        self.topic_code = np.zeros(capacity, dtype=np.int32)
+        # 0 significa "sin materia/tema"
+        self._codes: Dict[str, int] = {}
+        # Habilidad por usuario: [theta, número de respuestas]
+        self._abilities = TTLCache(maxsize=settings.progress_sets_max_users, ttl=settings.progress_sets_ttl_seconds)
+
+    def _code(self, value) -> int:
+        if value is None:
+            return 0
+        return self._codes.setdefault(str(value), len(self._codes) + 1)
+
+    def _ensure(self, ordinal: int) -> None:
+        capacity = len(self.difficulty)
+        if ordinal < capacity:
+            return
+        new_capacity = max(ordinal + 1, capacity * 2)
+        for name in ('difficulty', 'item_answers', 'present', 'subject_code', 'topic_code'):
+            array = getattr(self, name)
+            grown = np.zeros(new_capacity, dtype=array.dtype)
+            grown[:capacity] = array
+            setattr(self, name, grown)
+
+    # --- Sincronización con el catálogo ---
+
+    def on_upsert(self, exercise: Exercise) -> None:
+        ordinal = catalog.ordinal(exercise.id)
+        with self._lock:
+            self._ensure(ordinal)
+            # Hasta que tenga respuestas, la dificultad sigue a la etiqueta
+            if self.item_answers[ordinal] == 0:
+                self.difficulty[ordinal] = DIFFICULTY_PRIORS.get(exercise.difficulty, 0.0)
+            self.present[ordinal] = True
+            self.subject_code[ordinal] = self._code(exercise.subject_id)
+            self.topic_code[ordinal] = self._code(exercise.topic_id)
+
+    def on_remove(self, exercise_id: str) -> None:
+        ordinal = catalog.ordinal(exercise_id, create=False)
+        with self._lock:
+            if ordinal is not None and ordinal < len(self.present):
+                self.present[ordinal] = False
+
+    def on_reset(self, exercises: List[Exercise]) -> None:
+        with self._lock:
+            self.present[:] = False
+            for exercise in exercises:
+                self.on_upsert(exercise)
+
+    # --- Habilidad de los alumnos ---
+
+    def estimate_ability(self, attempted: Bitmap, completed: Bitmap) -> float:
+        """
+        Estimación de máxima verosimilitud (con un prior N(0, 1)) de la habilidad
+        a partir del historial, con unas pocas iteraciones de Newton vectorizadas.
+        """
+        ordinals = np.fromiter(attempted, dtype=np.int64)
+        if not len(ordinals):
+            return 0.0
+        with self._lock:
+            ordinals = ordinals[ordinals < len(self.difficulty)]
+            b = self.difficulty[ordinals]
+        correct = np.fromiter((ordinal in completed for ordinal in ordinals), dtype=np.float64, count=len(ordinals))
+        theta = 0.0
+        for _ in range(10):
+            p = 1 / (1 + np.exp(b - theta))
+            gradient = float(np.sum(correct - p)) - theta
+            hessian = -float(np.sum(p * (1 - p))) - 1
+            step = gradient / hessian
+            theta -= step
+            if abs(step) < 1e-4:
+                break
+        return theta
+
+    def has_ability(self, user_id) -> bool:
+        return self._abilities.get(str(user_id)) is not None
+
+    def ability(self, user_id, progress=None) -> float:
+        """
+        Habilidad actual del usuario; si no está en memoria se estima desde su historial.
+        Sin historial (`progress` None porque no se pudo cargar) se devuelve 0 sin guardarlo,
+        para volver a estimarla en cuanto el historial esté disponible.
+        """
+        state = self._abilities.get(str(user_id))
+        if state is None:
+            if progress is None:
+                return 0.0
+            state = [self.estimate_ability(progress.attempted, progress.completed), len(progress.attempted)]
+            self._abilities.set(str(user_id), state)
+        return state[0]
+
+    def record_answer(self, user_id, exercise_id, correct: bool) -> None:
+        """
+        Actualización Elo en línea de la habilidad del alumno y la dificultad del ejercicio.
+        La habilidad debe estar ya en memoria (ver `ensure_ability`); si no se pudo
+        estimar, la respuesta se ignora aquí: ya está en el historial y entrará en la
+        próxima estimación.
+        """
+        ordinal = catalog.ordinal(exercise_id)
+        with self._lock:
+            self._ensure(ordinal)
+            state = self._abilities.get(str(user_id))
+            if state is None:
+                return
+            theta, answers = state
+            b = self.difficulty[ordinal]
+            surprise = float(correct) - 1 / (1 + math.exp(b - theta))
+            state[0] = theta + _k(answers) * surprise
+            state[1] = answers + 1
+            self.difficulty[ordinal] = b - _k(self.item_answers[ordinal]) * surprise
+            self.item_answers[ordinal] += 1
+
+    # --- Selección ---
+
+    def select(self, theta: float, n: int = 1, subject_id=None, topic_id=None,
+               exclude_ordinals: Iterable[int] = (), target: Optional[float] = None) -> List[int]:
+        """
+        Ordinales de los `n` ejercicios cuya probabilidad de acierto estimada está más
+        cerca de `target` (por defecto ADAPTIVE_TARGET_SUCCESS), eligiendo al azar entre
+        los SELECTION_POOL mejores para no repetir siempre el mismo.
+        """
+        target = settings.adaptive_target_success if target is None else target
+        wanted = theta - _logit(target)
+        with self._lock:
+            mask = self.present.copy()
+            if subject_id is not None:
+                mask &= self.subject_code == self._codes.get(str(subject_id), -1)
+            if topic_id is not None:
+                mask &= self.topic_code == self._codes.get(str(topic_id), -1)
+            excluded = np.fromiter(exclude_ordinals, dtype=np.int64)
+            excluded = excluded[excluded < len(mask)]
+            mask[excluded] = False
+            candidates = np.flatnonzero(mask)
+            if not len(candidates):
+                return []
+            distance = np.abs(self.difficulty[candidates] - wanted)
+        pool = min(len(candidates), max(n, SELECTION_POOL))
+        nearest = candidates[np.argpartition(distance, pool - 1)[:pool]]
+        chosen = np.random.choice(nearest, size=min(n, len(nearest)), replace=False)
+        return [int(ordinal) for ordinal in chosen]
+
+adaptive_engine = AdaptiveEngine()
+catalog.subscribe(adaptive_engine)
+
+async def ensure_ability(user_id) -> float:
+    """
+    Habilidad del usuario, estimándola desde su historial si no está en memoria (tras
+    un reinicio o si caducó). Debe llamarse antes de registrar respuestas nuevas para
+    que la estimación no las cuente dos veces.
+    """
+    if adaptive_engine.has_ability(user_id):
+        return adaptive_engine.ability(user_id)
+    return adaptive_engine.ability(user_id, await progress_sets.get(user_id))
+
+def sample_adaptive(user_id, n: int = 1, progress=None, subject_id=None, topic_id=None) -> List[Exercise]:
+    """
+    Ejercicios adaptados a la habilidad del alumno. Como en el muestreo aleatorio, se
+    evitan primero los resueltos y los servidos recientemente, y solo se relajan esas
+    exclusiones si no queda ningún candidato.
+    """
+    theta = adaptive_engine.ability(user_id, progress)
+    completed = list(progress.completed) if progress is not None else []
+    recent = [catalog.ordinal(exercise_id, create=False) for exercise_id in recently_served(user_id)]
+    recent = [ordinal for ordinal in recent if ordinal is not None]
+    for excluded in (completed + recent, completed, []):
+        ordinals = adaptive_engine.select(
+            theta, n, subject_id=subject_id, topic_id=topic_id, exclude_ordinals=excluded
+        )
+        exercises = [catalog.get(catalog.exercise_id_at(ordinal)) for ordinal in ordinals]
+        exercises = [exercise for exercise in exercises if exercise is not None]
+        if exercises:
+            return exercises
+    return []
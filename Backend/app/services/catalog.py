@@ -0,0 +1,261 @@
+import asyncio
+import itertools
+import logging
+import random
+import threading
+from datetime import datetime
+from typing import Container, Dict, Iterable, List, Optional, Protocol, Tuple, get_args
+from app.core.config import settings
+from app.core.http_cache import table_versions
+from app.schemas.exercise import Exercise, ExerciseDifficulty, ExerciseType
+
+logger = logging.getLogger(__name__)
+
+# Comodín para las dimensiones del índice que no se filtran
+ANY = "*"
+
+BucketKey = Tuple[str, str, str, str]
+
+DIFFICULTIES: Tuple[str, ...] = get_args(ExerciseDifficulty)
+TYPES: Tuple[str, ...] = get_args(ExerciseType)
+
+class CatalogListener(Protocol):
+    """Índices derivados que se mantienen sincronizados con el catálogo"""
+
+    def on_upsert(self, exercise: Exercise) -> None: ...
+
+    def on_remove(self, exercise_id: str) -> None: ...
+
+    def on_reset(self, exercises: List[Exercise]) -> None: ...
+
+def _dim(value) -> Optional[str]:
+    return str(value) if value is not None else None
+
+class ExerciseCatalog:
+    """
+    Catálogo en memoria de ejercicios indexado por (subject_id, topic_id, difficulty, type).
+    Cada ejercicio se registra en las 16 combinaciones de esas dimensiones con comodín,
+    de modo que cualquier filtro se resuelve con un único bucket y el muestreo
+    uniforme es O(1). Las bajas usan swap-remove para mantener los buckets densos.
+    """
+
+    def __init__(self):
+        self._exercises: Dict[str, Exercise] = {}
+        self._buckets: Dict[BucketKey, List[str]] = {}
+        self._positions: Dict[BucketKey, Dict[str, int]] = {}
+        self._lock = threading.RLock()
+        self._listeners: List[CatalogListener] = []
+        # Ordinales densos y estables durante la vida del proceso (no se reutilizan)
+        self._ordinals: Dict[str, int] = {}
+        self._ids_by_ordinal: List[str] = []
+        self.loaded = False
+        self.watermark: Optional[datetime] = None
+        self.version = 0
+
+    def __len__(self) -> int:
+        return len(self._exercises)
+
+    @staticmethod
+    def _index_keys(exercise: Exercise) -> Iterable[BucketKey]:
+        dims = (_dim(exercise.subject_id), _dim(exercise.topic_id), exercise.difficulty, exercise.type)
+        return itertools.product(*((value, ANY) for value in dims))
+
+    @staticmethod
+    def query_key(subject_id=None, topic_id=None, difficulty=None, type=None) -> BucketKey:
+        """Clave de bucket para un filtro; None significa 'cualquiera'"""
+        return tuple(ANY if value is None else str(value) for value in (subject_id, topic_id, difficulty, type))
+
+    def subscribe(self, listener: CatalogListener) -> None:
+        """Registra un índice derivado; si el catálogo ya está cargado se le pasa el contenido actual"""
+        with self._lock:
+            self._listeners.append(listener)
+            if self.loaded:
+                listener.on_reset(list(self._exercises.values()))
+
+    def ordinal(self, exercise_id, create: bool = True) -> Optional[int]:
+        """
+        Entero denso asociado a un ejercicio, para estructuras indexadas por posición
+        (bitmaps, arrays). Con `create=False` devuelve None si aún no tiene ordinal.
+        """
+        exercise_id = str(exercise_id)
+        ordinal = self._ordinals.get(exercise_id)
+        if ordinal is None and create:
+            with self._lock:
+                ordinal = self._ordinals.get(exercise_id)
+                if ordinal is None:
+                    ordinal = self._ordinals[exercise_id] = len(self._ids_by_ordinal)
+                    self._ids_by_ordinal.append(exercise_id)
+        return ordinal
+
+    def exercise_id_at(self, ordinal: int) -> str:
+        return self._ids_by_ordinal[ordinal]
+
+    @property
+    def ordinal_count(self) -> int:
+        return len(self._ids_by_ordinal)
+
+    def _add(self, exercise: Exercise) -> None:
+        exercise_id = str(exercise.id)
+        self.ordinal(exercise_id)
+        self._exercises[exercise_id] = exercise
+        for key in self._index_keys(exercise):
+            bucket = self._buckets.setdefault(key, [])
+            self._positions.setdefault(key, {})[exercise_id] = len(bucket)
+            bucket.append(exercise_id)
+
+    def _discard(self, exercise_id: str) -> None:
+        exercise = self._exercises.pop(exercise_id, None)
+        if exercise is None:
+            return
+        for key in self._index_keys(exercise):
+            bucket = self._buckets[key]
+            positions = self._positions[key]
+            pos = positions.pop(exercise_id)
+            last = bucket.pop()
+            if last != exercise_id:
+                bucket[pos] = last
+                positions[last] = pos
+            if not bucket:
+                del self._buckets[key]
+                del self._positions[key]
+
+    def upsert(self, exercise: Exercise) -> None:
+        """Inserta o reemplaza un ejercicio en el catálogo"""
+        with self._lock:
+            self._discard(str(exercise.id))
+            self._add(exercise)
+            self.version += 1
+            for listener in self._listeners:
+                listener.on_upsert(exercise)
+
+    def remove(self, exercise_id) -> None:
+        """Elimina un ejercicio del catálogo"""
+        with self._lock:
+            self._discard(str(exercise_id))
+            self.version += 1
+            for listener in self._listeners:
+                listener.on_remove(str(exercise_id))
+
+    def replace_all(self, exercises: Iterable[Exercise]) -> None:
+        """Reconstruye el catálogo completo (carga inicial)"""
+        with self._lock:
+            self._exercises.clear()
+            self._buckets.clear()
+            self._positions.clear()
+            for exercise in exercises:
+                self._add(exercise)
+            self.loaded = True
+            self.version += 1
+            current = list(self._exercises.values())
+            for listener in self._listeners:
+                listener.on_reset(current)
+
+    def advance_watermark(self, exercises: Iterable[Exercise]) -> None:
+        """Avanza la marca de `updated_at` usada por el sondeo incremental"""
+        for exercise in exercises:
+            if exercise.updated_at and (self.watermark is None or exercise.updated_at > self.watermark):
+                self.watermark = exercise.updated_at
+
+    def get(self, exercise_id) -> Optional[Exercise]:
+        return self._exercises.get(str(exercise_id))
+
+    def count(self, subject_id=None, topic_id=None, difficulty=None, type=None) -> int:
+        return len(self._buckets.get(self.query_key(subject_id, topic_id, difficulty, type), ()))
+
+    def breakdown(self, subject_id=None, topic_id=None) -> dict:
+        """
+        Recuento de ejercicios de un nodo (materia y/o tema) por dificultad y tipo.
+        Se lee del tamaño de los buckets, que se mantienen en cada alta y baja.
+        """
+        with self._lock:
+            by_difficulty = {d: self.count(subject_id, topic_id, difficulty=d) for d in DIFFICULTIES}
+            by_type = {t: self.count(subject_id, topic_id, type=t) for t in TYPES}
+            return {
+                "total": self.count(subject_id, topic_id),
+                "by_difficulty": {k: v for k, v in by_difficulty.items() if v},
+                "by_type": {k: v for k, v in by_type.items() if v},
+            }
+
+    def sample(self, subject_id=None, topic_id=None, difficulty=None, type=None) -> Optional[Exercise]:
+        """Devuelve un ejercicio aleatorio (uniforme) que cumpla el filtro"""
+        with self._lock:
+            bucket = self._buckets.get(self.query_key(subject_id, topic_id, difficulty, type))
+            if not bucket:
+                return None
+            return self._exercises[random.choice(bucket)]
+
+    def sample_many(self, n: int, exclude: Container[str] = (), subject_id=None, topic_id=None,
+                    difficulty=None, type=None) -> List[Exercise]:
+        """
+        Devuelve hasta `n` ejercicios distintos (sin reemplazo) que cumplan el filtro,
+        saltando los ids de `exclude`. Usa un Fisher-Yates perezoso sobre el bucket,
+        así que el coste depende de lo que se pide y no del tamaño del bucket.
+        """
+        with self._lock:
+            bucket = self._buckets.get(self.query_key(subject_id, topic_id, difficulty, type))
+            if not bucket or n <= 0:
+                return []
+            size = len(bucket)
+            swapped: Dict[int, int] = {}
+            picked: List[Exercise] = []
+            for i in range(size):
+                j = random.randrange(i, size)
+                position = swapped.get(j, j)
+                swapped[j] = swapped.get(i, i)
+                exercise_id = bucket[position]
+                if exercise_id in exclude:
+                    continue
+                picked.append(self._exercises[exercise_id])
+                if len(picked) == n:
+                    break
+            return picked
+
+catalog = ExerciseCatalog()
+
+async def load_catalog() -> None:
+    """Carga el catálogo completo desde Supabase"""
+    from app.crud.exercise import iter_exercise_pages_async
+    exercises: List[Exercise] = []
+    async for page in iter_exercise_pages_async(page_size=settings.catalog_page_size):
+        exercises.extend(page)
+    catalog.replace_all(exercises)
+    catalog.advance_watermark(exercises)
+    logger.info(f"Catálogo de ejercicios cargado: {len(catalog)} ejercicios")
+
+async def refresh_catalog() -> int:
+    """
+    Aplica los ejercicios modificados desde la última marca de `updated_at`.
+    Las bajas hechas por otros procesos no se detectan aquí; llegan con la
+    siguiente carga completa (al reiniciar) o por los hooks de escritura.
+    """
+    from app.crud.exercise import iter_exercise_pages_async
+    changed = 0
+    async for page in iter_exercise_pages_async(page_size=settings.catalog_page_size, updated_since=catalog.watermark):
+        for exercise in page:
+            current = catalog.get(exercise.id)
+            # La consulta usa >= sobre la marca: las filas del borde ya aplicadas se ignoran
+            if current is not None and current.updated_at == exercise.updated_at:
+                continue
+            catalog.upsert(exercise)
+            changed += 1
+        catalog.advance_watermark(page)
+    if changed:
+        # Cambios hechos por otros procesos: invalida los ETag de este
+        table_versions.bump('exercises')
+    return changed
+
+async def run_catalog_refresher() -> None:
+    """Tarea en segundo plano: carga inicial y sondeo periódico de cambios"""
+    while True:
+        try:
+            if not catalog.loaded:
+                await load_catalog()
+            else:
+                changed = await refresh_catalog()
+                if changed:
+                    logger.info(f"Catálogo de ejercicios actualizado: {changed} cambios")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error refrescando el catálogo de ejercicios: {e}")
+        await asyncio.sleep(settings.catalog_refresh_interval_seconds)
@@ -0,0 +1,42 @@
+import threading
+from typing import List, Optional, Tuple
+from app.services.catalog import catalog
+from app.services.reference_data import ReferenceSnapshot, reference_data
+
+class CurriculumCache:
+    """
+    Árbol materia → tema con recuentos de ejercicios. Se reconstruye solo cuando
+    cambia la versión del catálogo o la foto de datos de referencia.
+    """
+
+    def __init__(self):
+        self._key: Optional[Tuple[int, Optional[ReferenceSnapshot]]] = None
+        self._tree: List[dict] = []
+        self._lock = threading.Lock()
+
+    def get(self) -> List[dict]:
+        snapshot = reference_data.snapshot
+        key = (catalog.version, snapshot)
+        with self._lock:
+            cached_key = self._key
+            # La foto es inmutable: basta con comparar identidad
+            if cached_key is not None and cached_key[0] == key[0] and cached_key[1] is snapshot:
+                return self._tree
+        tree = build_curriculum(snapshot)
+        with self._lock:
+            self._key, self._tree = key, tree
+        return tree
+
+def build_curriculum(snapshot: ReferenceSnapshot) -> List[dict]:
+    """Construye el árbol completo a partir de la foto de referencia y los buckets del catálogo"""
+    tree = []
+    for subject in snapshot.rows['subjects']:
+        subject_id = subject['id']
+        topics = [
+            {**topic, "exercises": catalog.breakdown(subject_id=subject_id, topic_id=topic['id'])}
+            for topic in snapshot.topics_by_subject.get(str(subject_id), ())
+        ]
+        tree.append({**subject, "exercises": catalog.breakdown(subject_id=subject_id), "topics": topics})
+    return tree
+
+curriculum = CurriculumCache()
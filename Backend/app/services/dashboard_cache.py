@@ -0,0 +1,39 @@
+import json
+from typing import Any, NamedTuple, Optional
+from fastapi.encoders import jsonable_encoder
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.core.http_cache import compute_etag
+
+class CachedSummary(NamedTuple):
+    body: bytes
+    etag: str
+
+# Resúmenes de dashboard ya serializados, indexados por user_id
+summary_cache = TTLCache(
+    maxsize=settings.dashboard_cache_max_size,
+    ttl=settings.dashboard_cache_ttl_seconds,
+)
+
+def serialize_summary(summary: Any) -> CachedSummary:
+    """Serializa el resumen y calcula su ETag"""
+    body = json.dumps(jsonable_encoder(summary), separators=(",", ":")).encode()
+    return CachedSummary(body=body, etag=compute_etag(body))
+
+def get_cached_summary(user_id: str) -> Optional[CachedSummary]:
+    return summary_cache.get(str(user_id))
+
+def store_summary(user_id: str, summary: Any) -> CachedSummary:
+    """Guarda el resumen de un usuario en la caché"""
+    cached = serialize_summary(summary)
+    summary_cache.set(str(user_id), cached)
+    return cached
+
+def invalidate_summary(user_id: Optional[Any]) -> None:
+    """
+    Invalida el resumen de un usuario. Se llama cuando cambia algo que aparece
+    en el dashboard: progreso enviado, logros desbloqueados, ejercicios creados
+    o datos del propio usuario.
+    """
+    if user_id:
+        summary_cache.invalidate(str(user_id))
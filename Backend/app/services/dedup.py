@@ -0,0 +1,180 @@
+import re
+import threading
+import zlib
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+import numpy as np
+from app.core.config import settings
+from app.schemas.exercise import Exercise
+from app.services.catalog import catalog
+from app.services.search import fold
+
+# 128 permutaciones en 16 bandas de 8 filas: dos ejercicios con similitud 0.8
+# coinciden en alguna banda con probabilidad ~0.95, y con similitud 0.5 solo ~0.06
+NUM_PERMUTATIONS = 128
+LSH_BANDS = 16
+LSH_ROWS = NUM_PERMUTATIONS // LSH_BANDS
+
+# Tamaño de los n-gramas de caracteres
+SHINGLE_SIZE = 5
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+# Familia de hashes multiply-shift con semilla fija: las firmas son estables entre procesos
+_rng = np.random.default_rng(20240517)
+_HASH_A = _rng.integers(1, 2 ** 63, size=NUM_PERMUTATIONS, dtype=np.uint64) | np.uint64(1)
+_HASH_B = _rng.integers(0, 2 ** 63, size=NUM_PERMUTATIONS, dtype=np.uint64)
+
+def _option_texts(options: Any) -> List[str]:
+    if options is None:
+        return []
+    if isinstance(options, dict):
+        return [text for value in options.values() for text in _option_texts(value)]
+    if isinstance(options, (list, tuple)):
+        return [text for value in options for text in _option_texts(value)]
+    return [str(options)]
+
+def normalize_exercise_text(content: Optional[str], options: Any = None) -> str:
+    """
+    Texto canónico de un ejercicio: enunciado y opciones sin tildes, mayúsculas
+    ni puntuación. Las opciones se ordenan para que su orden no cuente.
+    """
+    parts = [content or ''] + sorted(fold(text) for text in _option_texts(options))
+    return ' '.join(_WORD_RE.findall(fold(' '.join(parts))))
+
+def minhash(text: str) -> Optional[np.ndarray]:
+    """Firma MinHash de los n-gramas de caracteres del texto (None si el texto está vacío)"""
+    if not text:
+        return None
+    if len(text) <= SHINGLE_SIZE:
+        shingles = {text}
+    else:
+        shingles = {text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)}
+    hashes = np.fromiter((zlib.crc32(s.encode()) for s in shingles), dtype=np.uint64, count=len(shingles))
+    # (a * x + b) mod 2^64, quedándose con los 32 bits altos; el desbordamiento de uint64 es intencionado
+    with np.errstate(over='ignore'):
+        permuted = (hashes[:, None] * _HASH_A + _HASH_B) >> np.uint64(32)
+    return permuted.min(axis=0).astype(np.uint32)
+
+def similarity(a: np.ndarray, b: np.ndarray) -> float:
+    """Estimación de la similitud de Jaccard a partir de dos firmas"""
+    return float(np.count_nonzero(a == b)) / NUM_PERMUTATIONS
+
+class DuplicateCandidate(NamedTuple):
+    exercise_id: str
+    similarity: float
+
+class DuplicateIndex:
+    """
+    Índice LSH sobre las firmas MinHash de los ejercicios. Los candidatos a duplicado
+    son los que comparten alguna banda de la firma, y se confirman comparando las
+    firmas completas, así que la búsqueda no depende del tamaño del catálogo.
+    """
+
+    def __init__(self, threshold: Optional[float] = None):
+        self.threshold = settings.duplicate_similarity_threshold if threshold is None else threshold
+        self._signatures: Dict[str, np.ndarray] = {}
+        self._bands: List[Dict[bytes, Set[str]]] = [{} for _ in range(LSH_BANDS)]
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._signatures)
+
+    @staticmethod
+    def _band_keys(signature: np.ndarray) -> Iterable[Tuple[int, bytes]]:
+        for band in range(LSH_BANDS):
+            yield band, signature[band * LSH_ROWS:(band + 1) * LSH_ROWS].tobytes()
+
+    def add(self, exercise_id: str, content: Optional[str], options: Any = None) -> None:
+        """Indexa (o reindexa) el texto de un ejercicio"""
+        signature = minhash(normalize_exercise_text(content, options))
+        with self._lock:
+            self.discard(exercise_id)
+            if signature is None:
+                return
+            self._signatures[exercise_id] = signature
+            for band, key in self._band_keys(signature):
+                self._bands[band].setdefault(key, set()).add(exercise_id)
+
+    def discard(self, exercise_id: str) -> None:
+        with self._lock:
+            signature = self._signatures.pop(exercise_id, None)
+            if signature is None:
+                return
+            for band, key in self._band_keys(signature):
+                bucket = self._bands[band][key]
+                bucket.discard(exercise_id)
+                if not bucket:
+                    del self._bands[band][key]
+
+    def on_upsert(self, exercise: Exercise) -> None:
+        self.add(str(exercise.id), exercise.content, exercise.options)
+
+    def on_remove(self, exercise_id: str) -> None:
+        self.discard(exercise_id)
+
+    def on_reset(self, exercises: List[Exercise]) -> None:
+        with self._lock:
+            self._signatures.clear()
+            for bands in self._bands:
+                bands.clear()
+            for exercise in exercises:
+                self.on_upsert(exercise)
+
+    def _matches(self, signature: np.ndarray, exclude: Optional[str] = None) -> List[DuplicateCandidate]:
+        candidates: Set[str] = set()
+        for band, key in self._band_keys(signature):
+            candidates.update(self._bands[band].get(key, ()))
+        candidates.discard(exclude)
+        matches = []
+        for candidate in candidates:
+            score = similarity(signature, self._signatures[candidate])
+            if score >= self.threshold:
+                matches.append(DuplicateCandidate(candidate, score))
+        matches.sort(key=lambda match: match.similarity, reverse=True)
+        return matches
+
+    def find_duplicates(self, exercise_id=None, content: Optional[str] = None, options: Any = None,
+                        limit: int = 5) -> List[DuplicateCandidate]:
+        """
+        Ejercicios probablemente duplicados. Si el ejercicio ya está indexado se usa su
+        firma (excluyéndolo del resultado); si no, se calcula a partir del texto.
+        """
+        exercise_id = str(exercise_id) if exercise_id is not None else None
+        with self._lock:
+            signature = self._signatures.get(exercise_id) if exercise_id else None
+            if signature is None:
+                signature = minhash(normalize_exercise_text(content, options))
+                if signature is None:
+                    return []
+            return self._matches(signature, exclude=exercise_id)[:limit]
+
+    def clusters(self) -> List[List[str]]:
+        """
+        Agrupa todo el índice en clústeres de duplicados (componentes conexas de los
+        pares candidatos confirmados), con union-find. Pensado para procesos offline.
+        """
+        parent: Dict[str, str] = {}
+
+        def find(item: str) -> str:
+            root = item
+            while parent.get(root, root) != root:
+                root = parent[root]
+            while item != root:
+                parent[item], item = root, parent[item]
+            return root
+
+        with self._lock:
+            for exercise_id, signature in self._signatures.items():
+                for match in self._matches(signature, exclude=exercise_id):
+                    parent.setdefault(exercise_id, exercise_id)
+                    parent.setdefault(match.exercise_id, match.exercise_id)
+                    a, b = find(exercise_id), find(match.exercise_id)
+                    if a != b:
+                        parent[max(a, b)] = min(a, b)
+            groups: Dict[str, List[str]] = {}
+            for exercise_id in parent:
+                groups.setdefault(find(exercise_id), []).append(exercise_id)
+        return sorted((sorted(group) for group in groups.values()), key=len, reverse=True)
+
+duplicate_index = DuplicateIndex()
+catalog.subscribe(duplicate_index)
@@ -0,0 +1,46 @@
+import csv
+import io
+import json
+import zlib
+from typing import AsyncIterator, List
+from app.crud.exercise import parse_options
+from app.schemas.exercise import Exercise
+
+# Columnas del export en el mismo orden que el esquema Exercise
+EXPORT_COLUMNS: List[str] = list(Exercise.__fields__)
+
+def _normalize(row: dict) -> dict:
+    return {**row, 'options': parse_options(row.get('options'))}
+
+async def ndjson_chunks(pages: AsyncIterator[List[dict]]) -> AsyncIterator[bytes]:
+    """Serializa cada página como líneas NDJSON"""
+    async for rows in pages:
+        yield "".join(
+            json.dumps(_normalize(row), ensure_ascii=False, default=str) + "\n" for row in rows
+        ).encode()
+
+async def csv_chunks(pages: AsyncIterator[List[dict]]) -> AsyncIterator[bytes]:
+    """Serializa cada página como filas CSV (las opciones van como JSON)"""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_COLUMNS, extrasaction='ignore')
+    writer.writeheader()
+    async for rows in pages:
+        for row in rows:
+            row = _normalize(row)
+            if row.get('options') is not None:
+                row['options'] = json.dumps(row['options'], ensure_ascii=False)
+            writer.writerow(row)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+async def gzip_chunks(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """Comprime un flujo de bytes en formato gzip de forma incremental"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    async for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
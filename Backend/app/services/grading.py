@@ -0,0 +1,217 @@
+import json
+import logging
+import math
+import re
+from fractions import Fraction
+from typing import Any, Callable, Dict, FrozenSet, Iterable, List, NamedTuple, Optional, Tuple
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.schemas.exercise import Exercise
+from app.services.catalog import catalog
+from app.services.search import fold
+
+logger = logging.getLogger(__name__)
+
+class Grade(NamedTuple):
+    correct: bool
+    # Fracción de la puntuación obtenida (crédito parcial en los de relacionar)
+    credit: float
+
+Matcher = Callable[[Any], Grade]
+
+CORRECT = Grade(True, 1.0)
+WRONG = Grade(False, 0.0)
+
+TRUE_WORDS = frozenset({'true', 'verdadero', 'v', 't', 'si', 'cierto', '1', 'yes'})
+FALSE_WORDS = frozenset({'false', 'falso', 'f', 'no', '0'})
+
+# Tolerancia por defecto de las respuestas numéricas (absoluta y relativa)
+ABS_TOLERANCE = 1e-6
+REL_TOLERANCE = 1e-4
+
+_SPACES_RE = re.compile(r"\s+")
+_EDGE_PUNCTUATION = " \t\n.,;:!?¡¿\"'()[]{}"
+_NUMBER_RE = re.compile(r"^[-+]?(\d+([.,]\d*)?|[.,]\d+)(e[-+]?\d+)?$")
+_FRACTION_RE = re.compile(r"^[-+]?\d+\s*/\s*\d+$")
+_PAIR_SEPARATORS_RE = re.compile(r"\s*(?:->|=>|=|:|-)\s*")
+
+def normalize_answer(value: Any) -> str:
+    """Texto comparable: sin tildes ni mayúsculas, espacios colapsados y sin puntuación en los extremos"""
+    text = fold(str(value)) if value is not None else ''
+    return _SPACES_RE.sub(' ', text).strip(_EDGE_PUNCTUATION)
+
+def parse_number(value: Any) -> Optional[float]:
+    """Número de una respuesta ('3,5', '1/2', '25%', '1e3'); None si no es numérica"""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    text = normalize_answer(value).replace(' ', '')
+    percent = text.endswith('%')
+    if percent:
+        text = text[:-1]
+    try:
+        if _FRACTION_RE.match(text):
+            number = float(Fraction(text))
+        elif _NUMBER_RE.match(text):
+            number = float(text.replace(',', '.'))
+        else:
+            return None
+    except (ValueError, ZeroDivisionError):
+        return None
+    return number / 100 if percent else number
+
+def parse_bool(value: Any) -> Optional[bool]:
+    if isinstance(value, bool):
+        return value
+    text = normalize_answer(value)
+    if text in TRUE_WORDS:
+        return True
+    if text in FALSE_WORDS:
+        return False
+    return None
+
+def _option_items(options: Any) -> List[Tuple[str, str]]:
+    """Pares (clave, texto) de las opciones; las listas se indexan como a, b, c..."""
+    if isinstance(options, dict):
+        return [(str(key), str(value)) for key, value in options.items() if not isinstance(value, (dict, list))]
+    if isinstance(options, list):
+        return [(chr(ord('a') + i), str(value)) for i, value in enumerate(options) if i < 26]
+    return []
+
+def parse_pairs(value: Any) -> FrozenSet[Tuple[str, str]]:
+    """
+    Pares de un ejercicio de relacionar. Acepta un objeto {"izq": "der"}, una lista de
+    pares o un texto 'a-1, b-2' (también con ':', '=' o '->'), en JSON o no.
+    """
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            pairs = []
+            for chunk in re.split(r"[,;\n]", value):
+                parts = _PAIR_SEPARATORS_RE.split(chunk.strip(), maxsplit=1)
+                if len(parts) == 2:
+                    pairs.append(parts)
+            value = pairs
+    if isinstance(value, dict):
+        items: Iterable = value.items()
+    elif isinstance(value, list):
+        items = [item for item in value if isinstance(item, (list, tuple)) and len(item) == 2]
+    else:
+        return frozenset()
+    return frozenset((normalize_answer(left), normalize_answer(right)) for left, right in items)
+
+def _accepting(accepted: FrozenSet[str]) -> Matcher:
+    # Sin clave no hay respuesta correcta: una respuesta vacía no debe darse por buena
+    accepted = accepted - {''}
+    if not accepted:
+        return lambda answer: WRONG
+    return lambda answer: CORRECT if normalize_answer(answer) in accepted else WRONG
+
+def _true_false_matcher(exercise: Exercise) -> Matcher:
+    expected = parse_bool(exercise.correct_answer)
+    if expected is None:
+        return _accepting(frozenset({normalize_answer(exercise.correct_answer)}))
+    return lambda answer: CORRECT if parse_bool(answer) is expected else WRONG
+
+def _multiple_choice_matcher(exercise: Exercise) -> Matcher:
+    correct = normalize_answer(exercise.correct_answer)
+    items = [(normalize_answer(key), normalize_answer(text)) for key, text in _option_items(exercise.options)]
+    # `correct_answer` identifica una sola opción: primero por clave y, si ninguna
+    # coincide, por texto. Vale tanto la clave de esa opción como su texto; si no
+    # identifica ninguna, el ejercicio está mal definido y no se acepta nada.
+    option = next((item for item in items if item[0] == correct), None) \
+        or next((item for item in items if item[1] == correct), None)
+    if not correct or option is None:
+        return lambda answer: WRONG
+    return _accepting(frozenset(option))
+
+def _matching_matcher(exercise: Exercise) -> Matcher:
+    expected = parse_pairs(exercise.correct_answer)
+    if not expected and isinstance(exercise.options, dict):
+        expected = parse_pairs(exercise.options.get('pairs'))
+    if not expected:
+        return lambda answer: WRONG
+
+    def match(answer: Any) -> Grade:
+        given = parse_pairs(answer)
+        hits = len(given & expected)
+        if hits == len(expected) == len(given):
+            return CORRECT
+        # Las parejas sobrantes no restan, pero impiden darlo por correcto
+        return Grade(False, hits / len(expected))
+    return match
+
+def _tolerance(exercise: Exercise, options: dict, key: str, default: float) -> float:
+    """Tolerancia de `options[key]`; si no es un número válido se usa la de por defecto"""
+    value = options.get(key, default)
+    try:
+        tolerance = float(value)
+    except (TypeError, ValueError):
+        tolerance = math.nan
+    if not math.isfinite(tolerance) or tolerance < 0:
+        logger.warning(f"'{key}' no válida en el ejercicio {exercise.id}: {value!r}; se usa {default}")
+        return default
+    return tolerance
+
+def _open_ended_matcher(exercise: Exercise) -> Matcher:
+    alternatives = [part for part in str(exercise.correct_answer or '').split('|') if part.strip()]
+    numbers = [parse_number(part) for part in alternatives]
+    if alternatives and all(number is not None for number in numbers):
+        options = exercise.options if isinstance(exercise.options, dict) else {}
+        abs_tol = _tolerance(exercise, options, 'tolerance', ABS_TOLERANCE)
+        rel_tol = _tolerance(exercise, options, 'relative_tolerance', REL_TOLERANCE)
+
+        def match(answer: Any) -> Grade:
+            value = parse_number(answer)
+            if value is None:
+                return WRONG
+            ok = any(math.isclose(value, number, rel_tol=rel_tol, abs_tol=abs_tol) for number in numbers)
+            return CORRECT if ok else WRONG
+        return match
+    return _accepting(frozenset(normalize_answer(part) for part in alternatives))
+
+_COMPILERS: Dict[str, Callable[[Exercise], Matcher]] = {
+    'true_false': _true_false_matcher,
+    'multiple_choice': _multiple_choice_matcher,
+    'matching': _matching_matcher,
+    'open_ended': _open_ended_matcher,
+}
+
+def compile_matcher(exercise: Exercise) -> Matcher:
+    """Construye la función de corrección de un ejercicio según su tipo"""
+    return _COMPILERS.get(exercise.type, _open_ended_matcher)(exercise)
+
+class MatcherCache:
+    """
+    Matchers compilados por ejercicio. Se invalidan cuando el ejercicio cambia en el
+    catálogo, de modo que corregir una respuesta es una búsqueda más una comparación.
+    """
+
+    def __init__(self):
+        self._cache = TTLCache(maxsize=settings.grading_cache_max_size, ttl=settings.grading_cache_ttl_seconds)
+
+    def get(self, exercise: Exercise) -> Matcher:
+        key = str(exercise.id)
+        matcher = self._cache.get(key)
+        if matcher is None:
+            matcher = compile_matcher(exercise)
+            self._cache.set(key, matcher)
+        return matcher
+
+    def on_upsert(self, exercise: Exercise) -> None:
+        self._cache.invalidate(str(exercise.id))
+
+    def on_remove(self, exercise_id: str) -> None:
+        self._cache.invalidate(exercise_id)
+
+    def on_reset(self, exercises: List[Exercise]) -> None:
+        self._cache.clear()
+
+matchers = MatcherCache()
+catalog.subscribe(matchers)
+
+def grade(exercise: Exercise, answer: Any) -> Grade:
+    """Corrige una respuesta con el matcher (cacheado) del ejercicio"""
+    return matchers.get(exercise)(answer)
@@ -0,0 +1,130 @@
+import json
+import logging
+from typing import Any, AsyncIterator, List, Tuple
+from uuid import UUID
+from fastapi import Request
+from pydantic import ValidationError
+from app.core.batching import describe_error, write_batches
+from app.core.config import settings
+from app.crud.exercise import insert_exercises_async, parse_options
+from app.schemas.exercise import ExerciseCreate, ExerciseImportReport, ExerciseImportResult
+from app.services.dedup import duplicate_index
+
+logger = logging.getLogger(__name__)
+
+class InvalidRecord:
+    """Marca una línea del fichero que no se pudo interpretar como JSON"""
+
+    def __init__(self, error: str):
+        self.error = error
+
+def _parse_line(line: bytes) -> Any:
+    try:
+        return json.loads(line)
+    except ValueError as e:
+        return InvalidRecord(f"JSON inválido: {e}")
+
+async def iter_import_records(request: Request) -> AsyncIterator[Any]:
+    """
+    Lee los registros a importar. Con NDJSON (application/x-ndjson) el cuerpo se
+    procesa en streaming línea a línea; en otro caso se espera un array JSON.
+    Lanza ValueError si el cuerpo JSON no es válido.
+    """
+    content_type = request.headers.get("content-type", "")
+    if "ndjson" in content_type or "jsonl" in content_type:
+        buffer = b""
+        async for chunk in request.stream():
+            buffer += chunk
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                if line.strip():
+                    yield _parse_line(line)
+        if buffer.strip():
+            yield _parse_line(buffer)
+        return
+
+    try:
+        data = json.loads(await request.body())
+    except ValueError as e:
+        raise ValueError(f"JSON inválido: {e}")
+    if not isinstance(data, list):
+        raise ValueError("Se esperaba un array JSON de ejercicios")
+    for record in data:
+        yield record
+
+def _validation_errors(error: Exception) -> List[str]:
+    if isinstance(error, ValidationError):
+        return [f"{'.'.join(str(part) for part in err['loc'])}: {err['msg']}" for err in error.errors()]
+    return [str(error)]
+
+def validate_record(record: Any) -> ExerciseCreate:
+    """Valida un registro contra ExerciseCreate normalizando antes las opciones"""
+    if isinstance(record, InvalidRecord):
+        raise ValueError(record.error)
+    if not isinstance(record, dict):
+        raise ValueError("Cada ejercicio debe ser un objeto JSON")
+    return ExerciseCreate(**{**record, 'options': parse_options(record.get('options'))})
+
+async def _flush(pending: List[Tuple[int, ExerciseCreate]], created_by: UUID, report: ExerciseImportReport) -> None:
+    """
+    Inserta el lote pendiente. Si la BD rechaza alguna fila por sus datos, el lote se
+    divide hasta aislarla (`write_batches`) y solo esa fila se marca como fallida.
+    """
+    created: List[Tuple[int, Any]] = []
+    last_error: List[str] = []
+
+    async def insert(chunk: List[Tuple[int, ExerciseCreate]]) -> None:
+        try:
+            exercises = await insert_exercises_async([exercise for _, exercise in chunk], created_by=created_by)
+        except Exception as e:
+            last_error[:] = [describe_error(e)]
+            raise
+        # PostgREST devuelve las filas insertadas en el mismo orden que se enviaron
+        created.extend((index, exercise) for (index, _), exercise in zip(chunk, exercises))
+
+    outcome = await write_batches(pending, insert, len(pending), "ejercicios importados")
+    for index, exercise in created:
+        # Se compara contra el catálogo y las filas ya insertadas de esta misma importación
+        duplicates = [match.exercise_id for match in duplicate_index.find_duplicates(exercise.id)]
+        report.results.append(ExerciseImportResult(
+            index=index, status='created', id=exercise.id, duplicates=duplicates or None
+        ))
+        report.duplicates += bool(duplicates)
+    returned = {index for index, _ in created}
+    missing = [index for index, _ in outcome.written if index not in returned]
+    for index in missing:
+        report.results.append(ExerciseImportResult(index=index, status='failed', errors=["La BD no devolvió la fila insertada"]))
+    for (index, _), error in outcome.rejected:
+        report.results.append(ExerciseImportResult(index=index, status='failed', errors=[error]))
+    # Error no atribuible a una fila (conexión, permisos...): lo no insertado falla entero
+    for index, _ in outcome.remaining:
+        report.results.append(ExerciseImportResult(
+            index=index, status='failed', errors=[f"Error insertando el lote: {last_error[0] if last_error else 'desconocido'}"]
+        ))
+    report.created += len(created)
+    report.failed += len(missing) + len(outcome.rejected) + len(outcome.remaining)
+    pending.clear()
+
+async def import_exercises(records: AsyncIterator[Any], created_by: UUID) -> ExerciseImportReport:
+    """
+    Valida e inserta ejercicios por lotes de `import_chunk_size` filas y devuelve
+    un informe por fila. Las filas inválidas no impiden importar el resto.
+    """
+    report = ExerciseImportReport()
+    pending: List[Tuple[int, ExerciseCreate]] = []
+    index = 0
+    async for record in records:
+        report.total += 1
+        try:
+            pending.append((index, validate_record(record)))
+        except (ValidationError, ValueError, TypeError) as e:
+            report.results.append(ExerciseImportResult(index=index, status='invalid', errors=_validation_errors(e)))
+            report.invalid += 1
+        index += 1
+        if len(pending) >= settings.import_chunk_size:
+            await _flush(pending, created_by, report)
+    if pending:
+        await _flush(pending, created_by, report)
+    report.results.sort(key=lambda result: result.index)
+    logger.info(f"Importación de ejercicios: {report.created} creados, {report.invalid} inválidos, {report.failed} fallidos, {report.duplicates} posibles duplicados")
+    return report
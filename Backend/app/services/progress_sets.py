@@ -0,0 +1,113 @@
+import asyncio
+import logging
+from typing import Dict, Iterable, List, Optional, Tuple
+from app.core.bitmap import Bitmap
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.core.supabase import get_async_supabase
+from app.core.tasks import SingleFlight
+from app.services.catalog import catalog
+from app.services.write_behind import progress_writer
+
+logger = logging.getLogger(__name__)
+
+PAGE_SIZE = 1000
+
+class UserProgressSets:
+    """Ejercicios intentados y resueltos por un usuario, como bitmaps de ordinales del catálogo"""
+
+    __slots__ = ("attempted", "completed")
+
+    def __init__(self):
+        self.attempted = Bitmap()
+        self.completed = Bitmap()
+
+    def record(self, exercise_id, correct: bool) -> None:
+        ordinal = catalog.ordinal(exercise_id)
+        self.attempted.add(ordinal)
+        if correct:
+            self.completed.add(ordinal)
+
+class ExerciseExclusion:
+    """Ids a excluir en el muestreo: ids sueltos más los ordinales marcados en un bitmap"""
+
+    def __init__(self, exercise_ids: Iterable[str] = (), bitmap: Optional[Bitmap] = None):
+        self.exercise_ids = set(exercise_ids)
+        self.bitmap = bitmap
+
+    def __contains__(self, exercise_id) -> bool:
+        if exercise_id in self.exercise_ids:
+            return True
+        if not self.bitmap:
+            return False
+        ordinal = catalog.ordinal(exercise_id, create=False)
+        return ordinal is not None and ordinal in self.bitmap
+
+class ProgressSetStore:
+    """
+    Conjuntos de progreso por usuario cargados bajo demanda desde `user_progress`
+    (una sola consulta por usuario mientras siga en la caché) y actualizados en
+    cada respuesta enviada.
+    """
+
+    def __init__(self):
+        self._cache = TTLCache(maxsize=settings.progress_sets_max_users, ttl=settings.progress_sets_ttl_seconds)
+        self._loading = SingleFlight()
+        # Respuestas recibidas mientras se cargaba el usuario; se aplican al terminar la carga
+        self._pending: Dict[str, List[Tuple[str, bool]]] = {}
+
+    async def _load(self, user_id: str) -> UserProgressSets:
+        supabase = get_async_supabase()
+        sets = UserProgressSets()
+        # Respuestas aún en el buffer de escritura: se toman antes de leer por si se vuelcan mientras tanto
+        for row in progress_writer.pending_for(user_id):
+            sets.record(row['exercise_id'], bool(row.get('is_correct')))
+        start = 0
+        while True:
+            resp = await (
+                supabase.table('user_progress').select('exercise_id,is_correct')
+                .eq('user_id', user_id).order('id').range(start, start + PAGE_SIZE - 1).execute()
+            )
+            rows = resp.data or []
+            for row in rows:
+                if row.get('exercise_id'):
+                    sets.record(row['exercise_id'], bool(row.get('is_correct')))
+            if len(rows) < PAGE_SIZE:
+                break
+            start += PAGE_SIZE
+        for exercise_id, correct in self._pending.pop(user_id, ()):
+            sets.record(exercise_id, correct)
+        self._cache.set(user_id, sets)
+        return sets
+
+    async def get(self, user_id) -> Optional[UserProgressSets]:
+        """Conjuntos del usuario; None si no se pudieron cargar (el llamante sigue sin excluir nada)"""
+        key = str(user_id)
+        sets = self._cache.get(key)
+        if sets is not None:
+            return sets
+        try:
+            return await self._loading.run(key, lambda: self._load(key))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self._pending.pop(key, None)
+            logger.error(f"Error cargando el progreso del usuario {key}: {e}")
+            return None
+
+    def record(self, user_id, exercise_id, correct: bool) -> None:
+        """Anota una respuesta si el usuario está en memoria (si no, se leerá de la BD al cargarlo)"""
+        key = str(user_id)
+        sets = self._cache.get(key)
+        if sets is not None:
+            sets.record(exercise_id, correct)
+        elif key in self._loading:
+            self._pending.setdefault(key, []).append((str(exercise_id), correct))
+
+    def invalidate(self, user_id) -> None:
+        self._cache.invalidate(str(user_id))
+
+    def stats(self) -> dict:
+        return self._cache.stats()
+
+progress_sets = ProgressSetStore()
@@ -0,0 +1,101 @@
+import asyncio
+import logging
+import time
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from app.core.config import settings
+from app.core.http_cache import table_versions
+from app.core.supabase import get_async_supabase
+
+logger = logging.getLogger(__name__)
+
+REFERENCE_TABLES = ('subjects', 'topics', 'achievements')
+
+class ReferenceSnapshot(NamedTuple):
+    """
+    Foto inmutable de las tablas de referencia. Nunca se modifica: cada recarga
+    construye una nueva y la sustituye de forma atómica.
+    """
+    rows: Dict[str, Tuple[dict, ...]]
+    by_id: Dict[str, Dict[str, dict]]
+    topics_by_subject: Dict[str, Tuple[dict, ...]]
+    loaded_at: float
+
+def _build_snapshot(rows: Dict[str, List[dict]]) -> ReferenceSnapshot:
+    topics_by_subject: Dict[str, List[dict]] = {}
+    for topic in rows['topics']:
+        topics_by_subject.setdefault(str(topic.get('subject_id')), []).append(topic)
+    return ReferenceSnapshot(
+        rows={table: tuple(items) for table, items in rows.items()},
+        by_id={table: {str(item['id']): item for item in items} for table, items in rows.items()},
+        topics_by_subject={subject_id: tuple(items) for subject_id, items in topics_by_subject.items()},
+        loaded_at=time.monotonic(),
+    )
+
+class ReferenceDataStore:
+    """Materias, temas y logros cargados en memoria al arrancar la aplicación"""
+
+    def __init__(self):
+        self.snapshot: Optional[ReferenceSnapshot] = None
+        self._lock = asyncio.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self.snapshot is not None
+
+    async def _fetch(self, table: str) -> List[dict]:
+        supabase = get_async_supabase()
+        response = await supabase.table(table).select('*').execute()
+        return response.data or []
+
+    async def load(self) -> None:
+        """Carga las tres tablas en paralelo y publica una nueva foto"""
+        async with self._lock:
+            results = await asyncio.gather(*(self._fetch(table) for table in REFERENCE_TABLES))
+            self._publish(dict(zip(REFERENCE_TABLES, results)))
+
+    async def reload(self, table: str) -> None:
+        """
+        Recarga una sola tabla (tras una escritura) manteniendo el resto de la foto.
+        Los errores se registran sin propagarse: la escritura ya se hizo y la
+        recarga periódica corregirá la foto.
+        """
+        try:
+            if self.snapshot is None:
+                return await self.load()
+            async with self._lock:
+                rows = {name: list(items) for name, items in self.snapshot.rows.items()}
+                rows[table] = await self._fetch(table)
+                self._publish(rows)
+        except Exception as e:
+            logger.error(f"Error recargando la tabla de referencia '{table}': {e}")
+
+    def _publish(self, rows: Dict[str, List[dict]]) -> None:
+        previous = self.snapshot
+        self.snapshot = _build_snapshot(rows)
+        # Si otro proceso cambió los datos, los ETag de este proceso dejan de ser válidos
+        if previous is not None:
+            for table in REFERENCE_TABLES:
+                if list(previous.rows[table]) != rows[table]:
+                    table_versions.bump(table)
+
+    def list(self, table: str) -> Tuple[dict, ...]:
+        return self.snapshot.rows[table]
+
+    def get(self, table: str, item_id) -> Optional[dict]:
+        return self.snapshot.by_id[table].get(str(item_id))
+
+    def topics_for_subject(self, subject_id) -> Tuple[dict, ...]:
+        return self.snapshot.topics_by_subject.get(str(subject_id), ())
+
+reference_data = ReferenceDataStore()
+
+async def run_reference_data_refresher() -> None:
+    """Tarea en segundo plano: carga inicial y recarga periódica de los datos de referencia"""
+    while True:
+        try:
+            await reference_data.load()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error cargando los datos de referencia: {e}")
+        await asyncio.sleep(settings.reference_data_refresh_interval_seconds)
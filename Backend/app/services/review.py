@@ -0,0 +1,256 @@
+import asyncio
+import heapq
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Container, Dict, List, Optional, Tuple
+from app.core.batching import dead_letter, write_batches
+from app.core.config import settings
+from app.core.supabase import get_async_supabase
+from app.core.tasks import SingleFlight, run_periodically
+
+logger = logging.getLogger(__name__)
+
+# Tabla con el estado de repaso por (user_id, exercise_id)
+TABLE_NAME = 'review_schedule'
+PAGE_SIZE = 1000
+
+DAY = 86400.0
+# Tras un fallo el ejercicio vuelve pronto, antes de reiniciar la escala de días
+RELEARN_INTERVAL = 600.0
+INITIAL_EASE = 2.5
+MIN_EASE = 1.3
+# Máximo de entradas del montículo que se inspeccionan buscando una que cumpla el filtro
+MAX_SCAN = 256
+
+def quality_for(correct: bool, score: Optional[float] = None) -> int:
+    """Calidad SM-2 (0-5) de una respuesta; `score` en [0, 1] matiza los aciertos"""
+    if not correct:
+        return 1
+    if score is None:
+        return 4
+    return 3 + round(2 * max(0.0, min(1.0, score)))
+
+class ReviewState:
+    """Estado SM-2 de un ejercicio para un usuario"""
+
+    __slots__ = ("exercise_id", "repetitions", "interval", "ease", "lapses", "due_at")
+
+    def __init__(self, exercise_id: str, repetitions: int = 0, interval: float = 0.0,
+                 ease: float = INITIAL_EASE, lapses: int = 0, due_at: float = 0.0):
+        self.exercise_id = exercise_id
+        self.repetitions = repetitions
+        self.interval = interval
+        self.ease = ease
+        self.lapses = lapses
+        self.due_at = due_at
+
+    def review(self, quality: int, now: float) -> None:
+        """Aplica SM-2 con una respuesta de calidad `quality`"""
+        if quality < 3:
+            self.repetitions = 0
+            self.lapses += 1
+            self.interval = RELEARN_INTERVAL
+        else:
+            self.repetitions += 1
+            if self.repetitions == 1:
+                self.interval = DAY
+            elif self.repetitions == 2:
+                self.interval = 6 * DAY
+            else:
+                self.interval = self.interval * self.ease
+        self.ease = max(MIN_EASE, self.ease + 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02))
+        self.due_at = now + self.interval
+
+    @classmethod
+    def from_row(cls, row: dict) -> "ReviewState":
+        due_at = row.get('due_at')
+        if isinstance(due_at, str):
+            due_at = datetime.fromisoformat(due_at.replace('Z', '+00:00')).timestamp()
+        return cls(
+            str(row['exercise_id']),
+            repetitions=row.get('repetitions') or 0,
+            interval=float(row.get('interval_seconds') or 0.0),
+            ease=float(row.get('ease') or INITIAL_EASE),
+            lapses=row.get('lapses') or 0,
+            due_at=float(due_at or 0.0),
+        )
+
+    def to_row(self, user_id: str) -> dict:
+        return {
+            'user_id': user_id,
+            'exercise_id': self.exercise_id,
+            'repetitions': self.repetitions,
+            'interval_seconds': self.interval,
+            'ease': self.ease,
+            'lapses': self.lapses,
+            'due_at': datetime.fromtimestamp(self.due_at, tz=timezone.utc).isoformat(),
+        }
+
+class UserReviewQueue:
+    """
+    Estados de repaso de un usuario y un montículo de mínimos por fecha de vencimiento.
+    Las entradas obsoletas del montículo (de estados ya reprogramados) se descartan
+    al llegar a la cima, así que reprogramar es O(log n).
+    """
+
+    def __init__(self, states: Dict[str, ReviewState]):
+        self.states = states
+        self._heap: List[Tuple[float, str]] = [(state.due_at, exercise_id) for exercise_id, state in states.items()]
+        heapq.heapify(self._heap)
+        self.last_access = time.monotonic()
+
+    def _current(self, entry: Tuple[float, str]) -> bool:
+        state = self.states.get(entry[1])
+        return state is not None and state.due_at == entry[0]
+
+    def schedule(self, state: ReviewState) -> None:
+        self.states[state.exercise_id] = state
+        heapq.heappush(self._heap, (state.due_at, state.exercise_id))
+        # Evita que el montículo crezca sin límite con entradas obsoletas
+        if len(self._heap) > 2 * len(self.states) + 64:
+            self._heap = [entry for entry in self._heap if self._current(entry)]
+            heapq.heapify(self._heap)
+
+    def most_overdue(self, now: float, accept=None, exclude: Container[str] = ()) -> Optional[str]:
+        """Ejercicio vencido con la fecha más antigua que cumpla `accept` y no esté en `exclude`"""
+        skipped: List[Tuple[float, str]] = []
+        found = None
+        while self._heap and len(skipped) < MAX_SCAN:
+            entry = self._heap[0]
+            if not self._current(entry):
+                heapq.heappop(self._heap)
+                continue
+            if entry[0] > now:
+                break
+            if entry[1] not in exclude and (accept is None or accept(entry[1])):
+                found = entry[1]
+                break
+            skipped.append(heapq.heappop(self._heap))
+        for entry in skipped:
+            heapq.heappush(self._heap, entry)
+        return found
+
+    def due_count(self, now: float) -> int:
+        return sum(1 for state in self.states.values() if state.due_at <= now)
+
+class ReviewScheduler:
+    """
+    Planificador de repasos SM-2. Las colas por usuario se cargan bajo demanda desde
+    `review_schedule`, se descartan cuando el usuario lleva un rato inactivo y los
+    cambios se escriben a la BD por lotes desde una tarea en segundo plano.
+    """
+
+    def __init__(self):
+        self._queues: Dict[str, UserReviewQueue] = {}
+        self._loading = SingleFlight()
+        # Estados modificados pendientes de persistir, por (user_id, exercise_id)
+        self._dirty: Dict[Tuple[str, str], dict] = {}
+        # Estados que se están escribiendo en la pasada de `flush` en curso
+        self._flushing: Dict[Tuple[str, str], dict] = {}
+        self._flush_lock = asyncio.Lock()
+
+    def _unsaved(self, user_id: str) -> Dict[str, dict]:
+        """Estados del usuario aún no confirmados en la BD, en escritura o pendientes"""
+        rows = {exercise_id: row for (owner, exercise_id), row in self._flushing.items() if owner == user_id}
+        rows.update((exercise_id, row) for (owner, exercise_id), row in self._dirty.items() if owner == user_id)
+        return rows
+
+    async def _hydrate(self, user_id: str) -> UserReviewQueue:
+        supabase = get_async_supabase()
+        states: Dict[str, ReviewState] = {}
+        # Se toman antes de leer: un flush que termine durante la lectura los saca de
+        # `_dirty`, pero la página leída puede ser anterior a su escritura
+        unsaved = self._unsaved(user_id)
+        start = 0
+        while True:
+            resp = await (
+                supabase.table(TABLE_NAME).select('*')
+                .eq('user_id', user_id).order('exercise_id').range(start, start + PAGE_SIZE - 1).execute()
+            )
+            rows = resp.data or []
+            for row in rows:
+                state = ReviewState.from_row(row)
+                states[state.exercise_id] = state
+            if len(rows) < PAGE_SIZE:
+                break
+            start += PAGE_SIZE
+        # Lo que aún no se había escrito en la BD es más reciente que lo leído
+        for exercise_id, row in unsaved.items():
+            states[exercise_id] = ReviewState.from_row(row)
+        queue = UserReviewQueue(states)
+        self._queues[user_id] = queue
+        return queue
+
+    async def queue(self, user_id) -> UserReviewQueue:
+        key = str(user_id)
+        queue = self._queues.get(key)
+        if queue is None:
+            queue = await self._loading.run(key, lambda: self._hydrate(key))
+        queue.last_access = time.monotonic()
+        return queue
+
+    async def record(self, user_id, exercise_id, correct: bool, score: Optional[float] = None) -> ReviewState:
+        """Reprograma un ejercicio tras una respuesta del usuario"""
+        queue = await self.queue(user_id)
+        exercise_id = str(exercise_id)
+        state = queue.states.get(exercise_id)
+        state = ReviewState(exercise_id) if state is None else ReviewState(
+            exercise_id, state.repetitions, state.interval, state.ease, state.lapses, state.due_at
+        )
+        state.review(quality_for(correct, score), time.time())
+        queue.schedule(state)
+        self._dirty[(str(user_id), exercise_id)] = state.to_row(str(user_id))
+        return state
+
+    async def next_due(self, user_id, accept=None, exclude: Container[str] = ()) -> Optional[str]:
+        """Id del ejercicio más atrasado del usuario (None si no tiene nada pendiente)"""
+        queue = await self.queue(user_id)
+        return queue.most_overdue(time.time(), accept=accept, exclude=exclude)
+
+    def evict_idle(self) -> int:
+        """Descarta las colas de usuarios inactivos (sus cambios siguen pendientes en `_dirty`)"""
+        cutoff = time.monotonic() - settings.review_idle_seconds
+        idle = [user_id for user_id, queue in self._queues.items() if queue.last_access < cutoff]
+        for user_id in idle:
+            del self._queues[user_id]
+        return len(idle)
+
+    async def flush(self) -> int:
+        """Escribe en la BD los estados modificados, en lotes de `review_flush_batch_size`"""
+        async with self._flush_lock:
+            if not self._dirty:
+                return 0
+            batch, self._dirty = self._dirty, {}
+            self._flushing = batch
+            supabase = get_async_supabase()
+
+            async def upsert(chunk: List[Tuple[Tuple[str, str], dict]]) -> None:
+                rows = [row for _, row in chunk]
+                await supabase.table(TABLE_NAME).upsert(rows, on_conflict='user_id,exercise_id').execute()
+
+            try:
+                outcome = await write_batches(batch.items(), upsert, settings.review_flush_batch_size, "estados de repaso")
+            finally:
+                self._flushing = {}
+            dead_letter(TABLE_NAME, [(row, error) for (_, row), error in outcome.rejected])
+            # Se reintenta en la siguiente pasada sin pisar cambios más recientes
+            for key, row in outcome.remaining:
+                self._dirty.setdefault(key, row)
+            return len(outcome.written)
+
+    def stats(self) -> dict:
+        return {"users": len(self._queues), "dirty": len(self._dirty)}
+
+review_scheduler = ReviewScheduler()
+
+async def _flush_reviews() -> None:
+    await review_scheduler.flush()
+    review_scheduler.evict_idle()
+
+async def run_review_flusher() -> None:
+    """Tarea en segundo plano: persiste los repasos por lotes y descarta colas inactivas"""
+    await run_periodically(
+        "repasos", lambda: settings.review_flush_interval_seconds,
+        _flush_reviews, on_stop=review_scheduler.flush,
+    )
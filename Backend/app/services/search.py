@@ -0,0 +1,250 @@
+import bisect
+import heapq
+import math
+import re
+import threading
+import unicodedata
+from collections import Counter
+from operator import itemgetter
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from app.schemas.exercise import Exercise
+from app.services.catalog import catalog
+
+# Campos indexados y su peso (el título cuenta como si apareciera varias veces)
+FIELD_WEIGHTS = (('title', 3), ('description', 1), ('content', 1))
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Máximo de términos del vocabulario en los que se expande una consulta por prefijo
+MAX_PREFIX_EXPANSIONS = 64
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_QUERY_TOKEN_RE = re.compile(r"[a-z0-9]+\*?")
+
+def fold(text: str) -> str:
+    """Minúsculas y sin tildes ni diéresis ('Ecuación' -> 'ecuacion', 'pingüino' -> 'pinguino')"""
+    decomposed = unicodedata.normalize('NFKD', text.lower())
+    return ''.join(c for c in decomposed if not unicodedata.combining(c))
+
+STOPWORDS = frozenset(fold(word) for word in """
+    a al algo algunas algunos ante antes como con contra cual cuales cuando de del desde donde durante
+    e el ella ellas ellos en entre era es esa esas ese eso esos esta estas este esto estos fue ha hay
+    la las le les lo los mas me mi mis muy ni no nos o os otra otro para pero poco por porque que
+    quien se sea ser si sin sobre son su sus tambien te tiene tu tus un una uno unos unas y ya
+""".split())
+
+_VOWELS = frozenset('aeiou')
+
+def stem(word: str) -> str:
+    """
+    Lematizador ligero para español: quita el sufijo adverbial, el plural y la
+    vocal de género. No pretende ser exacto, solo agrupar variantes habituales
+    ('ecuaciones'/'ecuacion', 'numeros'/'numero', 'rapidamente'/'rapido').
+    """
+    if len(word) <= 3:
+        return word
+    if word.endswith('mente') and len(word) - 5 >= 4:
+        word = word[:-5]
+    elif word.endswith('ces') and len(word) > 4:
+        word = word[:-3] + 'z'
+    elif word.endswith('es') and len(word) > 4 and word[-3] not in _VOWELS:
+        word = word[:-2]
+    elif word.endswith('s') and len(word) > 3:
+        word = word[:-1]
+    if len(word) > 4 and word[-1] in 'aeo':
+        word = word[:-1]
+    return word
+
+def tokenize(text: Optional[str]) -> List[str]:
+    """Tokens normalizados (sin tildes, sin palabras vacías y lematizados) de un texto"""
+    if not text:
+        return []
+    return [stem(token) for token in _TOKEN_RE.findall(fold(text)) if token not in STOPWORDS]
+
+def parse_query(query: str) -> List[Tuple[str, bool]]:
+    """
+    Convierte la consulta en una lista de (término, es_prefijo).
+    Un término terminado en '*' se busca por prefijo sin lematizar.
+    """
+    terms: List[Tuple[str, bool]] = []
+    for token in _QUERY_TOKEN_RE.findall(fold(query)):
+        if token.endswith('*'):
+            term = (token[:-1], True)
+        elif token in STOPWORDS:
+            continue
+        else:
+            term = (stem(token), False)
+        if term not in terms:
+            terms.append(term)
+    return terms
+
+class SearchHit(NamedTuple):
+    exercise_id: str
+    score: float
+
+class _Document(NamedTuple):
+    exercise_id: str
+    length: int
+    terms: Tuple[str, ...]
+    subject_id: Optional[str]
+    topic_id: Optional[str]
+    difficulty: str
+
+class SearchIndex:
+    """
+    Índice invertido en memoria sobre título, descripción y enunciado de los ejercicios,
+    con ranking BM25. Se mantiene sincronizado con el catálogo: cada alta, cambio o baja
+    actualiza solo las listas de los términos del ejercicio afectado.
+    El vocabulario se guarda también ordenado para resolver prefijos con bisect.
+    """
+
+    def __init__(self):
+        self._postings: Dict[str, Dict[int, int]] = {}
+        self._vocabulary: List[str] = []
+        self._docs: Dict[int, _Document] = {}
+        self._doc_ids: Dict[str, int] = {}
+        self._lengths: Dict[int, int] = {}
+        self._next_doc = 0
+        self._total_length = 0
+        self._lock = threading.RLock()
+        self.loaded = False
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    @staticmethod
+    def _term_counts(exercise: Exercise) -> Counter:
+        counts: Counter = Counter()
+        for field, weight in FIELD_WEIGHTS:
+            for token in tokenize(getattr(exercise, field, None)):
+                counts[token] += weight
+        return counts
+
+    def _add(self, exercise: Exercise, sort_vocabulary: bool = True) -> None:
+        exercise_id = str(exercise.id)
+        counts = self._term_counts(exercise)
+        doc = self._next_doc
+        self._next_doc += 1
+        self._doc_ids[exercise_id] = doc
+        length = sum(counts.values())
+        self._docs[doc] = _Document(
+            exercise_id=exercise_id,
+            length=length,
+            terms=tuple(counts),
+            subject_id=str(exercise.subject_id) if exercise.subject_id else None,
+            topic_id=str(exercise.topic_id) if exercise.topic_id else None,
+            difficulty=exercise.difficulty,
+        )
+        self._lengths[doc] = length
+        self._total_length += length
+        for term, tf in counts.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = {}
+                if sort_vocabulary:
+                    bisect.insort(self._vocabulary, term)
+            postings[doc] = tf
+
+    def _discard(self, exercise_id: str) -> None:
+        doc = self._doc_ids.pop(exercise_id, None)
+        if doc is None:
+            return
+        entry = self._docs.pop(doc)
+        del self._lengths[doc]
+        self._total_length -= entry.length
+        for term in entry.terms:
+            postings = self._postings[term]
+            del postings[doc]
+            if not postings:
+                del self._postings[term]
+                del self._vocabulary[bisect.bisect_left(self._vocabulary, term)]
+
+    def on_upsert(self, exercise: Exercise) -> None:
+        with self._lock:
+            self._discard(str(exercise.id))
+            self._add(exercise)
+
+    def on_remove(self, exercise_id: str) -> None:
+        with self._lock:
+            self._discard(exercise_id)
+
+    def on_reset(self, exercises: List[Exercise]) -> None:
+        with self._lock:
+            self._postings.clear()
+            self._docs.clear()
+            self._doc_ids.clear()
+            self._lengths.clear()
+            self._total_length = 0
+            for exercise in exercises:
+                self._add(exercise, sort_vocabulary=False)
+            self._vocabulary = sorted(self._postings)
+            self.loaded = True
+
+    def _expand(self, prefix: str) -> List[str]:
+        start = bisect.bisect_left(self._vocabulary, prefix)
+        terms = []
+        for term in self._vocabulary[start:start + MAX_PREFIX_EXPANSIONS]:
+            if not term.startswith(prefix):
+                break
+            terms.append(term)
+        return terms
+
+    def search(
+        self,
+        query: str,
+        subject_id=None,
+        topic_id=None,
+        difficulty: Optional[str] = None,
+        limit: int = 20,
+    ) -> List[SearchHit]:
+        """Devuelve los `limit` ejercicios más relevantes para la consulta, filtrados por materia/tema/dificultad"""
+        subject_id = str(subject_id) if subject_id else None
+        topic_id = str(topic_id) if topic_id else None
+        with self._lock:
+            total_docs = len(self._docs)
+            if not total_docs:
+                return []
+            lengths = self._lengths
+            # Términos constantes de BM25 para esta consulta
+            k1_plus_1 = BM25_K1 + 1
+            base = BM25_K1 * (1 - BM25_B)
+            per_length = BM25_K1 * BM25_B / (self._total_length / total_docs or 1.0)
+            scores: Dict[int, float] = {}
+
+            for term, is_prefix in parse_query(query):
+                # En una expansión por prefijo cada documento puntúa por su mejor término
+                term_scores: Dict[int, float] = {}
+                for expanded in (self._expand(term) if is_prefix else (term,)):
+                    postings = self._postings.get(expanded)
+                    if not postings:
+                        continue
+                    df = len(postings)
+                    idf = math.log(1 + (total_docs - df + 0.5) / (df + 0.5))
+                    weight = idf * k1_plus_1
+                    current = {doc: weight * tf / (tf + base + per_length * lengths[doc]) for doc, tf in postings.items()}
+                    if term_scores:
+                        for doc, score in current.items():
+                            if score > term_scores.get(doc, 0.0):
+                                term_scores[doc] = score
+                    else:
+                        term_scores = current
+                if not scores:
+                    scores = term_scores
+                else:
+                    for doc, score in term_scores.items():
+                        scores[doc] = scores.get(doc, 0.0) + score
+
+            if subject_id or topic_id or difficulty:
+                docs = self._docs
+                scores = {
+                    doc: score for doc, score in scores.items()
+                    if (subject_id is None or docs[doc].subject_id == subject_id)
+                    and (topic_id is None or docs[doc].topic_id == topic_id)
+                    and (difficulty is None or docs[doc].difficulty == difficulty)
+                }
+            best = heapq.nlargest(limit, scores.items(), key=itemgetter(1))
+            return [SearchHit(self._docs[doc].exercise_id, score) for doc, score in best]
+
+search_index = SearchIndex()
+catalog.subscribe(search_index)
@@ -0,0 +1,104 @@
+import secrets
+import threading
+from collections import deque
+from typing import Deque, Iterable, List, Optional
+from app.core.bitmap import Bitmap
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.schemas.exercise import Exercise
+from app.services.catalog import catalog
+from app.services.progress_sets import ExerciseExclusion
+
+class PracticeSession:
+    """Lote de ejercicios ya sorteado para un alumno y la posición del siguiente a servir"""
+
+    def __init__(self, session_id: str, user_id: str, exercise_ids: List[str]):
+        self.session_id = session_id
+        self.user_id = user_id
+        self.exercise_ids = exercise_ids
+        self.position = 0
+        self._lock = threading.Lock()
+
+    @property
+    def remaining(self) -> int:
+        return len(self.exercise_ids) - self.position
+
+    def pull(self, count: int) -> List[str]:
+        """Avanza el cursor y devuelve los siguientes `count` ids"""
+        with self._lock:
+            batch = self.exercise_ids[self.position:self.position + count]
+            self.position += len(batch)
+            return batch
+
+# Sesiones activas por id; caducan solas si el alumno abandona la práctica
+practice_sessions = TTLCache(
+    maxsize=settings.practice_session_max_size,
+    ttl=settings.practice_session_ttl_seconds,
+)
+
+# Últimos ejercicios servidos a cada usuario (deque acotada por usuario)
+recent_exercises = TTLCache(
+    maxsize=settings.practice_session_max_size,
+    ttl=settings.practice_session_ttl_seconds,
+)
+
+def recently_served(user_id) -> Deque[str]:
+    recent = recent_exercises.get(str(user_id))
+    if recent is None:
+        recent = deque(maxlen=settings.recent_exercises_window)
+        recent_exercises.set(str(user_id), recent)
+    return recent
+
+def mark_served(user_id, exercise_ids: Iterable[str]) -> None:
+    recently_served(user_id).extend(str(exercise_id) for exercise_id in exercise_ids)
+
+def resolve(exercise_ids: Iterable[str]) -> List[Exercise]:
+    """Ejercicios del catálogo para los ids dados (omite los que se hayan borrado)"""
+    return [exercise for exercise in map(catalog.get, exercise_ids) if exercise is not None]
+
+def sample_fresh(user_id, n: int, exclude: Iterable = (), completed: Optional[Bitmap] = None,
+                 subject_id=None, topic_id=None, difficulty: Optional[str] = None) -> List[Exercise]:
+    """
+    Sortea hasta `n` ejercicios distintos evitando, por este orden de preferencia, los ya
+    resueltos por el usuario y los servidos recientemente. Si no quedan suficientes se
+    relajan esas exclusiones; los ids de `exclude` se respetan siempre.
+    """
+    explicit = {str(exercise_id) for exercise_id in exclude}
+    levels = [(explicit | set(recently_served(user_id)), completed), (explicit, completed), (explicit, None)]
+    picked: List[Exercise] = []
+    picked_ids = set()
+    for exercise_ids, bitmap in levels:
+        more = catalog.sample_many(
+            n - len(picked),
+            exclude=ExerciseExclusion(exercise_ids | picked_ids, bitmap),
+            subject_id=subject_id, topic_id=topic_id, difficulty=difficulty,
+        )
+        picked.extend(more)
+        picked_ids.update(str(exercise.id) for exercise in more)
+        if len(picked) >= n:
+            break
+    return picked
+
+def start_session(user_id, size: int, exclude: Iterable = (), completed: Optional[Bitmap] = None,
+                  subject_id=None, topic_id=None, difficulty: Optional[str] = None) -> PracticeSession:
+    """Sortea una sesión de `size` ejercicios (ver `sample_fresh`) y la guarda"""
+    exercises = sample_fresh(
+        user_id, size, exclude=exclude, completed=completed,
+        subject_id=subject_id, topic_id=topic_id, difficulty=difficulty,
+    )
+    session = PracticeSession(secrets.token_urlsafe(16), str(user_id), [str(e.id) for e in exercises])
+    practice_sessions.set(session.session_id, session)
+    return session
+
+def get_session(session_id: str, user_id) -> Optional[PracticeSession]:
+    """Sesión activa del usuario (None si no existe, caducó o es de otro usuario)"""
+    session = practice_sessions.get(session_id)
+    if session is None or session.user_id != str(user_id):
+        return None
+    return session
+
+def pull(session: PracticeSession, count: int) -> List[Exercise]:
+    """Sirve los siguientes ejercicios de la sesión y los anota como recientes"""
+    exercise_ids = session.pull(count)
+    mark_served(session.user_id, exercise_ids)
+    return resolve(exercise_ids)
@@ -0,0 +1,300 @@
+import asyncio
+import logging
+import time
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Set, Tuple
+from app.core.batching import dead_letter, write_batches
+from app.core.config import settings
+from app.core.supabase import get_async_supabase
+from app.core.tasks import SingleFlight, run_periodically
+
+logger = logging.getLogger(__name__)
+
+# Una fila por usuario con los totales y el desglose por materia en `by_subject`
+TABLE_NAME = 'user_stats'
+
+class Counters:
+    """
+    Contadores de respuestas: intentos, ejercicios resueltos, puntos, tiempo y racha de
+    aciertos seguidos. Resueltos y puntos cuentan cada ejercicio una sola vez, la primera
+    vez que se acierta; volver a enviarlo suma intentos, tiempo y racha, pero no puntos.
+    """
+
+    __slots__ = ("attempts", "correct", "points", "time_spent", "correct_streak", "best_correct_streak")
+
+    def __init__(self, attempts: int = 0, correct: int = 0, points: int = 0, time_spent: int = 0,
+                 correct_streak: int = 0, best_correct_streak: int = 0):
+        self.attempts = attempts
+        self.correct = correct
+        self.points = points
+        self.time_spent = time_spent
+        self.correct_streak = correct_streak
+        self.best_correct_streak = best_correct_streak
+
+    def copy(self) -> "Counters":
+        return Counters(**self.to_dict())
+
+    def add(self, correct: bool, points: int, time_spent: int, first_solve: bool) -> None:
+        self.attempts += 1
+        self.time_spent += time_spent
+        if correct:
+            if first_solve:
+                self.correct += 1
+                self.points += points
+            self.correct_streak += 1
+            self.best_correct_streak = max(self.best_correct_streak, self.correct_streak)
+        else:
+            self.correct_streak = 0
+
+    @property
+    def accuracy(self) -> int:
+        """Porcentaje de ejercicios resueltos sobre las respuestas enviadas (0-100)"""
+        return int(self.correct * 100 / self.attempts) if self.attempts else 0
+
+    def to_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data: Optional[dict]) -> "Counters":
+        data = data or {}
+        return cls(**{name: int(data.get(name) or 0) for name in cls.__slots__})
+
+class UserStats:
+    """
+    Agregados de un usuario: totales, desglose por materia y racha de días con actividad.
+    Cada respuesta los actualiza en O(1); es lo que se guarda en `user_stats`.
+    """
+
+    __slots__ = ("totals", "by_subject", "current_streak", "longest_streak", "last_activity_date", "last_access")
+
+    def __init__(self):
+        self.totals = Counters()
+        self.by_subject: Dict[str, Counters] = {}
+        self.current_streak = 0
+        self.longest_streak = 0
+        self.last_activity_date: Optional[date] = None
+        self.last_access = time.monotonic()
+
+    def partial_copy(self, subject_id=None) -> "UserStats":
+        """Copia de lo que puede cambiar una respuesta de la materia dada: totales, esa materia y racha"""
+        copy = UserStats()
+        copy.totals = self.totals.copy()
+        counters = self.by_subject.get(str(subject_id)) if subject_id else None
+        if counters is not None:
+            copy.by_subject[str(subject_id)] = counters.copy()
+        copy.current_streak = self.current_streak
+        copy.longest_streak = self.longest_streak
+        copy.last_activity_date = self.last_activity_date
+        return copy
+
+    def record(self, subject_id, correct: bool, points: int, time_spent: int, completed_at: datetime,
+               first_solve: bool) -> None:
+        """Suma una respuesta; `first_solve` indica que es la primera vez que se acierta ese ejercicio"""
+        points = points or 0
+        time_spent = time_spent or 0
+        self.totals.add(correct, points, time_spent, first_solve)
+        if subject_id:
+            key = str(subject_id)
+            counters = self.by_subject.get(key)
+            if counters is None:
+                counters = self.by_subject[key] = Counters()
+            counters.add(correct, points, time_spent, first_solve)
+
+        day = completed_at.astimezone(timezone.utc).date()
+        last = self.last_activity_date
+        if last is None or day > last:
+            self.current_streak = self.current_streak + 1 if last == day - timedelta(days=1) else 1
+            self.longest_streak = max(self.longest_streak, self.current_streak)
+            self.last_activity_date = day
+
+    def streak_on(self, today: date) -> int:
+        """Racha de días vigente: se pierde si ayer no hubo actividad"""
+        last = self.last_activity_date
+        if last is None or last < today - timedelta(days=1):
+            return 0
+        return self.current_streak
+
+    def to_row(self, user_id: str) -> dict:
+        totals = self.totals
+        return {
+            'user_id': user_id,
+            'total_exercises': totals.attempts,
+            'completed_exercises': totals.correct,
+            'total_points': totals.points,
+            'total_time': totals.time_spent,
+            'correct_streak': totals.correct_streak,
+            'best_correct_streak': totals.best_correct_streak,
+            'current_streak': self.current_streak,
+            'longest_streak': self.longest_streak,
+            'last_activity_date': self.last_activity_date.isoformat() if self.last_activity_date else None,
+            'by_subject': {subject_id: counters.to_dict() for subject_id, counters in self.by_subject.items()},
+            'updated_at': datetime.now(timezone.utc).isoformat(),
+        }
+
+    @classmethod
+    def from_row(cls, row: Optional[dict]) -> "UserStats":
+        stats = cls()
+        if not row:
+            return stats
+        stats.totals = Counters(
+            attempts=row.get('total_exercises') or 0,
+            correct=row.get('completed_exercises') or 0,
+            points=row.get('total_points') or 0,
+            time_spent=row.get('total_time') or 0,
+            correct_streak=row.get('correct_streak') or 0,
+            best_correct_streak=row.get('best_correct_streak') or 0,
+        )
+        stats.by_subject = {
+            str(subject_id): Counters.from_dict(data) for subject_id, data in (row.get('by_subject') or {}).items()
+        }
+        stats.current_streak = row.get('current_streak') or 0
+        stats.longest_streak = row.get('longest_streak') or 0
+        if row.get('last_activity_date'):
+            stats.last_activity_date = date.fromisoformat(str(row['last_activity_date'])[:10])
+        return stats
+
+    def summary(self, today: Optional[date] = None) -> dict:
+        """Totales tal y como los muestra el dashboard"""
+        row = self.to_row('')
+        del row['user_id'], row['by_subject'], row['updated_at']
+        row['current_streak'] = self.streak_on(today or datetime.now(timezone.utc).date())
+        return row
+
+class StatsUpdate(NamedTuple):
+    """Agregados de un usuario antes (copia parcial) y después de sumar una respuesta"""
+    before: UserStats
+    after: UserStats
+
+class UserStatsStore:
+    """
+    Agregados por usuario en memoria. Se cargan bajo demanda desde `user_stats` (una
+    lectura por usuario), se actualizan en cada respuesta y una tarea en segundo plano
+    guarda por lotes los usuarios modificados. La tabla se puede reconstruir desde el
+    historial con `rebuild_user_stats.py`.
+    Si el proceso termina sin llegar a guardar (caída, kill -9) se pierden los cambios de
+    la última pasada, hasta USER_STATS_FLUSH_INTERVAL_SECONDS; las respuestas sí están en
+    `user_progress` y la reconstrucción devuelve los contadores a su valor exacto.
+    El guardado sustituye la fila entera, así que solo puede haber un proceso escribiendo
+    `user_stats`: con varios, cada uno pisaría los totales de los demás. En una máquina
+    lo garantiza el bloqueo del log de progreso; entre máquinas no se puede comprobar.
+    """
+
+    def __init__(self):
+        self._users: Dict[str, UserStats] = {}
+        self._loading = SingleFlight()
+        self._dirty: Set[str] = set()
+        self._flush_lock = asyncio.Lock()
+
+    async def _load(self, user_id: str) -> UserStats:
+        supabase = get_async_supabase()
+        resp = await supabase.table(TABLE_NAME).select('*').eq('user_id', user_id).maybe_single().execute()
+        stats = UserStats.from_row(resp.data if resp else None)
+        self._users[user_id] = stats
+        return stats
+
+    async def get(self, user_id) -> UserStats:
+        key = str(user_id)
+        stats = self._users.get(key)
+        if stats is None:
+            stats = await self._loading.run(key, lambda: self._load(key))
+        stats.last_access = time.monotonic()
+        return stats
+
+    async def record(self, user_id, subject_id, correct: bool, points: int, time_spent: int,
+                     completed_at: datetime, first_solve: bool) -> Optional[StatsUpdate]:
+        """
+        Suma una respuesta a los agregados del usuario. Si no se pueden cargar se pierde
+        solo el contador (la respuesta ya está guardada y la reconstrucción lo recupera).
+        """
+        try:
+            stats = await self.get(user_id)
+        except Exception as e:
+            logger.error(f"Error cargando las estadísticas del usuario {user_id}: {e}")
+            return None
+        before = stats.partial_copy(subject_id)
+        stats.record(subject_id, correct, points, time_spent, completed_at, first_solve)
+        self._dirty.add(str(user_id))
+        return StatsUpdate(before, stats)
+
+    def evict_idle(self) -> int:
+        """Descarta los usuarios inactivos que no tienen cambios pendientes de guardar"""
+        cutoff = time.monotonic() - settings.user_stats_idle_seconds
+        idle = [
+            user_id for user_id, stats in self._users.items()
+            if stats.last_access < cutoff and user_id not in self._dirty
+        ]
+        for user_id in idle:
+            del self._users[user_id]
+        return len(idle)
+
+    async def flush(self) -> int:
+        """Guarda en `user_stats` los usuarios modificados, en lotes de `user_stats_flush_batch_size`"""
+        async with self._flush_lock:
+            if not self._dirty:
+                return 0
+            dirty, self._dirty = self._dirty, set()
+            rows = [self._users[user_id].to_row(user_id) for user_id in dirty]
+            supabase = get_async_supabase()
+
+            async def upsert(chunk: List[dict]) -> None:
+                await supabase.table(TABLE_NAME).upsert(chunk, on_conflict='user_id').execute()
+
+            outcome = await write_batches(rows, upsert, settings.user_stats_flush_batch_size, "estadísticas de usuario")
+            dead_letter(TABLE_NAME, outcome.rejected)
+            # Se guardan en la siguiente pasada (con los valores que tengan entonces)
+            self._dirty.update(row['user_id'] for row in outcome.remaining)
+            return len(outcome.written)
+
+    def stats(self) -> dict:
+        return {"users": len(self._users), "dirty": len(self._dirty)}
+
+user_stats = UserStatsStore()
+
+def rebuild_from_history(rows: Iterable[dict], subject_of) -> Iterator[Tuple[str, UserStats]]:
+    """
+    Recalcula los agregados recorriendo el historial una sola vez. `rows` deben venir
+    ordenadas por (`user_id`, `completed_at`) para poder entregar cada usuario en cuanto
+    termina, sin acumular todos en memoria. `subject_of(exercise_id)` da la materia.
+    """
+    current_user, stats = None, None
+    solved: Set[str] = set()
+    for row in rows:
+        user_id = str(row['user_id'])
+        if user_id != current_user:
+            if stats is not None:
+                yield current_user, stats
+            current_user, stats = user_id, UserStats()
+            solved = set()
+        exercise_id = str(row['exercise_id']) if row.get('exercise_id') else None
+        correct = bool(row.get('is_correct'))
+        first_solve = correct and exercise_id not in solved
+        if first_solve and exercise_id:
+            solved.add(exercise_id)
+        completed_at = row.get('completed_at')
+        if isinstance(completed_at, str):
+            completed_at = datetime.fromisoformat(completed_at.replace('Z', '+00:00'))
+        if completed_at is None:
+            completed_at = datetime.now(timezone.utc)
+        elif completed_at.tzinfo is None:
+            completed_at = completed_at.replace(tzinfo=timezone.utc)
+        stats.record(
+            subject_of(exercise_id) if exercise_id else None,
+            correct,
+            row.get('score') or 0,
+            row.get('time_spent') or 0,
+            completed_at,
+            first_solve,
+        )
+    if stats is not None:
+        yield current_user, stats
+
+async def _checkpoint() -> None:
+    await user_stats.flush()
+    user_stats.evict_idle()
+
+async def run_user_stats_checkpointer() -> None:
+    """Tarea en segundo plano: guarda periódicamente los agregados y libera usuarios inactivos"""
+    await run_periodically(
+        "estadísticas de usuario", lambda: settings.user_stats_flush_interval_seconds,
+        _checkpoint, on_stop=user_stats.flush,
+    )
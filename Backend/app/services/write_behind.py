@@ -0,0 +1,257 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import deque
+from typing import Deque, List, Optional, Tuple
+from app.core.batching import dead_letter, write_batches
+from app.core.config import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin bloqueo de ficheros
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+FSYNC_POLICIES = ('always', 'interval', 'never')
+MAX_BACKOFF_SECONDS = 60.0
+
+class LogInUse(RuntimeError):
+    """Otro proceso ya tiene abierto el log de progreso"""
+
+class BacklogFull(Exception):
+    """El buffer de escritura sigue lleno tras esperar el tiempo máximo de contrapresión"""
+
+class ProgressWriteBehind:
+    """
+    Buffer de escritura diferida para `user_progress`. Cada respuesta se añade primero a
+    un log local de solo-anexado (una línea JSON con número de secuencia) y una tarea en
+    segundo plano la inserta en la BD en lotes. Tras cada lote se anota en el log un
+    `ack` con la última secuencia escrita; al arrancar se reproducen las líneas sin ack.
+    Las filas llevan su propio `id`, así que reintentar un lote no duplica respuestas.
+    Las filas que la BD rechaza por sus datos se apartan al fichero de descartes y se
+    confirman igualmente para que no bloqueen la cola.
+    El log es de un solo proceso: la compactación lo sustituye entero y borraría las
+    filas de otro. Al arrancar se toma un bloqueo exclusivo (`<log>.lock`) y, si ya lo
+    tiene otro proceso (p. ej. varios workers de uvicorn en el mismo directorio), el
+    arranque falla en lugar de perder respuestas.
+    """
+
+    def __init__(self, path: Optional[str] = None, fsync: Optional[str] = None):
+        self.path = path or settings.progress_log_path
+        self.fsync = fsync or settings.progress_log_fsync
+        if self.fsync not in FSYNC_POLICIES:
+            raise ValueError(f"PROGRESS_LOG_FSYNC debe ser uno de {', '.join(FSYNC_POLICIES)}")
+        self._pending: Deque[Tuple[int, dict]] = deque()
+        self._seq = 0
+        self._file = None
+        self._lock_file = None
+        self._unsynced = False
+        self._last_fsync = time.monotonic()
+        self._wakeup = asyncio.Event()
+        # Señalado cuando un lote escrito deja sitio en el buffer (contrapresión)
+        self._has_room = asyncio.Event()
+        self._has_room.set()
+        self._flush_lock = asyncio.Lock()
+        # Serializa fsync y compactación para no sincronizar un fichero ya cerrado
+        self._sync_lock = asyncio.Lock()
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    # --- Log local ---
+
+    def _acquire(self) -> None:
+        if self._lock_file is not None:
+            return
+        if fcntl is None:
+            logger.warning("Sin fcntl no se puede comprobar que el log de progreso sea de un solo proceso")
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        lock_file = open(self.path + '.lock', 'a')
+        try:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            raise LogInUse(
+                f"El log de progreso {self.path} ya lo usa otro proceso: arranca un solo worker "
+                f"o da a cada instancia su propio PROGRESS_LOG_PATH"
+            )
+        self._lock_file = lock_file
+
+    def _open(self) -> None:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(self.path, 'a', encoding='utf-8')
+
+    def _write(self, entries: List[dict]) -> None:
+        self._file.write(''.join(json.dumps(entry, separators=(',', ':'), default=str) + '\n' for entry in entries))
+        self._file.flush()
+        self._unsynced = True
+
+    async def _sync(self, force: bool = False) -> None:
+        if not self._unsynced or self.fsync == 'never':
+            return
+        now = time.monotonic()
+        if force or self.fsync == 'always' or now - self._last_fsync >= settings.progress_log_fsync_interval_seconds:
+            async with self._sync_lock:
+                if not self._unsynced or self._file is None:
+                    return
+                self._unsynced = False
+                self._last_fsync = now
+                await asyncio.to_thread(os.fsync, self._file.fileno())
+
+    def _rewrite(self) -> None:
+        """Sustituye el log por uno que solo contiene las filas pendientes (compactación)"""
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as tmp:
+            for seq, row in self._pending:
+                tmp.write(json.dumps({'seq': seq, 'row': row}, separators=(',', ':'), default=str) + '\n')
+            tmp.flush()
+            os.fsync(tmp.fileno())
+        self._file.close()
+        os.replace(tmp_path, self.path)
+        self._file = open(self.path, 'a', encoding='utf-8')
+        self._unsynced = False
+
+    def replay(self) -> int:
+        """Abre el log y recupera las filas que no llegaron a la BD antes de parar"""
+        self._acquire()
+        rows = {}
+        acked = 0
+        if os.path.exists(self.path):
+            with open(self.path, encoding='utf-8') as log:
+                for line in log:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # Una última línea a medias tras una caída no invalida el resto
+                        logger.warning("Línea incompleta en el log de progreso; se ignora")
+                        continue
+                    if 'ack' in entry:
+                        acked = max(acked, entry['ack'])
+                    else:
+                        rows[entry['seq']] = entry['row']
+        self._pending = deque(sorted((seq, row) for seq, row in rows.items() if seq > acked))
+        self._seq = max([acked, *rows]) if rows else acked
+        if self._file is None:
+            self._open()
+        self._rewrite()
+        if self._pending:
+            self._wakeup.set()
+            logger.info(f"Log de progreso: {len(self._pending)} respuestas pendientes de guardar")
+        return len(self._pending)
+
+    # --- API ---
+
+    async def append_many(self, rows: List[dict]) -> None:
+        """
+        Registra filas para escritura diferida. Vuelve en cuanto están en el log local;
+        si el buffer está lleno espera (contrapresión) y lanza BacklogFull si no se libera.
+        """
+        if self._file is None:
+            self._open()
+        if len(self._pending) + len(rows) > settings.progress_backlog_max:
+            self._wakeup.set()
+            deadline = time.monotonic() + settings.progress_backpressure_timeout_seconds
+            while len(self._pending) + len(rows) > settings.progress_backlog_max:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise BacklogFull()
+                self._has_room.clear()
+                try:
+                    await asyncio.wait_for(self._has_room.wait(), timeout=remaining)
+                except asyncio.TimeoutError:
+                    raise BacklogFull()
+        entries = []
+        for row in rows:
+            self._seq += 1
+            entries.append({'seq': self._seq, 'row': row})
+        self._write(entries)
+        self._pending.extend((entry['seq'], entry['row']) for entry in entries)
+        await self._sync()
+        if len(self._pending) >= settings.progress_flush_batch_size:
+            self._wakeup.set()
+
+    def pending_for(self, user_id) -> List[dict]:
+        """Filas del usuario aún no escritas en la BD (para lecturas consistentes)"""
+        user_id = str(user_id)
+        return [row for _, row in self._pending if row.get('user_id') == user_id]
+
+    async def flush(self) -> int:
+        """Escribe en la BD todo lo pendiente, en lotes; devuelve las filas escritas o descartadas"""
+        from app.crud.progress import insert_progress_rows_async
+
+        async def insert(batch: List[Tuple[int, dict]]) -> None:
+            await insert_progress_rows_async([row for _, row in batch])
+
+        done = 0
+        async with self._flush_lock:
+            while self._pending:
+                size = settings.progress_flush_batch_size
+                batch = [self._pending[i] for i in range(min(len(self._pending), size))]
+                outcome = await write_batches(batch, insert, size, "respuestas de progreso")
+                dead_letter('user_progress', [(row, error) for (_, row), error in outcome.rejected])
+                handled = len(outcome.written) + len(outcome.rejected)
+                if handled:
+                    # Escritas y descartadas forman un prefijo del lote: basta con confirmar la última
+                    for _ in range(handled):
+                        self._pending.popleft()
+                    done += handled
+                    self._write([{'ack': batch[handled - 1][0]}])
+                    self._has_room.set()
+                if outcome.remaining:
+                    break
+            # Compactación: vacío si se ha escrito todo, reescrito si el log crece demasiado
+            if done and (not self._pending or os.path.getsize(self.path) > settings.progress_log_max_bytes):
+                async with self._sync_lock:
+                    self._rewrite()
+            else:
+                await self._sync(force=True)
+        return done
+
+    async def close(self) -> None:
+        if self._file is not None:
+            await self._sync(force=True)
+            self._file.close()
+            self._file = None
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+    async def run(self) -> None:
+        """Tarea en segundo plano: vacía el buffer periódicamente o en cuanto se llena un lote"""
+        failures = 0
+        try:
+            while True:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=settings.progress_flush_interval_seconds)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                try:
+                    if not self._pending:
+                        await self._sync()
+                        continue
+                    if await self.flush() or not self._pending:
+                        failures = 0
+                        continue
+                except Exception as e:
+                    logger.error(f"Error vaciando el buffer de progreso: {e}")
+                # La BD no acepta escrituras: se espera cada vez más antes de reintentar
+                failures += 1
+                await asyncio.sleep(min(settings.progress_flush_interval_seconds * 2 ** failures, MAX_BACKOFF_SECONDS))
+        except asyncio.CancelledError:
+            # Último intento antes de parar; lo que quede se reproducirá al arrancar
+            try:
+                await self.flush()
+            finally:
+                await self.close()
+            raise
+
+progress_writer = ProgressWriteBehind()
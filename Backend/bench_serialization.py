@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Benchmark de serialización de listados: compara la ruta por defecto
+(filas -> Exercise(**fila) en la capa CRUD -> response_model=List[Exercise])
+con la ruta rápida (FastJSONResponse directamente sobre las filas de la BD).
+No necesita Supabase: genera las filas en memoria con el formato de PostgREST.
+"""
+import os
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import List
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from app.schemas.exercise import Exercise
+from app.crud.exercise import to_exercise
+from app.core.responses import FastJSONResponse, orjson
+
+ROWS = int(os.getenv("BENCH_ROWS", "1000"))
+REPEAT = int(os.getenv("BENCH_REPEAT", "50"))
+
+def build_rows(n: int) -> List[dict]:
+    """Filas tal y como las devuelve PostgREST (UUIDs y fechas como texto)"""
+    now = datetime.now(timezone.utc).isoformat()
+    return [
+        {
+            "id": str(uuid.uuid4()),
+            "title": f"Ejercicio {i}",
+            "description": "Descripción de ejemplo del ejercicio",
+            "content": f"¿Cuál es el resultado de {i} + {i}? " * 4,
+            "type": "multiple_choice",
+            "difficulty": ("easy", "medium", "hard")[i % 3],
+            "subject_id": str(uuid.uuid4()),
+            "topic_id": str(uuid.uuid4()),
+            "options": {"a": str(i), "b": str(2 * i), "c": str(3 * i), "d": str(4 * i)},
+            "correct_answer": "b",
+            "explanation": "Se suman los dos números.",
+            "points": 10,
+            "time_limit": None,
+            "created_by": str(uuid.uuid4()),
+            "created_at": now,
+            "updated_at": now,
+        }
+        for i in range(n)
+    ]
+
+def measure(client: TestClient, path: str) -> float:
+    client.get(path)  # calentamiento
+    start = time.perf_counter()
+    for _ in range(REPEAT):
+        response = client.get(path)
+        assert response.status_code == 200
+    return (time.perf_counter() - start) / REPEAT * 1000
+
+if __name__ == "__main__":
+    rows = build_rows(ROWS)
+    app = FastAPI()
+
+    @app.get("/default", response_model=List[Exercise])
+    def default_route():
+        return [to_exercise(row) for row in rows]
+
+    @app.get("/fast", response_model=List[Exercise])
+    def fast_route():
+        return FastJSONResponse(rows)
+
+    client = TestClient(app)
+    default_body = client.get("/default").json()
+    fast_body = client.get("/fast").json()
+    assert [r["id"] for r in default_body] == [r["id"] for r in fast_body], "Las dos rutas deben devolver las mismas filas"
+
+    print(f"📊 Serialización de {ROWS} ejercicios ({REPEAT} repeticiones, orjson={'sí' if orjson else 'no'})")
+    default_ms = measure(client, "/default")
+    fast_ms = measure(client, "/fast")
+    print(f"   response_model por defecto: {default_ms:8.2f} ms/petición")
+    print(f"   FastJSONResponse:           {fast_ms:8.2f} ms/petición")
+    print(f"   Mejora: x{default_ms / fast_ms:.1f}")
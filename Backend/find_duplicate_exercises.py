@@ -0,0 +1,35 @@
+import argparse
+from app.core.supabase import get_supabase
+from app.services.dedup import DuplicateIndex
+
+PAGE_SIZE = 1000
+
+def load_exercises():
+    supabase = get_supabase()
+    rows, start = [], 0
+    while True:
+        resp = supabase.table('exercises').select('id,title,content,options').order('id').range(start, start + PAGE_SIZE - 1).execute()
+        page = resp.data or []
+        rows.extend(page)
+        if len(page) < PAGE_SIZE:
+            return rows
+        start += PAGE_SIZE
+
+def find_duplicates(threshold: float):
+    rows = load_exercises()
+    index = DuplicateIndex(threshold=threshold)
+    for row in rows:
+        index.add(str(row['id']), row.get('content'), row.get('options'))
+    titles = {str(row['id']): row.get('title') for row in rows}
+
+    clusters = index.clusters()
+    print(f"{len(rows)} ejercicios analizados, {len(clusters)} grupos de posibles duplicados (similitud >= {threshold})")
+    for number, cluster in enumerate(clusters, 1):
+        print(f"\nGrupo {number} ({len(cluster)} ejercicios):")
+        for exercise_id in cluster:
+            print(f"  {exercise_id}  {titles.get(exercise_id)}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Agrupa los ejercicios casi duplicados del catálogo (MinHash/LSH)")
+    parser.add_argument("--threshold", type=float, default=0.8, help="Similitud mínima para considerar duplicados")
+    find_duplicates(parser.parse_args().threshold)
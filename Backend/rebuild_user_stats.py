@@ -0,0 +1,53 @@
+import argparse
+from app.core.supabase import get_supabase
+from app.services.user_stats import TABLE_NAME, rebuild_from_history
+
+PAGE_SIZE = 1000
+WRITE_BATCH_SIZE = 500
+
+def load_subjects(supabase) -> dict:
+    subjects, start = {}, 0
+    while True:
+        resp = supabase.table('exercises').select('id,subject_id').order('id').range(start, start + PAGE_SIZE - 1).execute()
+        page = resp.data or []
+        subjects.update((str(row['id']), row.get('subject_id')) for row in page)
+        if len(page) < PAGE_SIZE:
+            return subjects
+        start += PAGE_SIZE
+
+def stream_progress(supabase, user_id=None):
+    """Historial de respuestas por páginas, ordenado por usuario y fecha"""
+    start = 0
+    while True:
+        query = supabase.table('user_progress').select('user_id,exercise_id,is_correct,score,time_spent,completed_at')
+        if user_id:
+            query = query.eq('user_id', user_id)
+        resp = query.order('user_id').order('completed_at').order('id').range(start, start + PAGE_SIZE - 1).execute()
+        page = resp.data or []
+        yield from page
+        if len(page) < PAGE_SIZE:
+            return
+        start += PAGE_SIZE
+
+def rebuild(user_id=None, dry_run: bool = False):
+    supabase = get_supabase()
+    subjects = load_subjects(supabase)
+    batch, users, answers = [], 0, 0
+    for uid, stats in rebuild_from_history(stream_progress(supabase, user_id), subjects.get):
+        users += 1
+        answers += stats.totals.attempts
+        batch.append(stats.to_row(uid))
+        if len(batch) >= WRITE_BATCH_SIZE and not dry_run:
+            supabase.table(TABLE_NAME).upsert(batch, on_conflict='user_id').execute()
+            batch = []
+    if batch and not dry_run:
+        supabase.table(TABLE_NAME).upsert(batch, on_conflict='user_id').execute()
+    action = "calculadas" if dry_run else "guardadas"
+    print(f"Estadísticas {action} para {users} usuarios ({answers} respuestas)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recalcula la tabla user_stats a partir de user_progress")
+    parser.add_argument("--user", help="Recalcular solo este usuario")
+    parser.add_argument("--dry-run", action="store_true", help="Calcular sin escribir en la BD")
+    args = parser.parse_args()
+    rebuild(args.user, args.dry_run)
@@ -0,0 +1,133 @@
+from uuid import uuid4
+import pytest
+from app.schemas.exercise import Exercise
+from app.services.grading import Grade, compile_matcher, normalize_answer, parse_number, parse_pairs
+
+def make_exercise(type: str, correct_answer, options=None) -> Exercise:
+    return Exercise(id=uuid4(), title="t", content="c", type=type, correct_answer=correct_answer, options=options)
+
+def is_correct(exercise: Exercise, answer) -> bool:
+    return compile_matcher(exercise)(answer).correct
+
+def test_normalize_answer_ignores_accents_case_spaces_and_edge_punctuation():
+    assert normalize_answer("  ¡Fotosíntesis!  ") == "fotosintesis"
+    assert normalize_answer("La   Mancha.") == "la mancha"
+    assert normalize_answer(None) == ""
+
+@pytest.mark.parametrize("text, expected", [
+    ("3,5", 3.5), ("7/2", 3.5), ("25%", 0.25), ("1e3", 1000.0), (" -2 ", -2.0), ("tres", None), (True, None),
+])
+def test_parse_number(text, expected):
+    assert parse_number(text) == expected
+
+class TestTrueFalse:
+    exercise = make_exercise("true_false", "Verdadero")
+
+    @pytest.mark.parametrize("answer", ["true", "V", "verdadero", " sí ", True])
+    def test_accepts_true_words(self, answer):
+        assert is_correct(self.exercise, answer)
+
+    @pytest.mark.parametrize("answer", ["falso", "F", "no", False, "quizá"])
+    def test_rejects_false_and_unknown_words(self, answer):
+        assert not is_correct(self.exercise, answer)
+
+    @pytest.mark.parametrize("answer", [None, "", "true", "falso"])
+    def test_missing_key_accepts_nothing(self, answer):
+        assert not is_correct(make_exercise("true_false", None), answer)
+
+    def test_false_answer_key(self):
+        exercise = make_exercise("true_false", "false")
+        assert is_correct(exercise, "Falso")
+        assert not is_correct(exercise, "V")
+
+class TestMultipleChoice:
+    def test_accepts_key_and_text_of_the_correct_option(self):
+        exercise = make_exercise("multiple_choice", "b", {"a": "París", "b": "Madrid"})
+        assert is_correct(exercise, "B")
+        assert is_correct(exercise, "madrid")
+        assert not is_correct(exercise, "a")
+        assert not is_correct(exercise, "Paris")
+
+    def test_correct_answer_given_as_option_text(self):
+        exercise = make_exercise("multiple_choice", "Madrid", {"a": "París", "b": "Madrid"})
+        assert is_correct(exercise, "b")
+        assert is_correct(exercise, "MADRID.")
+        assert not is_correct(exercise, "a")
+
+    def test_key_takes_precedence_over_colliding_text(self):
+        # "b" es la clave de la opción correcta y también el texto de la opción "a"
+        exercise = make_exercise("multiple_choice", "b", {"a": "b", "b": "c"})
+        assert is_correct(exercise, "b")
+        assert is_correct(exercise, "c")
+        assert not is_correct(exercise, "a")
+
+    def test_numeric_keys_and_texts_do_not_chain(self):
+        exercise = make_exercise("multiple_choice", "2", {"1": "2", "2": "3", "3": "4"})
+        assert is_correct(exercise, "2")
+        assert is_correct(exercise, "3")
+        assert not is_correct(exercise, "1")
+        assert not is_correct(exercise, "4")
+
+    def test_key_matching_no_option_accepts_nothing(self):
+        exercise = make_exercise("multiple_choice", "Lisboa", {"a": "París", "b": "Madrid"})
+        assert not is_correct(exercise, "lisboa")
+        assert not is_correct(exercise, "a")
+
+    @pytest.mark.parametrize("key", [None, "", "  "])
+    @pytest.mark.parametrize("answer", [None, "", "a"])
+    def test_missing_key_accepts_nothing(self, key, answer):
+        exercise = make_exercise("multiple_choice", key, {"a": "París", "b": "Madrid"})
+        assert not is_correct(exercise, answer)
+
+class TestMatching:
+    exercise = make_exercise("matching", '{"perro": "ladra", "gato": "maulla"}')
+
+    def test_parse_pairs_formats(self):
+        expected = frozenset({("perro", "ladra"), ("gato", "maulla")})
+        assert parse_pairs({"Perro": "Ladra", "gato": "maulla"}) == expected
+        assert parse_pairs([["perro", "ladra"], ["gato", "maulla"]]) == expected
+        assert parse_pairs("perro-ladra, gato: maulla") == expected
+
+    def test_all_pairs_is_correct(self):
+        assert compile_matcher(self.exercise)({"Perro": "Ladra", "gato": "maulla"}) == Grade(True, 1.0)
+
+    def test_partial_credit(self):
+        assert compile_matcher(self.exercise)("perro-ladra, gato-ladra") == Grade(False, 0.5)
+
+    def test_extra_pairs_prevent_full_marks(self):
+        grade = compile_matcher(self.exercise)([["perro", "ladra"], ["gato", "maulla"], ["vaca", "muge"]])
+        assert grade == Grade(False, 1.0)
+
+    def test_pairs_from_options_when_no_correct_answer(self):
+        exercise = make_exercise("matching", None, {"pairs": {"1": "uno"}})
+        assert is_correct(exercise, "1 -> uno")
+
+class TestOpenEnded:
+    def test_numeric_tolerance(self):
+        exercise = make_exercise("open_ended", "3,5")
+        assert is_correct(exercise, "3.5")
+        assert is_correct(exercise, "7/2")
+        assert is_correct(exercise, "3.50001")
+        assert not is_correct(exercise, "3.6")
+        assert not is_correct(exercise, "tres y medio")
+
+    def test_custom_tolerance_from_options(self):
+        exercise = make_exercise("open_ended", "100", {"tolerance": 1})
+        assert is_correct(exercise, "100.9")
+        assert not is_correct(exercise, "101.5")
+
+    @pytest.mark.parametrize("tolerance", ["abc", None, -1, "nan"])
+    def test_invalid_tolerance_falls_back_to_default(self, tolerance):
+        exercise = make_exercise("open_ended", "3,5", {"tolerance": tolerance, "relative_tolerance": "x"})
+        assert is_correct(exercise, "3.5")
+        assert not is_correct(exercise, "3.6")
+
+    @pytest.mark.parametrize("answer", [None, ""])
+    def test_missing_key_accepts_nothing(self, answer):
+        assert not is_correct(make_exercise("open_ended", None), answer)
+
+    def test_text_alternatives(self):
+        exercise = make_exercise("open_ended", "Fotosíntesis|fotosintesis clorofilica")
+        assert is_correct(exercise, "fotosintesis")
+        assert is_correct(exercise, "Fotosíntesis clorofílica")
+        assert not is_correct(exercise, "La fotosíntesis")
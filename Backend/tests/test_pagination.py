@@ -0,0 +1,29 @@
+import base64
+import json
+import pytest
+from app.core.pagination import decode_cursor, encode_cursor
+
+ROW_ID = "00000000-0000-0000-0000-000000000001"
+
+def raw_cursor(values) -> str:
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip("=")
+
+def test_round_trip():
+    cursor = encode_cursor("2025-01-01T00:00:00.5+00:00", ROW_ID)
+    assert decode_cursor(cursor) == ("2025-01-01T00:00:00.500000+00:00", ROW_ID)
+
+@pytest.mark.parametrize("values", [
+    ['2025-01-01",id.gt.0),or(id.neq."x', ROW_ID],
+    ["2025-01-01T00:00:00", '1",created_at.lt."3000'],
+    ["ayer", ROW_ID],
+    [None, ROW_ID],
+    ["2025-01-01T00:00:00", 5],
+    ["2025-01-01T00:00:00"],
+])
+def test_rejects_values_that_are_not_a_date_and_a_uuid(values):
+    with pytest.raises(ValueError):
+        decode_cursor(raw_cursor(values))
+
+def test_rejects_garbage():
+    with pytest.raises(ValueError):
+        decode_cursor("no es un cursor")